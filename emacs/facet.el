@@ -42,14 +42,13 @@
           (mapcar
            (lambda (line) (split-string line "\t"))
            (split-string
-            (s-chomp
-             (ansi-color-apply (shell-command-to-string "facet ls"))) "\n")))
+            (s-chomp (shell-command-to-string "facet ls --format=tsv")) "\n")))
          (left-column-width
           (apply #'max (mapcar (lambda (row) (length (car row))) rows)))
          (left-column-fmt (format "%%-%ds %%s" left-column-width)))
     (mapcar
      (lambda (row)
-       `(,(format left-column-fmt (car row) (or (cadr row) ""))
+       `(,(format left-column-fmt (car row) (or (nth 3 row) ""))
          .
          ,(car row)))
      rows)))
@@ -0,0 +1,4 @@
+import time
+
+# When facet was first imported; used by facet.trace
+start_time = time.perf_counter()
@@ -0,0 +1,8 @@
+"""
+Benchmarks for facet commands.
+
+`tree` builds synthetic facet directories, `scenarios` times facet commands
+run against them and `jira_stub`, a local JIRA stand-in, which the tests
+also use, and `python -m facet.benchmarks` runs the scenarios and compares
+the results with a stored baseline.
+"""
@@ -0,0 +1,98 @@
+"""
+Run facet benchmarks, as `python -m facet.benchmarks`.
+
+Usage:
+  benchmarks run [options] [SCENARIO...]
+  benchmarks generate [options] DIRECTORY N
+  benchmarks -h|--help
+
+Options:
+  --sizes=SIZES          Comma-separated numbers of facets
+                         [default: 10,1000,10000]
+  --repeat=N             Timed runs of each scenario [default: 5]
+  --latency=S            Seconds of latency added to each JIRA request
+                         [default: 0]
+  --fault-rate=F         Fraction of JIRA requests answered with 429
+                         [default: 0]
+  --io-latency=S         Seconds of latency added to each file system call
+                         on the facets directory [default: 0]
+  --read-jobs=N          Threads reading facets missing from the index
+  --output=FILE          Write results as JSON to FILE
+  --baseline=FILE        Compare results with those in FILE
+  --tolerance=F          Allowed slowdown relative to the baseline
+                         [default: 0.2]
+  --save-baseline        Write results to the baseline file
+  --jira-fraction=F      Fraction of facets with a JIRA issue [default: 0.5]
+  --follow-fraction=F    Fraction of facets that are followed [default: 0.8]
+  --jira-json-size=N     Approximate size of each jira.json [default: 2000]
+
+Scenarios: ls, "ls -a", "ls cold", current, workon, find, fetch, migrate
+(default: all). "ls cold" runs without the facet index, so compare for
+example --io-latency=0.001 with --read-jobs=1 and the default.
+
+With --baseline, the exit status is 1 if any scenario's median time exceeds
+that in the baseline by more than the tolerance.
+"""
+import json
+import sys
+
+from docopt import docopt
+
+from facet.benchmarks.scenarios import SCENARIOS
+from facet.benchmarks.scenarios import compare
+from facet.benchmarks.scenarios import run_benchmarks
+from facet.benchmarks.tree import make_tree
+
+
+def main():
+    options = docopt(__doc__)
+    tree_options = {
+        'jira_fraction': float(options['--jira-fraction']),
+        'follow_fraction': float(options['--follow-fraction']),
+        'jira_json_size': int(options['--jira-json-size']),
+    }
+    if options['generate']:
+        make_tree(options['DIRECTORY'], int(options['N']), **tree_options)
+        return
+
+    scenarios = options['SCENARIO'] or None
+    for name in scenarios or []:
+        if name not in SCENARIOS:
+            sys.exit(f'Unknown scenario: {name}')
+    results = run_benchmarks(
+        sizes=[int(size) for size in options['--sizes'].split(',')],
+        scenarios=scenarios,
+        repeat=int(options['--repeat']),
+        latency=float(options['--latency']),
+        fault_rate=float(options['--fault-rate']),
+        io_latency=float(options['--io-latency']),
+        read_jobs=(int(options['--read-jobs'])
+                   if options['--read-jobs'] else None),
+        tree_options=tree_options,
+    )
+    for key, result in results.items():
+        print(f'{key:20s} min {result["min"]:8.3f}s  '
+              f'median {result["median"]:8.3f}s')
+    if options['--output']:
+        with open(options['--output'], 'w') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+            fp.write('\n')
+
+    baseline_file = options['--baseline']
+    if baseline_file and options['--save-baseline']:
+        with open(baseline_file, 'w') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+            fp.write('\n')
+    elif baseline_file:
+        with open(baseline_file) as fp:
+            baseline = json.load(fp)
+        regressions = compare(results, baseline,
+                              float(options['--tolerance']))
+        for regression in regressions:
+            print(f'Regression: {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
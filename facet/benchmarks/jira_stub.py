@@ -0,0 +1,155 @@
+"""
+A local stand-in for the JIRA REST API, served from a background thread.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from datetime import timezone
+
+from aiohttp import web
+
+
+_JIRA_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f%z'
+
+
+def make_issue(key, summary=None, status='To Do', updated=None):
+    updated = datetime.fromtimestamp(updated or time.time(), timezone.utc)
+    return {
+        'key': key,
+        'fields': {
+            'summary': summary or f'Summary of {key}',
+            'status': {'name': status},
+            'updated': updated.strftime(_JIRA_TIME_FORMAT),
+        },
+    }
+
+
+class JiraStub:
+    """
+    Serve `issues` ({key: issue JSON}) through the JIRA issue and search
+    endpoints.
+
+    Paths of requests served are recorded in `requests`, and the JQL of
+    searches in `queries`. `max_results` caps the page size of search
+    results, as JIRA does.
+
+    Each request is delayed by `latency` seconds. Responses can be replaced
+    by errors: while `faults` is non-empty, each request pops a
+    (status, headers) pair from it and gets that response instead. After
+    that, each request gets the `fault` response with probability
+    `fault_rate`. The highest number of requests handled concurrently is
+    kept in `max_in_flight`.
+    """
+
+    def __init__(self, issues=(), max_results=None, latency=0, faults=(),
+                 fault_rate=0, fault=(429, {'Retry-After': '1'})):
+        self.issues = {issue['key']: issue for issue in issues}
+        self.max_results = max_results
+        self.latency = latency
+        self.faults = list(faults)
+        self.fault_rate = fault_rate
+        self.fault = fault
+        self.requests = []
+        self.queries = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.host = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+        self._thread = threading.Thread(target=self._serve, args=(started,),
+                                        daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def _serve(self, started):
+        asyncio.set_event_loop(self._loop)
+        app = web.Application(middlewares=[self._inject])
+        self._add_routes(app)
+        runner = web.AppRunner(app)
+        self._loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        self._loop.run_until_complete(site.start())
+        [socket] = site._server.sockets
+        self.host = '%s:%d' % socket.getsockname()
+        started.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(runner.cleanup())
+        self._loop.close()
+
+    def _add_routes(self, app):
+        app.router.add_get('/rest/api/latest/issue/{key}', self._get_issue)
+        app.router.add_get('/rest/api/latest/search', self._search)
+
+    @web.middleware
+    async def _inject(self, request, handler):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if self.faults:
+                self.requests.append(request.path)
+                status, headers = self.faults.pop(0)
+                return web.Response(status=status, headers=headers)
+            if self.fault_rate and random.random() < self.fault_rate:
+                self.requests.append(request.path)
+                status, headers = self.fault
+                return web.Response(status=status, headers=headers)
+            return await handler(request)
+        finally:
+            self.in_flight -= 1
+
+    async def _get_issue(self, request):
+        self.requests.append(request.path)
+        issue = self.issues.get(request.match_info['key'])
+        if issue is None:
+            raise web.HTTPNotFound()
+        etag = '"%s"' % hashlib.md5(json.dumps(issue).encode()).hexdigest()
+        if request.headers.get('If-None-Match') == etag:
+            raise web.HTTPNotModified()
+        return web.json_response(issue, headers={'ETag': etag})
+
+    async def _search(self, request):
+        self.requests.append(request.path)
+        self.queries.append(request.query['jql'])
+        match = re.fullmatch(r'key in \((.*?)\)'
+                             r'( AND updated >= "-(\d+)m")?',
+                             request.query['jql'])
+        keys = [key.strip().strip('"') for key in match.group(1).split(',')]
+        issues = [self.issues[key] for key in keys if key in self.issues]
+        if match.group(3):
+            since = time.time() - 60 * int(match.group(3))
+            issues = [
+                issue for issue in issues
+                if datetime.strptime(issue['fields']['updated'],
+                                     _JIRA_TIME_FORMAT).timestamp() >= since
+            ]
+
+        start_at = int(request.query.get('startAt', 0))
+        max_results = int(request.query.get('maxResults', 50))
+        if self.max_results:
+            max_results = min(max_results, self.max_results)
+        return web.json_response({
+            'startAt': start_at,
+            'maxResults': max_results,
+            'total': len(issues),
+            'issues': issues[start_at:start_at + max_results],
+        })
@@ -0,0 +1,29 @@
+"""
+Injected file system latency, standing in for a network file system.
+"""
+import builtins
+import functools
+import os
+import time
+
+
+def install(directory, latency):
+    """
+    Make each open, stat and directory listing of a path under `directory`
+    in this process first sleep for `latency` seconds, releasing the GIL as
+    a blocking network round trip does.
+    """
+    directory = os.path.join(os.path.abspath(directory), '')
+
+    def delayed(function):
+        @functools.wraps(function)
+        def wrapper(file, *args, **kwargs):
+            if isinstance(file, str) and os.path.join(
+                    os.path.abspath(file), '').startswith(directory):
+                time.sleep(latency)
+            return function(file, *args, **kwargs)
+        return wrapper
+
+    builtins.open = delayed(builtins.open)
+    for name in ['stat', 'lstat', 'scandir']:
+        setattr(os, name, delayed(getattr(os, name)))
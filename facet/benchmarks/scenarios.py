@@ -0,0 +1,147 @@
+"""
+Timed facet commands.
+
+Each scenario runs a facet command in a fresh interpreter against a
+synthetic tree built by `make_tree`, with JIRA served by a local JiraStub.
+Scenarios in COLD_SCENARIOS start each run without the facet index, as on
+first use, so that every facet's files are read.
+"""
+import functools
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from os import path
+
+from facet.benchmarks.jira_stub import JiraStub
+from facet.benchmarks.tree import make_tree
+
+
+# name: facet arguments
+SCENARIOS = {
+    'ls': ['ls'],
+    'ls -a': ['ls', '--all'],
+    'ls cold': ['ls', '--all'],
+    'current': ['current'],
+    'workon': ['workon', 'FACET-0'],
+    'find': ['find', '4242'],
+    'fetch': ['fetch', '--include-inactive'],
+    'migrate': ['migrate', '--all', '{"benchmark": true}'],
+}
+
+COLD_SCENARIOS = {'ls cold'}
+
+DEFAULT_SIZES = [10, 1000, 10000]
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, scenarios=None, repeat=5,
+                   latency=0, fault_rate=0, io_latency=0, read_jobs=None,
+                   tree_options=None):
+    """
+    Time `scenarios` (default: all) at each of `sizes`.
+
+    The JIRA stand-in delays each request by `latency` seconds, and answers
+    a fraction `fault_rate` of them with 429 Too Many Requests. Each file
+    system call on the facets directory is delayed by `io_latency` seconds
+    (see facet.benchmarks.latency). If given, `read_jobs` is the
+    INDEX_READ_JOBS setting.
+
+    Return {"<scenario>/<size>": {"min": seconds, "median": seconds}}.
+    """
+    results = {}
+    for size in sizes:
+        facet_dir = tempfile.mkdtemp(prefix=f'facet-benchmark-{size}-')
+        try:
+            issues = make_tree(facet_dir, size, **(tree_options or {}))
+            with JiraStub(issues, latency=latency, fault_rate=fault_rate,
+                          fault=(429, {'Retry-After': '0'})) as stub:
+                env = _make_environment(facet_dir, stub, read_jobs)
+                for name in scenarios or SCENARIOS:
+                    if name in COLD_SCENARIOS:
+                        before = functools.partial(_remove_index, facet_dir)
+                    else:
+                        before = None
+                    times = time_command(SCENARIOS[name], env, repeat,
+                                         before=before,
+                                         io_latency=io_latency)
+                    results[f'{name}/{size}'] = {
+                        'min': min(times),
+                        'median': statistics.median(times),
+                    }
+        finally:
+            shutil.rmtree(facet_dir)
+    return results
+
+
+def time_command(args, env, repeat, before=None, io_latency=0):
+    """
+    Return wall times of `repeat` runs of facet with `args`, after one
+    untimed run to warm the index and OS caches.
+
+    `before`, if given, is called before each run. File system calls on the
+    facets directory are delayed by `io_latency` seconds.
+    """
+    code = 'from facet.cli import main; main()'
+    if io_latency:
+        facets_dir = path.join(env['FACET_DIRECTORY'], 'facets')
+        code = (f'from facet.benchmarks.latency import install; '
+                f'install({facets_dir!r}, {io_latency!r}); {code}')
+    times = []
+    for i in range(repeat + 1):
+        if before:
+            before()
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, '-c', code] + args,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+        if i:
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Return a description of each result whose median is more than
+    `tolerance` (a fraction) slower than in `baseline`.
+    """
+    regressions = []
+    for key, result in sorted(results.items()):
+        if key not in baseline:
+            continue
+        allowed = baseline[key]['median'] * (1 + tolerance)
+        if result['median'] > allowed:
+            regressions.append(
+                f'{key}: {result["median"]:.3f}s, baseline '
+                f'{baseline[key]["median"]:.3f}s')
+    return regressions
+
+
+def _remove_index(facet_dir):
+    try:
+        os.remove(path.join(facet_dir, 'index.sqlite'))
+    except FileNotFoundError:
+        pass
+
+
+def _make_environment(facet_dir, stub, read_jobs=None):
+    with open(path.join(facet_dir, 'auth.yaml'), 'w') as fp:
+        fp.write('username: user\npassword: pass\n')
+    with open(path.join(facet_dir, 'settings.yaml'), 'w') as fp:
+        fp.write(f'JIRA_HOST: "{stub.host}"\n'
+                 f'JIRA_PROTOCOL: http\n'
+                 f'JIRA_BACKGROUND_REFRESH: false\n'
+                 # Lets `workon` exit instead of starting a shell.
+                 f'PROMPT_COMMANDS_FILE: "{facet_dir}/prompt-commands"\n')
+        if read_jobs is not None:
+            fp.write(f'INDEX_READ_JOBS: {read_jobs}\n')
+    with open(path.join(facet_dir, 'state.json'), 'w') as fp:
+        json.dump({'facet': 'FACET-0'}, fp)
+    return dict(os.environ, FACET_DIRECTORY=facet_dir, FACET_NO_DAEMON='1')
@@ -0,0 +1,62 @@
+"""
+Build synthetic facet directories.
+"""
+import json
+import os
+import random
+import time
+from os import path
+
+from facet.benchmarks.jira_stub import make_issue
+
+
+_STATUSES = ['todo', 'doing', 'under_review', 'done']
+_JIRA_STATUSES = ['To Do', 'In Progress', 'Review', 'Done']
+
+
+def make_tree(facet_dir, n, jira_fraction=0.5, follow_fraction=0.8,
+              jira_json_size=2000, jira_data=True, seed=0):
+    """
+    Create a FACET_DIRECTORY at `facet_dir` holding `n` facets, and return
+    the JIRA issues of its JIRA facets.
+
+    A fraction `jira_fraction` of the facets have a JIRA issue, and
+    `follow_fraction` are followed. If `jira_data` is true, each JIRA facet
+    gets a jira.json, padded with a description of about `jira_json_size`
+    characters.
+    """
+    facet_dir = path.abspath(facet_dir)
+    rng = random.Random(seed)
+    facets_dir = path.join(facet_dir, 'facets')
+    repo = path.join(facet_dir, 'repo')
+    os.makedirs(facets_dir)
+    os.makedirs(repo)
+    now = time.time()
+    issues = []
+    for i in range(n):
+        name = f'FACET-{i}'
+        directory = path.join(facets_dir, name)
+        os.mkdir(directory)
+        status = rng.randrange(len(_STATUSES))
+        config = {
+            'name': name,
+            'repo': repo,
+            'branch': name,
+            'status': _STATUSES[status],
+            'follow': rng.random() < follow_fraction,
+        }
+        if rng.random() < jira_fraction:
+            config['jira'] = name
+            issue = make_issue(name, status=_JIRA_STATUSES[status])
+            issue['fields']['description'] = 'x' * jira_json_size
+            issues.append(issue)
+            if jira_data:
+                with open(path.join(directory, 'jira.json'), 'w') as fp:
+                    json.dump(issue, fp)
+        with open(path.join(directory, 'facet.yaml'), 'w') as fp:
+            for key, value in config.items():
+                fp.write(f'{key}: {json.dumps(value)}\n')
+        # Spread directory mtimes, so that facets have a recency order.
+        mtime = now - (n - i)
+        os.utime(directory, (mtime, mtime))
+    return issues
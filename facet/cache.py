@@ -0,0 +1,166 @@
+"""
+Bounded caches with expiry, optionally persisted between processes.
+
+A Cache holds at most `maxsize` entries in memory, evicting the least
+recently used, and each entry expires `ttl` seconds after it was stored.
+Keys that are hashable are used as they are; others are converted to JSON.
+
+A Cache with a `name` also stores its entries in a JSON file under
+CACHE_DIR, so that they outlive the process. Its keys and values must be
+JSON serialisable, and values come back as JSON does, e.g. tuples as lists.
+The file is read on a miss in memory if it has changed since it was last
+read, and rewritten under its lock with each new entry. Cache files are
+created readable only by their owner.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from os import path
+
+from facet import settings
+
+
+CACHE_DIR = path.join(settings.FACET_DIR, 'cache')
+
+_MISSING = object()
+
+
+class Cache:
+
+    def __init__(self, maxsize=128, ttl=None, name=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        # key: (expiry time or None, value), least recently used first
+        self._entries = OrderedDict()
+        # Entries of the file, keyed by JSON, once read, and the file's
+        # (mtime, size) when they were
+        self._stored = None
+        self._stored_stat = None
+        # Held while reading or changing _entries, which threads share
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return (f'Cache({self.name or ""}: {len(self._entries)} entries, '
+                f'{self.hits} hits, {self.misses} misses)')
+
+    @property
+    def file(self):
+        return self.name and path.join(CACHE_DIR, f'{self.name}.json')
+
+    def get(self, key, default=None):
+        """
+        Return the value stored for `key`, or `default` if there is none or
+        it has expired.
+        """
+        key = _make_hashable(key)
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+        if entry is _MISSING and self.name:
+            entry = self._read_file().get(_to_json(key), _MISSING)
+            if entry is not _MISSING:
+                self._remember(key, tuple(entry))
+        with self._lock:
+            if entry is not _MISSING and _is_expired(entry):
+                self._entries.pop(key, None)
+                entry = _MISSING
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl=None):
+        """
+        Store `value` for `key`, to expire after `ttl` seconds, or after the
+        Cache's ttl if not given.
+        """
+        key = _make_hashable(key)
+        if ttl is None:
+            ttl = self.ttl
+        entry = (None if ttl is None else time.time() + ttl, value)
+        self._remember(key, entry)
+        if self.name:
+            self._write_file(_to_json(key), entry)
+
+    def clear(self):
+        """
+        Remove every entry, including those in the Cache's file.
+        """
+        with self._lock:
+            self._entries.clear()
+        self._stored = None
+        if self.name:
+            try:
+                os.remove(self.file)
+            except FileNotFoundError:
+                pass
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _read_file(self):
+        # Other processes may have written the file, e.g. while the daemon
+        # runs.
+        file_stat = _stat(self.file)
+        if self._stored is None or file_stat != self._stored_stat:
+            try:
+                with open(self.file) as fp:
+                    self._stored = json.load(fp)
+            except (FileNotFoundError, ValueError):
+                self._stored = {}
+            self._stored_stat = file_stat
+        return self._stored
+
+    def _write_file(self, json_key, entry):
+        from facet import storage
+
+        def update(stored):
+            stored.pop(json_key, None)
+            stored[json_key] = list(entry)
+            for key in [key for key, entry in stored.items()
+                        if _is_expired(entry)]:
+                del stored[key]
+            # Entries are kept in the order they were stored.
+            for key in list(stored)[:-self.maxsize]:
+                del stored[key]
+
+        os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+        self._stored = storage.update_json(self.file, update, mode=0o600)
+        # Another process may write the file before it can be stat'ed, so it
+        # is read again on the next miss.
+        self._stored_stat = None
+
+
+def _make_hashable(key):
+    try:
+        hash(key)
+    except TypeError:
+        return _to_json(key)
+    return key
+
+
+def _stat(file):
+    try:
+        file_stat = os.stat(file)
+    except FileNotFoundError:
+        return None
+    return (file_stat.st_mtime_ns, file_stat.st_size)
+
+
+def _to_json(key):
+    return json.dumps(key, sort_keys=True)
+
+
+def _is_expired(entry):
+    return entry[0] is not None and entry[0] <= time.time()
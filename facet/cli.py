@@ -1,4 +1,3 @@
-import asyncio
 import json
 import os
 import re
@@ -6,19 +5,25 @@ import shutil
 import subprocess
 import sys
 
-import aiohttp
-
+from facet import completion
+from facet import daemon
+from facet import index
+from facet import listing
+from facet import refresh
 from facet import settings
 from facet.cli_dispatch import Dispatcher
+from facet.command_table import COMMANDS
 from facet.core import Facet
 from facet.core import Status
-from facet.webbrowser import open_url
 from facet.utils import append_to_prompt_commands_file
 from facet.utils import delete_prompt_commands_file
 from facet.utils import prompt_for_user_input
 from facet.utils import error
+from facet.utils import format_json
+from facet.utils import format_tsv
 from facet.utils import os_exec
 from facet.utils import warning
+from facet.utils import write_lines
 
 
 class Command:
@@ -31,9 +36,12 @@ class Command:
 
     Options:
       -v, --version      Print version and exit
+      --profile=MODE     Profile the command: summary, cprofile:FILE or
+                         chrome:FILE (see also FACET_TRACE)
 
     Commands:
       cd                 cd to facet directory
+      complete           List facet names for shell completion
       config             Display facet config
       directory          Open editor on facet directory
       create             Create a facet for a JIRA issue
@@ -41,14 +49,19 @@ class Command:
       done               Mark facet as Done
       edit               Edit facet
       fetch              Fetch JIRA data for facet
+      find               Find facets by fuzzy match
       follow             Follow/unfollow a facet
+      git-status         Report the git status of facet branches
       github             Open Github branch diff / PR page in a browser
+      grep               Search facet notes and PR descriptions
       jira               Open JIRA issue page in a browser
       ls                 List facets
       migrate            Apply a patch to facet configs
       notes              Open notes file for facet
       pr                 Open draft PR description file for facet
+      prompt             Print current facet for a shell prompt
       rm                 Delete facet
+      shell-init         Print shell integration code
       show               Display facet
       workon             Switch to a facet, cd to repo and checkout branch
     """
@@ -59,18 +72,36 @@ class Command:
 
         Usage:
           cd [FACET]
+
+        FACET may be abbreviated to any unique fuzzy match (see find).
         """
-        facet = self._get_facet(options)
+        facet = self._get_facet(options, fuzzy=True)
         self._cd(facet.directory)
 
     @staticmethod
     def _cd(directory):
-        if append_to_prompt_commands_file('cd %s\n' % directory):
+        from facet.shell import write_directive
+
+        if write_directive('cd', directory):
+            sys.exit(0)
+        elif append_to_prompt_commands_file('cd %s\n' % directory):
             sys.exit(0)
         else:
             os.chdir(directory)
             os_exec(['/bin/bash'])
 
+    def complete(self, options):
+        """
+        List facet names starting with PREFIX, most recent first.
+
+        Usage:
+          complete [PREFIX]
+        """
+        prefix = options.get('PREFIX') or ''
+        for name in Facet.get_all_names():
+            if name.startswith(prefix):
+                print(name)
+
     def config(self, options):
         """
         Display facet config
@@ -121,6 +152,7 @@ class Command:
         if options.get('FACET'):
             facet = self._get_facet(options)
             facet.set_current()
+            completion.update_facet(facet, most_recent=True)
         facet = Facet.get_current()
         print(facet.format())
 
@@ -165,11 +197,13 @@ class Command:
         config['follow'] = True
 
         os.mkdir(facet.directory)
+        listing.invalidate()
         facet.write_config(config)
         try:
             facet.fetch()
         except IOError as ex:
             warning('%s: %s' % (type(ex).__name__, ex))
+        completion.update_facet(facet, most_recent=True)
 
     def doing(self, options):
         """
@@ -180,6 +214,7 @@ class Command:
         """
         facet = self._get_facet(options)
         facet.write_config(status=Status.doing.name)
+        completion.update_facet(facet)
 
     def done(self, options):
         """
@@ -190,6 +225,7 @@ class Command:
         """
         facet = self._get_facet(options)
         facet.write_config(status=Status.done.name)
+        completion.update_facet(facet)
 
     def edit(self, options):
         """
@@ -203,31 +239,90 @@ class Command:
 
     def fetch(self, options):
         """
-        Fetch JIRA issue data for facets.
+        Fetch JIRA issue data for facets, and the status of their pull
+        requests if GITHUB_TOKEN is set.
 
         Usage:
-          fetch [FACET]
+          fetch [options] [FACET]
 
         Options:
           --include-inactive     Include inactive facets
+          --batch-size=N         Issues per JIRA search request
+          --per-issue            Fetch each issue with a separate request
+          --changed-only         Only fetch issues updated since last fetched
+          --max-in-flight=N      Maximum number of concurrent requests
+          --request-timeout=S    Seconds to wait for each request
+          --total-timeout=S      Seconds to wait for the whole fetch
         """
         if options.get('FACET'):
             facets = [self._get_facet(options)]
         else:
             include_inactive = options.get('--include-inactive')
-            facets = Facet.get_all(include_inactive)
+            facets = list(Facet.get_all(include_inactive))
 
-        async def fetch_all_facets():
-            conn = aiohttp.TCPConnector(ssl=False)
-            async with aiohttp.ClientSession(connector=conn) as session:
-                coros = [facet._fetch_async(session) for facet in facets]
-                await asyncio.wait(coros)
+        def number(option, description, type=int):
+            value = options.get(option)
+            if value is None:
+                return None
+            try:
+                number = type(value)
+            except ValueError:
+                number = 0
+            if not number > 0:
+                error(f'Invalid {description}: {value}')
+            return number
+
+        from facet import fetch
+        results = fetch.fetch_facets(
+            facets,
+            batch_size=number('--batch-size', 'batch size'),
+            per_issue=options.get('--per-issue'),
+            changed_only=options.get('--changed-only'),
+            max_in_flight=number('--max-in-flight', 'number of requests'),
+            request_timeout=number('--request-timeout', 'request timeout',
+                                   float),
+            total_timeout=number('--total-timeout', 'total timeout', float),
+        )
+        fetch.report(results)
+        if settings.GITHUB_TOKEN:
+            from facet import github
+            results = github.fetch_pull_requests(facets)
+            if results:
+                fetch.report(results, prefix='pull requests: ')
+        completion.update()
+
+    def find(self, options):
+        """
+        Find facets by fuzzy match on name, JIRA key and summary.
 
-        event_loop = asyncio.new_event_loop()
-        try:
-            event_loop.run_until_complete(fetch_all_facets())
-        finally:
-            event_loop.close()
+        Usage:
+          find [options] QUERY
+
+        Options:
+          -n --limit=N       List at most N facets [default: 20]
+          --format=FORMAT    Output format: text, jsonl or tsv [default: text]
+
+        Facets are listed best match first. Words in QUERY may be abbreviated,
+        misspelt or given in any order.
+        """
+        from facet import search
+
+        limit = options.get('--limit') or '20'
+        if not limit.isdigit():
+            error(f'Invalid limit: {limit}')
+        output_format = options.get('--format') or 'text'
+        if output_format == 'text':
+            format_row = _format_text
+        elif output_format in {'jsonl', 'tsv'}:
+            def format_row(facet):
+                return _format_record(facet.to_dict(), output_format)
+        else:
+            error(f'Unknown format: {output_format}')
+        names = [match.name
+                 for match in search.find(options['QUERY'], int(limit))]
+        facets = [Facet(name=entry.name, entry=entry, offline=True)
+                  for entry in index.get_entries(names)]
+        write_lines(map(format_row, facets))
 
     def follow(self, options):
         """
@@ -253,6 +348,10 @@ class Command:
         else:
             for facet in facets:
                 facet.follow()
+        if options.get('FACET'):
+            completion.update_facet(facets[0])
+        else:
+            completion.update()
 
     def ls(self, options):
         """
@@ -264,30 +363,168 @@ class Command:
         Options:
           -a --all           Include done and non-followed facets
           -r --regex=regex   Filter to facets matching regex
+          -w --where=EXPR    Filter to facets matching EXPR, e.g.
+                             'status=doing and repo~website or assignee=me'
+          -s --sort=FIELDS   Sort by comma-separated FIELDS, each prefixed
+                             with - for descending order, e.g. -priority,name
+          -n --limit=N       List at most N facets
+          --format=FORMAT    Output format: text, jsonl or tsv [default: text]
+          --offline          Don't fetch or refresh JIRA data
+
+        Fields are name, repo, branch, follow, jira, status, summary,
+        jira_status, assignee, priority and fix_version. Without --sort,
+        facets are listed most recently modified first.
+
+        The jsonl and tsv formats write one uncoloured record per facet, with
+        fields name, status, jira_status, summary, repo, branch, follow and
+        is_current.
         """
+        from facet import query
+
         include_inactive = options.get('--all')
         regex = options.get('--regex')
+        names = listing.get_names()
         if regex:
-            regex = '^' + regex
-        for facet in Facet.get_all(include_inactive):
-            if regex and not re.match(regex, facet.name):
-                continue
-            print(facet.format())
+            names = [name for name in names if re.match('^' + regex, name)]
+        try:
+            where = options.get('--where')
+            where = where and query.parse_where(where)
+            sort = options.get('--sort')
+            sort = sort and query.parse_sort(sort)
+        except query.QueryError as ex:
+            error(str(ex))
+        limit = options.get('--limit')
+        if limit is not None:
+            if not limit.isdigit():
+                error(f'Invalid limit: {limit}')
+            limit = int(limit)
+        output_format = options.get('--format') or 'text'
+        if output_format == 'text':
+            format_row = _format_text
+        elif output_format in {'jsonl', 'tsv'}:
+            def format_row(facet):
+                return _format_record(facet.to_dict(), output_format)
+        else:
+            error(f'Unknown format: {output_format}')
+        facets = [Facet(name=entry.name, entry=entry)
+                  for entry in query.select(names, where, sort, limit,
+                                            include_inactive)]
+        _write_facets(facets, format_row, options.get('--offline'))
+        if not options.get('--offline'):
+            refresh.refresh_in_background([facet.entry for facet in facets])
 
     def migrate(self, options, facet=None):
         """
         Migrate facet.
 
         Usage:
-          migrate [options] [FACET] PATCH
+          migrate [options] FACET PATCH
+          migrate [options] PATCH
 
         Options:
-          -a, --all     Migrate all facets
+          -a, --all          Migrate all facets, including inactive ones
+          -n, --dry-run      Print a diff of each change instead of making it
+          -j, --jobs=N       Number of facets to migrate at once [default: 8]
+
+        PATCH is a JSON object, whose keys are added to each config where
+        missing (recursively, for nested objects), or a JSON Patch document
+        (a list of operations).
         """
-        if not facet:
-            facet = self._get_facet(options)
-        patch = json.loads(options['PATCH'])
-        facet.apply_patch(patch)
+        import difflib
+        from concurrent.futures import ThreadPoolExecutor
+
+        from facet.utils import format_yaml
+
+        try:
+            patch = json.loads(options['PATCH'])
+        except ValueError as ex:
+            error(f'Invalid PATCH: {ex}')
+        jobs = options.get('--jobs') or '8'
+        if not jobs.isdigit() or int(jobs) < 1:
+            error(f'Invalid number of jobs: {jobs}')
+        if facet:
+            facets = [facet]
+        elif options.get('--all'):
+            if options.get('FACET'):
+                error('FACET cannot be given with --all')
+            facets = list(Facet.get_all(include_inactive=True))
+        else:
+            facets = [self._get_facet(options)]
+        dry_run = options.get('--dry-run')
+
+        def migrate(facet):
+            try:
+                return facet.apply_patch(patch, dry_run=dry_run)
+            except Exception as ex:
+                return ex
+
+        counts = {'changed': 0, 'unchanged': 0, 'failed': 0}
+        with ThreadPoolExecutor(max_workers=int(jobs)) as executor:
+            for facet, result in zip(facets, executor.map(migrate, facets)):
+                if isinstance(result, Exception):
+                    counts['failed'] += 1
+                    warning(f'{facet.name}: failed: '
+                            f'{type(result).__name__}: {result}')
+                    continue
+                old_config, new_config = result
+                if new_config == old_config:
+                    counts['unchanged'] += 1
+                    continue
+                counts['changed'] += 1
+                if dry_run:
+                    sys.stdout.writelines(difflib.unified_diff(
+                        format_yaml(old_config).splitlines(True),
+                        format_yaml(new_config).splitlines(True),
+                        f'a/{facet.name}/facet.yaml',
+                        f'b/{facet.name}/facet.yaml',
+                    ))
+        if counts['changed'] and not dry_run:
+            completion.update()
+        print(', '.join(f'{count} {result}'
+                        for result, count in counts.items()),
+              file=sys.stderr)
+        if counts['failed']:
+            sys.exit(1)
+
+    def grep(self, options):
+        """
+        Search facet notes and PR descriptions.
+
+        Usage:
+          grep [options] QUERY
+
+        Options:
+          -C --context=N     Print N lines of context around matches
+                             [default: 2]
+
+        QUERY is a list of words, "quoted phrases" and prefix* words, matched
+        ignoring case. In each notes or PR.md file containing all of them,
+        the lines containing any of them are printed as FACET/FILE:LINE:TEXT.
+        """
+        from facet import fulltext
+
+        context = options.get('--context') or '2'
+        if not context.isdigit():
+            error(f'Invalid context: {context}')
+        try:
+            results = fulltext.search(options['QUERY'], int(context))
+        except fulltext.QueryError as ex:
+            error(str(ex))
+
+        def format_lines():
+            previous = None
+            for result in results:
+                for line in result.lines:
+                    if int(context) and previous not in {
+                            (result.facet, result.file_name, line.number - 1),
+                            None}:
+                        yield '--'
+                    separator = ':' if line.is_match else '-'
+                    yield (f'{result.facet}/{result.file_name}{separator}'
+                           f'{line.number}{separator}{line.text}')
+                    previous = (result.facet, result.file_name, line.number)
+
+        write_lines(format_lines())
 
     def jira(self, options):
         """
@@ -300,8 +537,49 @@ class Command:
         url = facet.jira_url
         if not url:
             error('facet %s has no JIRA URL' % facet.name)
+        from facet.webbrowser import open_url
         open_url(url)
 
+    def git_status(self, options):
+        """
+        Report the git status of facet branches.
+
+        Usage:
+          git-status [options]
+
+        Options:
+          -a --all           Include non-followed facets
+          -j --jobs=N        Number of git commands to run at once [default: 8]
+          --format=FORMAT    Output format: text, jsonl or tsv [default: text]
+
+        For each facet with a repo, reports whether its branch exists, how
+        many commits it is ahead (+) and behind (-) its upstream and the
+        repository's default branch, whether it is checked out with
+        uncommitted changes, and its last commit time. Facets are grouped by
+        repo.
+        """
+        from facet import gitstatus
+        from facet import query
+
+        jobs = options.get('--jobs') or '8'
+        if not jobs.isdigit() or not int(jobs):
+            error(f'Invalid number of jobs: {jobs}')
+        output_format = options.get('--format') or 'text'
+        if output_format not in {'text', 'jsonl', 'tsv'}:
+            error(f'Unknown format: {output_format}')
+        entries = query.select(listing.get_names(),
+                               include_inactive=options.get('--all'))
+        statuses = gitstatus.get_statuses(
+            [(entry.name, os.path.expanduser(entry.repo), entry.branch)
+             for entry in entries if entry.repo],
+            jobs=int(jobs),
+        )
+        if output_format == 'text':
+            write_lines(_format_git_statuses(statuses))
+        else:
+            write_lines(_format_record(status._asdict(), output_format)
+                        for status in statuses)
+
     def github(self, options):
         """
         Open Github branch diff / PR page in a browser.
@@ -313,8 +591,33 @@ class Command:
         url = facet.github_url
         if not url:
             error('facet %s has no Github URL' % facet.name)
+        from facet.webbrowser import open_url
         open_url(url)
 
+    def prompt(self, options):
+        """
+        Print the current facet and its status, for a shell prompt.
+
+        Usage:
+          prompt
+
+        The facet_prompt function printed by shell-init does the same without
+        starting Python.
+        """
+        from facet import prompt
+
+        fields = prompt.read()
+        if fields is None:
+            # The prompt file is missing, e.g. if the current facet was set
+            # by an older version of facet.
+            facet = Facet.get_current()
+            if facet.name and facet.exists():
+                prompt.update(facet)
+                fields = prompt.read()
+        segment = prompt.format_segment(fields)
+        if segment:
+            print(segment)
+
     def rm(self, options):
         """
         Delete facet.
@@ -327,17 +630,58 @@ class Command:
                                    True)
         if ok:
             shutil.rmtree(facet.directory)
+            listing.invalidate()
+            index.remove(facet.name)
+            completion.remove(facet.name)
+            if facet == Facet.get_current():
+                from facet import prompt
+                prompt.update(None)
+
+    def shell_init(self, options):
+        """
+        Print a shell function for SHELL (bash or zsh), which lets cd and
+        workon change directory in the calling shell.
+
+        Usage:
+          shell-init SHELL
+
+        Add to ~/.bashrc or ~/.zshrc:
+
+          eval "$(facet shell-init bash)"
+        """
+        from facet.shell import get_init_script
+
+        try:
+            print(get_init_script(options['SHELL']), end='')
+        except ValueError as ex:
+            error(str(ex))
 
     def show(self, options, facet=None):
         """
         Display facet.
 
         Usage:
-          show [FACET]
+          show [options] [FACET]
+
+        Options:
+          --format=FORMAT    Output format: text or json [default: text]
+          --offline          Don't fetch or refresh JIRA data
+
+        FACET may be abbreviated to any unique fuzzy match (see find).
         """
         if not facet:
-            facet = self._get_facet(options)
-        print(facet.format())
+            facet = self._get_facet(options, fuzzy=True)
+        output_format = options.get('--format') or 'text'
+        if output_format == 'text':
+            format_row = _format_text
+        elif output_format == 'json':
+            def format_row(facet):
+                return format_json(facet.to_dict())
+        else:
+            error(f'Unknown format: {output_format}')
+        _write_facets([facet], format_row, options.get('--offline'))
+        if not options.get('--offline'):
+            refresh.refresh_in_background([facet.entry])
 
     def todo(self, options):
         """
@@ -348,6 +692,7 @@ class Command:
         """
         facet = self._get_facet(options)
         facet.write_config(status=Status.todo.name)
+        completion.update_facet(facet)
 
     def workon(self, options):
         """
@@ -358,9 +703,12 @@ class Command:
 
         Options:
           -c, --checkout     Also checkout facet's branch
+
+        FACET may be abbreviated to any unique fuzzy match (see find).
         """
-        facet = self._get_facet(options)
+        facet = self._get_facet(options, fuzzy=True)
         facet.set_current()
+        completion.update_facet(facet, most_recent=True)
         os.chdir(facet.repo)
         if options.get('--checkout') and facet.branch:
             self._checkout(facet.branch)
@@ -380,10 +728,19 @@ class Command:
             except subprocess.CalledProcessError as ex:
                 warning(f'{type(ex).__name__}: {ex}')
 
-    def _get_facet(self, options):
+    def _get_facet(self, options, fuzzy=False):
         name = options.get('FACET')
         if name:
             facet = Facet(name=name)
+            if not facet.exists() and fuzzy:
+                from facet import search
+                names = search.resolve(name)
+                if len(names) > 1:
+                    error("Ambiguous facet: '%s' matches %s" %
+                          (name, ', '.join(names[:5]) +
+                           (', ...' if len(names) > 5 else '')))
+                if names:
+                    facet = Facet(name=names[0])
             if not facet.exists():
                 error("No such facet: '%s'" % facet.name)
         else:
@@ -391,6 +748,93 @@ class Command:
         return facet
 
 
+def _write_facets(facets, format_row, offline=False):
+    """
+    Write `format_row(facet)` for each of `facets`, in order.
+
+    Unless `offline`, missing JIRA data is first fetched for all facets
+    concurrently, and each row is written as soon as its data, and that of
+    the rows before it, is available.
+    """
+    missing = [] if offline else [
+        facet for facet in facets
+        if facet.entry.jira and facet.entry.jira_mtime is None
+    ]
+    if missing and daemon.serving:
+        raise daemon.HandBack()
+    for facet in facets:
+        facet.offline = True
+    pending = {facet.name for facet in missing}
+    position = 0
+
+    def get_ready_rows():
+        nonlocal position
+        while position < len(facets) and facets[position].name not in pending:
+            yield format_row(facets[position])
+            position += 1
+
+    def on_result(name, result, detail):
+        from facet.fetch import FAILED
+        from facet.fetch import TIMED_OUT
+
+        if result in {FAILED, TIMED_OUT}:
+            warning(f'Error fetching Facet({name}): {result}: {detail}')
+        pending.discard(name)
+        write_lines(get_ready_rows())
+
+    write_lines(get_ready_rows())
+    if missing:
+        from facet import fetch
+        fetch.fetch_facets(missing, on_result=on_result, verbose=False)
+        pending.clear()
+        write_lines(get_ready_rows())
+
+
+def _format_text(facet):
+    # Coloured strings are not str instances.
+    return str(facet.format())
+
+
+def _format_git_statuses(statuses):
+    import time
+
+    def format_counts(ahead, behind, ref):
+        return f'+{ahead}/-{behind} {ref}' if ahead is not None else ''
+
+    name_width = max((len(status.name) for status in statuses), default=0)
+    branch_width = max((len(status.branch or '') for status in statuses),
+                       default=0)
+    repo = None
+    for status in statuses:
+        if status.repo != repo:
+            repo = status.repo
+            yield repo
+        if status.exists is None:
+            description = 'not a git repository'
+        elif not status.branch:
+            description = 'no branch'
+        elif not status.exists:
+            description = 'no such branch'
+        else:
+            description = '  '.join(filter(None, [
+                format_counts(status.ahead, status.behind, status.upstream),
+                format_counts(status.ahead_default, status.behind_default,
+                              status.default_branch),
+                'dirty' if status.dirty else '',
+                time.strftime('%Y-%m-%d %H:%M',
+                              time.localtime(status.last_commit))
+                if status.last_commit else '',
+            ]))
+        yield (f'  {status.name:{name_width}}  '
+               f'{status.branch or "":{branch_width}}  {description}')
+
+
+def _format_record(record, output_format):
+    if output_format == 'jsonl':
+        return json.dumps(record)
+    return format_tsv(record.values())
+
+
 def jira_data_file(project):
     return os.path.join(settings.FACETS_DIR, project, 'jira.json')
 
@@ -401,13 +845,28 @@ def get_version_info():
 
 
 def main():
-    delete_prompt_commands_file()
+    status = daemon.request(sys.argv[1:])
+    if status is not None:
+        sys.exit(status)
+    run(sys.argv[1:])
+
+
+def run(argv):
     dispatcher = Dispatcher(
         Command(),
-        {'options_first': True, 'version': get_version_info()})
+        {'options_first': True, 'version': get_version_info()},
+        table=COMMANDS)
 
-    options, handler, command_options = dispatcher.parse(sys.argv[1:])
+    options, handler, command_options = dispatcher.parse(argv)
 
+    trace_mode = (command_options.get('--profile') or
+                  os.environ.get('FACET_TRACE'))
+    if trace_mode:
+        from facet import trace
+        trace.enable(trace_mode)
+
+    # Settings are read from here on, once tracing can time them.
+    delete_prompt_commands_file()
     try:
         handler(options)
     except KeyboardInterrupt:
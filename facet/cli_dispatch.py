@@ -3,17 +3,19 @@ Based on docker-compose.
 """
 from inspect import getdoc
 
-from docopt import docopt
-from docopt import DocoptExit
-
 
 class Dispatcher:
 
-    def __init__(self, command, options):
+    def __init__(self, command, options, table=None):
         self.command = command
         self.options = options
+        self.table = table or {}
 
     def parse(self, argv):
+        parsed = self._parse_from_table(argv)
+        if parsed is not None:
+            return parsed
+
         command_doc = getdoc(self.command)
         command_options = _docopt(command_doc, argv, **self.options)
         sub_command = command_options['COMMAND']
@@ -35,8 +37,180 @@ class Dispatcher:
         )
         return sub_command_options, sub_command_handler, command_options
 
+    def _parse_from_table(self, argv):
+        """
+        Parse `argv` using the precompiled command table.
+
+        This gives the same result as parsing with docopt, without reading the
+        docstrings. Anything the table can't handle (help, version, errors,
+        unknown commands) returns None, and is left to docopt.
+        """
+        if not argv or argv[0] not in self.table:
+            return None
+        sub_command, args = argv[0], argv[1:]
+        sub_command_options = _parse_args(self.table[sub_command], args)
+        if sub_command_options is None:
+            return None
+        command_options = {
+            '--help': False,
+            '--profile': None,
+            '--version': False,
+            '-h': False,
+            'ARGS': args,
+            'COMMAND': sub_command,
+        }
+        sub_command_handler = getattr(self.command,
+                                      sub_command.replace('-', '_'))
+        return sub_command_options, sub_command_handler, command_options
+
+
+def _parse_args(spec, args):
+    """
+    Parse sub-command `args` as docopt would with options_first=True.
+
+    Return None if `args` are invalid or use syntax that is not supported
+    here.
+    """
+    options = {}
+    flags = {}
+    for short, long, argcount, value in spec['options']:
+        key = long or short
+        options[key] = value
+        for flag in [short, long]:
+            if flag:
+                flags[flag] = key, argcount
+
+    seen = set()
+    positional = []
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if positional or arg == '-' or not arg.startswith('-'):
+            positional.append(arg)
+            continue
+        if arg in {'-h', '--help', '--'}:
+            return None
+        flag, eq, value = arg.partition('=')
+        if flag not in flags:
+            return None
+        if not flag.startswith('--') and len(arg) != 2:
+            return None
+        key, argcount = flags[flag]
+        if key in seen:
+            return None
+        seen.add(key)
+        if argcount:
+            if not eq:
+                if not args:
+                    return None
+                value = args.pop(0)
+            options[key] = value
+        elif eq:
+            return None
+        else:
+            options[key] = True
+
+    # Each usage line is an alternative; the first that matches is used, and
+    # arguments of the others are None.
+    usages = [spec['arguments']] + spec.get('alternatives', [])
+    for usage in usages:
+        arguments = _match_arguments(usage, positional)
+        if arguments is not None:
+            break
+    else:
+        return None
+    for usage in usages:
+        for name, _ in usage:
+            arguments.setdefault(name, None)
+
+    return dict(options, **arguments)
+
+
+def _match_arguments(usage, positional):
+    # docopt matches arguments left to right, and optional arguments consume
+    # a value whenever one is available.
+    positional = list(positional)
+    arguments = {}
+    for name, optional in usage:
+        if positional:
+            arguments[name] = positional.pop(0)
+        elif optional:
+            arguments[name] = None
+        else:
+            return None
+    if positional:
+        return None
+    return arguments
+
+
+def generate_command_table(command):
+    """
+    Return Python source for the table of `command`'s sub-commands.
+
+    The table records the options and arguments declared in each
+    sub-command's docopt usage, so that parsing a command line does not
+    require docopt to parse the docstrings on every invocation.
+    """
+    from docopt import parse_defaults
+    from docopt import printable_usage
+
+    lines = [
+        '# Generated by `make command-table` from the docstrings in',
+        '# facet/cli.py. Do not edit.',
+        'COMMANDS = {',
+    ]
+    for name in sorted(dir(command)):
+        if name.startswith('_'):
+            continue
+        doc = getdoc(getattr(command, name))
+        if not doc:
+            continue
+        options = []
+        usages = []
+        for usage in printable_usage(doc).splitlines()[1:]:
+            [sub_command, *tokens] = usage.split()
+            arguments = []
+            for token in tokens:
+                if token == '[options]':
+                    options = [
+                        (option.short, option.long, option.argcount,
+                         option.value)
+                        for option in parse_defaults(doc)
+                    ]
+                elif token.startswith('[') and token.endswith(']'):
+                    assert token[1:-1].isupper(), usage
+                    arguments.append((token[1:-1], True))
+                else:
+                    assert token.isupper(), usage
+                    arguments.append((token, False))
+            usages.append(arguments)
+        lines.append(f'    {sub_command!r}: {{')
+        lines.extend(_format_item('options', options))
+        lines.extend(_format_item('arguments', usages[0]))
+        if usages[1:]:
+            lines.extend(_format_item('alternatives', usages[1:]))
+        lines.append('    },')
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def _format_item(key, values):
+    """
+    Return the lines of the item `key`: `values` of a command table entry,
+    with a line per value if they don't fit on one line.
+    """
+    line = f'        {key!r}: {values!r},'
+    if len(line) <= 79:
+        return [line]
+    return ([f'        {key!r}: [']
+            + [f'            {value!r},' for value in values]
+            + ['        ],'])
+
 
 def _docopt(doc, *args, **kwargs):
+    from docopt import docopt
+    from docopt import DocoptExit
+
     try:
         return docopt(doc, *args, **kwargs)
     except DocoptExit:
@@ -0,0 +1,140 @@
+# Generated by `make command-table` from the docstrings in
+# facet/cli.py. Do not edit.
+COMMANDS = {
+    'cd': {
+        'options': [],
+        'arguments': [('FACET', True)],
+    },
+    'complete': {
+        'options': [],
+        'arguments': [('PREFIX', True)],
+    },
+    'config': {
+        'options': [],
+        'arguments': [('FACET', True)],
+    },
+    'create': {
+        'options': [('-j', '--jira', 0, False), ('-y', '--yes', 0, False)],
+        'arguments': [('NAME', False)],
+    },
+    'current': {
+        'options': [],
+        'arguments': [('FACET', True)],
+    },
+    'directory': {
+        'options': [],
+        'arguments': [('FACET', True)],
+    },
+    'doing': {
+        'options': [],
+        'arguments': [('FACET', True)],
+    },
+    'done': {
+        'options': [],
+        'arguments': [('FACET', True)],
+    },
+    'edit': {
+        'options': [],
+        'arguments': [('FACET', True)],
+    },
+    'fetch': {
+        'options': [
+            (None, '--include-inactive', 0, False),
+            (None, '--batch-size', 1, None),
+            (None, '--per-issue', 0, False),
+            (None, '--changed-only', 0, False),
+            (None, '--max-in-flight', 1, None),
+            (None, '--request-timeout', 1, None),
+            (None, '--total-timeout', 1, None),
+        ],
+        'arguments': [('FACET', True)],
+    },
+    'find': {
+        'options': [('-n', '--limit', 1, '20'), (None, '--format', 1, 'text')],
+        'arguments': [('QUERY', False)],
+    },
+    'follow': {
+        'options': [
+            ('-n', '--unfollow', 0, False),
+            ('-a', '--all', 0, False),
+            (None, '--include-inactive', 0, False),
+        ],
+        'arguments': [('FACET', True)],
+    },
+    'git-status': {
+        'options': [
+            ('-a', '--all', 0, False),
+            ('-j', '--jobs', 1, '8'),
+            (None, '--format', 1, 'text'),
+        ],
+        'arguments': [],
+    },
+    'github': {
+        'options': [],
+        'arguments': [('FACET', True)],
+    },
+    'grep': {
+        'options': [('-C', '--context', 1, '2')],
+        'arguments': [('QUERY', False)],
+    },
+    'jira': {
+        'options': [],
+        'arguments': [('FACET', True)],
+    },
+    'ls': {
+        'options': [
+            ('-a', '--all', 0, False),
+            ('-r', '--regex', 1, None),
+            ('-w', '--where', 1, None),
+            ('-s', '--sort', 1, None),
+            ('-n', '--limit', 1, None),
+            (None, '--format', 1, 'text'),
+            (None, '--offline', 0, False),
+        ],
+        'arguments': [],
+    },
+    'migrate': {
+        'options': [
+            ('-a', '--all', 0, False),
+            ('-n', '--dry-run', 0, False),
+            ('-j', '--jobs', 1, '8'),
+        ],
+        'arguments': [('FACET', False), ('PATCH', False)],
+        'alternatives': [[('PATCH', False)]],
+    },
+    'notes': {
+        'options': [],
+        'arguments': [('FACET', True)],
+    },
+    'pr': {
+        'options': [],
+        'arguments': [('FACET', True)],
+    },
+    'prompt': {
+        'options': [],
+        'arguments': [],
+    },
+    'rm': {
+        'options': [],
+        'arguments': [('FACET', True)],
+    },
+    'shell-init': {
+        'options': [],
+        'arguments': [('SHELL', False)],
+    },
+    'show': {
+        'options': [
+            (None, '--format', 1, 'text'),
+            (None, '--offline', 0, False),
+        ],
+        'arguments': [('FACET', True)],
+    },
+    'todo': {
+        'options': [],
+        'arguments': [('FACET', True)],
+    },
+    'workon': {
+        'options': [('-c', '--checkout', 0, False)],
+        'arguments': [('FACET', True)],
+    },
+}
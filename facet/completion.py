@@ -0,0 +1,98 @@
+"""
+A cache of facet names for shell completion.
+
+CACHE_FILE lists facets, most recently used first, one per line, with
+tab-separated fields name, follow, status and JIRA summary. Completion
+scripts read it instead of starting Python. Commands that add or remove
+facets, or change their order, follow flag, status or JIRA data, update it:
+those that change a single facet update only its line, and the file is only
+rewritten if its contents change.
+"""
+from os import path
+
+from facet import settings
+from facet import storage
+from facet.utils import format_tsv
+
+
+CACHE_FILE = path.join(settings.FACET_DIR, 'completion.tsv')
+
+
+def update():
+    """
+    Rewrite CACHE_FILE from the facet index.
+    """
+    from facet.core import Facet
+
+    lines = [_format_line(facet.entry)
+             for facet in Facet.get_all(include_inactive=True)]
+    with storage.lock(CACHE_FILE):
+        if lines != _read():
+            storage.write(CACHE_FILE, ''.join(lines))
+
+
+def update_facet(facet, most_recent=False):
+    """
+    Update the line of `facet` in CACHE_FILE, moving it to the top if it is
+    now the `most_recent` facet.
+    """
+    line = _format_line(facet.entry)
+    with storage.lock(CACHE_FILE):
+        lines = _read()
+        i = _find(lines, facet.name)
+        if lines is not None and (i is not None or most_recent):
+            if most_recent:
+                if i == 0 and lines[0] == line:
+                    return
+                if i is not None:
+                    del lines[i]
+                lines.insert(0, line)
+            elif lines[i] == line:
+                return
+            else:
+                lines[i] = line
+            storage.write(CACHE_FILE, ''.join(lines))
+            return
+    # Without the file, or the facet's line, its position is not known
+    # without listing all facets.
+    update()
+
+
+def remove(name):
+    """
+    Remove the line of facet `name` from CACHE_FILE.
+    """
+    with storage.lock(CACHE_FILE):
+        lines = _read()
+        i = _find(lines, name)
+        if i is not None:
+            del lines[i]
+            storage.write(CACHE_FILE, ''.join(lines))
+
+
+def _format_line(entry):
+    from facet.core import get_entry_status
+
+    status = get_entry_status(entry)
+    return format_tsv([
+        entry.name,
+        bool(entry.follow),
+        status.name if status else None,
+        entry.summary,
+    ]) + '\n'
+
+
+def _find(lines, name):
+    prefix = name + '\t'
+    for i, line in enumerate(lines or []):
+        if line.startswith(prefix):
+            return i
+    return None
+
+
+def _read():
+    try:
+        with open(CACHE_FILE) as fp:
+            return fp.readlines()
+    except FileNotFoundError:
+        return None
@@ -1,28 +1,37 @@
 # -*- coding: utf-8 -*-
-import asyncio
 import json
-import subprocess
+import os
 import sys
+from collections import Counter
 from enum import Enum
-from os import listdir
 from os import path
 
-import aiohttp
-import requests
-import yaml
-from clint.textui import colored
-
+from facet import index
+from facet import listing
+from facet import prompt
 from facet import settings
 from facet import state
+from facet import storage
+from facet.cache import Cache
 from facet.utils import default_color
-from facet.utils import dump_json
-from facet.utils import dump_yaml
-from facet.utils import get_auth
+from facet.utils import format_json
+from facet.utils import format_yaml
+from facet.utils import load_yaml
 from facet.utils import warning
 
 
 _CONFIG_FILE_NAME = 'facet.yaml'
 _JIRA_DATA_FILE_NAME = 'jira.json'
+_GITHUB_DATA_FILE_NAME = 'github.json'
+PR_FILE_NAME = 'PR.md'
+
+# Parsed contents of facet files -- configs, JIRA issues and pull requests --
+# keyed by path, mtime and size.
+_parsed_files = Cache(maxsize=1024)
+_NOT_PARSED = object()
+
+# Number of times each file has been parsed in this process.
+parse_counts = Counter()
 
 
 class Status(Enum):
@@ -33,8 +42,11 @@ class Status(Enum):
 
 
 class Facet:
-    def __init__(self, name):
+    def __init__(self, name, entry=None, offline=False):
         self.name = name
+        self._entry = entry
+        # If true, missing JIRA data is not fetched when displaying the facet.
+        self.offline = offline
 
     def __str__(self):
         return f'Facet({self.name})'
@@ -45,58 +57,70 @@ class Facet:
 
     def set_current(self):
         state.write(facet=self.name)
-        subprocess.check_call([
-            'touch',
-            path.join(settings.FACETS_DIR, self.name),
-        ])
+        listing.touch(self.name)
+        prompt.update(self)
 
     @classmethod
     def get_all(cls, include_inactive=False):
-        for name in cls.get_all_names():
-            facet = cls(name=name)
-            try:
-                if facet.is_active or include_inactive:
-                    yield facet
-            except Exception as exc:
-                warning(f'Error fetching {facet}: {type(exc).__name__}({exc})')
+        for entry in index.get_entries(cls.get_all_names()):
+            if entry.follow or include_inactive:
+                yield cls(name=entry.name, entry=entry)
 
     @staticmethod
     def get_all_names():
-        file_names = [
-            name.decode('utf-8')
-            for name in (subprocess
-                         .check_output(['ls', '-1', '-t', settings.FACETS_DIR])
-                         .splitlines())
-        ]
-        for name in file_names:
-            if not name.startswith('.'):
-                yield name
+        return listing.get_names()
 
     def exists(self):
-        return self.name in self.get_all_names()
+        return listing.exists(self.name)
 
     def read_config(self, key=None):
-        with open(self.config_file) as fp:
-            config = yaml.load(fp)
-        return config.get(key) if key is not None else config
+        config = _read_parsed(self.config_file, load_yaml)
+        return config.get(key) if key is not None else config.copy()
 
     def write_config(self, config=None, **kwargs):
-        if config is None:
-            config = self.read_config()
-            config.update(kwargs)
-        with open(self.config_file, 'w') as fp:
-            dump_yaml(config, fp)
-
-    def apply_patch(self, patch):
-        # TODO: deep dicts
-        config = patch.copy()
-        config.update(self.read_config())
-        self.write_config(config)
+        """
+        Write `config`, or update the current config with `kwargs`.
+        """
+        with storage.lock(self.config_file):
+            if config is None:
+                config = self.read_config()
+                config.update(kwargs)
+            storage.write(self.config_file, format_yaml(config),
+                          keep_directory_mtime=True)
+            _remember_parsed(self.config_file, config.copy())
+        self._entry = index.update(self.name, config=config)
+        self._update_prompt()
+
+    def apply_patch(self, patch, dry_run=False):
+        """
+        Apply `patch` (see facet.patch) to this facet's config, writing it
+        only if it changes and not `dry_run`.
+
+        Return the config before and after patching.
+        """
+        from facet import patch as patches
+
+        old_config = self.read_config()
+        new_config = patches.apply(old_config, patch)
+        if new_config != old_config and not dry_run:
+            self.write_config(new_config)
+        return old_config, new_config
 
     def fetch(self):
+        import asyncio
+        import aiohttp
+
+        from facet import daemon
+        from facet import trace
+
+        if daemon.serving:
+            raise daemon.HandBack()
+
         async def _fetch():
             conn = aiohttp.TCPConnector(ssl=False)
-            async with aiohttp.ClientSession(connector=conn) as session:
+            async with aiohttp.ClientSession(
+                    connector=conn,
+                    trace_configs=trace.aiohttp_trace_configs()) as session:
                 await self._fetch_async(session)
 
         event_loop = asyncio.new_event_loop()
@@ -116,27 +140,108 @@ class Facet:
                   file=sys.stderr)
             raise
 
-        _json = await resp.json()
+        self.write_jira_data(await resp.json())
+
+    def write_jira_data(self, _json, verbose=True):
+        """
+        Store JIRA data for this facet, leaving jira.json untouched if its
+        content would not change. Return True if the file was written.
+
+        If `verbose`, the facet is printed.
+        """
         assert _json
-        with open(self.jira_data_file, 'w') as fp:
-            dump_json(_json, fp)
-        print(self.format())
+        text = format_json(_json)
+        with storage.lock(self.jira_data_file):
+            try:
+                with open(self.jira_data_file) as fp:
+                    changed = fp.read() != text
+            except FileNotFoundError:
+                changed = True
+            if changed:
+                storage.write(self.jira_data_file, text,
+                              keep_directory_mtime=True)
+                _remember_parsed(self.jira_data_file, _json)
+        if changed:
+            self._entry = index.update(self.name, jira_json=_json)
+            self._update_prompt()
+        if verbose:
+            print(self.format())
+        return changed
+
+    def write_github_data(self, pr, verbose=True):
+        """
+        Store `pr`, the state of this facet's pull request, leaving
+        github.json untouched if its content would not change. Return True if
+        the file was written.
+
+        If `verbose`, the facet is printed.
+        """
+        text = format_json(pr)
+        with storage.lock(self.github_data_file):
+            try:
+                with open(self.github_data_file) as fp:
+                    changed = fp.read() != text
+            except FileNotFoundError:
+                changed = True
+            if changed:
+                storage.write(self.github_data_file, text,
+                              keep_directory_mtime=True)
+                _remember_parsed(self.github_data_file, pr)
+        if changed:
+            self._entry = index.update(self.name, github_json=pr)
+            self._update_prompt()
+        if verbose:
+            print(self.format())
+        return changed
+
+    def _update_prompt(self):
+        if state.read('facet') == self.name:
+            prompt.update(self)
 
     def format(self):
-        if self.jira:
+        if self.entry.jira:
             try:
-                jira_issue = self.get_jira_issue()
+                entry = self._get_jira_entry()
             except IOError as ex:
                 summary = '<failed to fetch summary>'
             else:
-                summary=self.style(jira_issue.summary, color=False)
+                if entry.jira_mtime is None:
+                    summary = '<no JIRA data>'
+                else:
+                    summary = self.style(entry.summary, color=False)
             name = self.style(f'{self.name:8s}')
             return f'{name} {summary}'
         else:
             return self.style(self.name)
 
+    def to_dict(self):
+        """
+        Return this facet's fields for machine-readable output.
+        """
+        entry = self.entry
+        if entry.jira:
+            try:
+                entry = self._get_jira_entry()
+            except IOError as ex:
+                warning(f'{ex.__class__.__name__}: {ex}')
+        status = get_entry_status(entry)
+        return {
+            'name': self.name,
+            'status': status.name if status else None,
+            'jira_status': entry.jira_status,
+            'summary': entry.summary,
+            'repo': entry.repo,
+            'branch': entry.branch,
+            'follow': bool(entry.follow),
+            'is_current': self == self.get_current(),
+        }
+
     @property
     def github_url(self):
+        if self.entry.github_mtime is not None:
+            url = self.read_pull_request().get('url')
+            if url:
+                return url
         if not settings.GITHUB_REPO_URL:
             return None
         return f'{settings.GITHUB_REPO_URL}/pull/{self.branch}'
@@ -147,12 +252,8 @@ class Facet:
 
     @property
     def jira_json_url(self):
-        return ("https://{username}:{password}@{host}"
-                "/rest/api/latest/issue/{issue}".format(
-                    host=settings.JIRA_HOST,
-                    issue=self.jira,
-                    **get_auth()
-                ))
+        from facet.jira import api_url
+        return api_url(f'issue/{self.jira}')
 
     @property
     def url(self):
@@ -165,7 +266,7 @@ class Facet:
 
     @property
     def notes_file(self):
-        for file_name in [settings.NOTES_FILE_NAME, 'notes.md', 'notes.org', 'notes.py']:
+        for file_name in get_notes_file_names():
             file_path = path.join(self.directory, file_name)
             if path.exists(file_path):
                 return file_path
@@ -173,7 +274,7 @@ class Facet:
 
     @property
     def pr_file(self):
-        return path.join(self.directory, 'PR.md')
+        return path.join(self.directory, PR_FILE_NAME)
 
     @property
     def config_file(self):
@@ -183,6 +284,19 @@ class Facet:
     def jira_data_file(self):
         return path.join(self.directory, _JIRA_DATA_FILE_NAME)
 
+    @property
+    def github_data_file(self):
+        return path.join(self.directory, _GITHUB_DATA_FILE_NAME)
+
+    @property
+    def entry(self):
+        """
+        This facet's record in the facet index.
+        """
+        if self._entry is None:
+            self._entry = index.get_entry(self.name)
+        return self._entry
+
     @property
     def is_active(self):
         return self.read_config('follow')
@@ -205,11 +319,33 @@ class Facet:
     def get_jira_issue(self):
         if not path.exists(self.jira_data_file):
             self.fetch()
-        with open(self.jira_data_file) as fp:
+        return self.read_jira_issue()
+
+    def read_jira_issue(self):
+        def load_json(fp):
             _json = fp.read()
             assert _json, f'{self.jira_data_file} is empty'
-            from facet.jira import JiraIssue
-            return JiraIssue(json.loads(_json))
+            return json.loads(_json)
+
+        from facet.jira import JiraIssue
+        return JiraIssue(_read_parsed(self.jira_data_file, load_json))
+
+    def read_pull_request(self):
+        """
+        Return the contents of github.json: the state of this facet's pull
+        request as last fetched, or {} if it has none.
+        """
+        return _read_parsed(self.github_data_file, json.load)
+
+    def _get_jira_entry(self):
+        """
+        Return this facet's index entry, fetching JIRA data if there is none
+        and the facet is not offline.
+        """
+        if self.entry.jira_mtime is None and not self.offline:
+            self.get_jira_issue()
+            self._entry = index.get_entry(self.name)
+        return self.entry
 
     @property
     def branch(self):
@@ -221,26 +357,31 @@ class Facet:
 
     @property
     def is_done(self):
-        if self.jira:
-            return self.get_jira_issue().is_done
-        else:
-            return self.read_config('status') == Status.done.name
+        entry = self._get_jira_entry() if self.entry.jira else self.entry
+        return get_entry_status(entry) == Status.done
 
     def style(self, string, color=True):
         is_current = self == self.get_current()
         if not color:
             style_function = default_color
-        if not self.jira:
-            status = self.status
-            style_function = get_style_function(self.status) if self.status else default_color
+        entry = self.entry
+        if not entry.jira:
+            status = get_entry_status(entry)
+            style_function = (get_style_function(status) if status
+                              else default_color)
         else:
             try:
-                jira_issue = self.get_jira_issue()
+                entry = self._get_jira_entry()
             except IOError as ex:
                 warning(f'{ex.__class__.__name__}: {ex}')
                 style_function = default_color
             else:
-                style_function = get_style_function(jira_issue.status)
+                if entry.jira_mtime is None:
+                    style_function = default_color
+                else:
+                    from facet.jira import JIRA_STATUS2STATUS
+                    status = JIRA_STATUS2STATUS[entry.jira_status]
+                    style_function = get_style_function(status)
 
         return style_function(string, bold=is_current, always=True)
 
@@ -248,7 +389,69 @@ class Facet:
         return self.name == other.name
 
 
+def get_notes_file_names():
+    """
+    Return the names a facet's notes file may have, most preferred first.
+    """
+    return list(dict.fromkeys(
+        [settings.NOTES_FILE_NAME, 'notes.md', 'notes.org', 'notes.py']))
+
+
+def get_entry_status(entry):
+    """
+    Return the Status of the facet with index entry `entry`: that of its
+    JIRA issue if it has JIRA data, otherwise that of its pull request if
+    that is open or merged, otherwise that in its config.
+    """
+    if entry.jira_status:
+        from facet.jira import JIRA_STATUS2STATUS
+        return JIRA_STATUS2STATUS.get(entry.jira_status)
+    if entry.pr_status:
+        return getattr(Status, entry.pr_status)
+    return getattr(Status, entry.status) if entry.status else None
+
+
+def get_pull_request_status(pr):
+    """
+    Return the Status implied by `pr`, the contents of a github.json file:
+    done if merged, doing if a draft, under_review if open, otherwise None.
+    """
+    if not pr:
+        return None
+    if pr['merged']:
+        return Status.done
+    if pr['state'] == 'OPEN':
+        return Status.doing if pr['is_draft'] else Status.under_review
+    return None
+
+
+def _read_parsed(file, load):
+    """
+    Return `load` applied to `file`, reusing an earlier result if the file's
+    mtime and size are unchanged.
+    """
+    key = _get_parsed_key(file)
+    data = _parsed_files.get(key, _NOT_PARSED)
+    if data is _NOT_PARSED:
+        with open(file) as fp:
+            data = load(fp)
+        parse_counts[file] += 1
+        _parsed_files.set(key, data)
+    return data
+
+
+def _remember_parsed(file, data):
+    _parsed_files.set(_get_parsed_key(file), data)
+
+
+def _get_parsed_key(file):
+    stat = os.stat(file)
+    return (file, stat.st_mtime_ns, stat.st_size)
+
+
 def get_style_function(status):
+    from clint.textui import colored
+
     return {
         Status.todo: colored.cyan,
         Status.doing: colored.red,
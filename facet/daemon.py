@@ -0,0 +1,305 @@
+"""
+facetd: a resident process that answers read-only facet commands.
+
+facetd keeps the facets directory listing, index entries and parsed facet
+files in memory, and serves `ls`, `current`, `show`, `find` and `complete`
+over a Unix domain socket at SOCKET_FILE. On Linux it watches FACETS_DIR and
+each facet's directory with inotify, and discards what it holds for a facet
+when its files change. Elsewhere it falls back to the mtime checks that every
+facet command makes. state.json is re-read whenever its mtime changes.
+Changes to settings.yaml require a restart.
+
+When the socket exists, `facet` sends those commands to the daemon, and runs
+them in-process if the daemon cannot be reached. Set FACET_NO_DAEMON to
+bypass the daemon; it is also bypassed when FACET_TRACE is set.
+
+The daemon never uses the network or prompts for input, since it answers
+one request at a time: a command that would fetch JIRA data or read
+credentials raises HandBack, and the client runs it in-process instead.
+Facets with expired JIRA data are refreshed by a process that the client
+starts, once the daemon has answered.
+"""
+import json
+import os
+import socket
+import struct
+import sys
+from os import path
+
+from facet import settings
+
+
+SOCKET_FILE = path.join(settings.FACET_DIR, 'facetd.sock')
+
+# Commands that may be answered by the daemon
+COMMANDS = {'complete', 'current', 'find', 'ls', 'show'}
+
+_CLIENT_TIMEOUT = 5
+
+# Whether this process is the daemon
+serving = False
+
+# Facets found to have expired JIRA data while answering a request
+expired = []
+
+
+class HandBack(BaseException):
+    """
+    Raised by a command run in the daemon that needs the network, or input,
+    so that the client runs it instead.
+    """
+    # Not an Exception, so that handlers of errors in fetching don't catch
+    # it.
+
+
+def request(argv):
+    """
+    Run the command `argv` in the daemon, and write its output.
+
+    Return the command's exit status, or None if the daemon did not run it.
+    """
+    if not argv or argv[0] not in COMMANDS:
+        return None
+    if os.environ.get('FACET_NO_DAEMON') or os.environ.get('FACET_TRACE'):
+        return None
+    if argv[0] == 'current' and len(argv) > 1:
+        # Setting the current facet is left to the facet process.
+        return None
+    if not path.exists(SOCKET_FILE):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(_CLIENT_TIMEOUT)
+            sock.connect(SOCKET_FILE)
+            sock.sendall(json.dumps({'argv': argv}).encode('utf-8') + b'\n')
+            sock.shutdown(socket.SHUT_WR)
+            response = json.loads(_read_all(sock))
+    except (OSError, ValueError):
+        return None
+    if response['status'] is None:
+        return None
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    if response.get('expired'):
+        from facet import refresh
+        refresh.start(response['expired'])
+    return response['status']
+
+
+def _read_all(sock):
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return b''.join(chunks).decode('utf-8')
+        chunks.append(chunk)
+
+
+class Daemon:
+
+    def __init__(self):
+        self.inotify = None
+        self.sock = None
+
+    def serve_forever(self):
+        import selectors
+
+        from facet import index
+
+        global serving
+        serving = True
+        self._bind()
+        try:
+            self.inotify = _Inotify()
+        except OSError as ex:
+            print(f'facetd: inotify unavailable ({ex}); '
+                  f'checking mtimes on every request', file=sys.stderr)
+        else:
+            self._watch_all()
+            index.watch()
+
+        selector = selectors.DefaultSelector()
+        selector.register(self.sock, selectors.EVENT_READ)
+        if self.inotify:
+            selector.register(self.inotify.fd, selectors.EVENT_READ)
+        try:
+            while True:
+                for key, _ in selector.select():
+                    if key.fileobj is self.sock:
+                        conn, _ = self.sock.accept()
+                        with conn:
+                            self._handle(conn)
+                    else:
+                        self._process_events()
+        finally:
+            self.sock.close()
+            os.unlink(SOCKET_FILE)
+
+    def _bind(self):
+        if path.exists(SOCKET_FILE):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                try:
+                    sock.connect(SOCKET_FILE)
+                except OSError:
+                    os.unlink(SOCKET_FILE)
+                else:
+                    raise SystemExit(
+                        f'facetd is already running: {SOCKET_FILE}')
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(SOCKET_FILE)
+        os.chmod(SOCKET_FILE, 0o600)
+        self.sock.listen()
+
+    def _handle(self, conn):
+        import contextlib
+        import io
+
+        from facet import cli
+
+        # Apply any changes made since the last event was processed, so that
+        # a write made just before this request is reflected in its output.
+        if self.inotify:
+            self._process_events()
+
+        conn.settimeout(_CLIENT_TIMEOUT)
+        try:
+            argv = json.loads(_read_all(conn))['argv']
+        except (OSError, ValueError, KeyError):
+            return
+        stdout, stderr = io.StringIO(), io.StringIO()
+        status = 0
+        del expired[:]
+        with contextlib.redirect_stdout(stdout), \
+                contextlib.redirect_stderr(stderr):
+            try:
+                cli.run(argv)
+            except HandBack:
+                status = None
+            except SystemExit as ex:
+                if isinstance(ex.code, str):
+                    print(ex.code, file=sys.stderr)
+                    status = 1
+                else:
+                    status = ex.code or 0
+            except Exception as ex:
+                print(f'facetd: {type(ex).__name__}: {ex}', file=sys.stderr)
+                status = 1
+        response = {
+            'status': status,
+            'stdout': stdout.getvalue(),
+            'stderr': stderr.getvalue(),
+            'expired': expired,
+        }
+        try:
+            conn.sendall(json.dumps(response).encode('utf-8'))
+        except OSError:
+            pass
+
+    def _watch_all(self):
+        self.inotify.add_watch(settings.FACETS_DIR, _Inotify.FACETS_DIR_MASK)
+        for name in os.listdir(settings.FACETS_DIR):
+            directory = path.join(settings.FACETS_DIR, name)
+            if path.isdir(directory):
+                self.inotify.add_watch(directory, _Inotify.FACET_MASK)
+
+    def _process_events(self):
+        from facet import index
+        from facet import listing
+
+        for directory, mask, name in self.inotify.read():
+            if mask & _Inotify.IN_Q_OVERFLOW:
+                listing.invalidate()
+                index.invalidate()
+            elif directory == settings.FACETS_DIR:
+                listing.invalidate()
+                index.invalidate(name)
+                child = path.join(directory, name)
+                if mask & _Inotify.IN_CREATE_OR_MOVED_TO and path.isdir(child):
+                    self.inotify.add_watch(child, _Inotify.FACET_MASK)
+            elif directory is not None:
+                # Adding, removing or renaming a file changes the facet
+                # directory's mtime, and so the order of the listing.
+                if mask & _Inotify.IN_ENTRIES_CHANGED:
+                    listing.invalidate()
+                index.invalidate(path.basename(directory))
+
+
+class _Inotify:
+    """
+    Minimal ctypes binding to Linux inotify.
+    """
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+
+    IN_CREATE_OR_MOVED_TO = IN_CREATE | IN_MOVED_TO
+    IN_ENTRIES_CHANGED = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+    FACETS_DIR_MASK = (IN_ATTRIB | IN_CREATE | IN_DELETE |
+                       IN_MOVED_FROM | IN_MOVED_TO)
+    FACET_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_CREATE |
+                  IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO)
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+
+        if not sys.platform.startswith('linux'):
+            raise OSError('not Linux')
+        self._ctypes = ctypes
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'),
+                                 use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._directories = {}
+
+    def add_watch(self, directory, mask):
+        wd = self._libc.inotify_add_watch(self.fd,
+                                          os.fsencode(directory), mask)
+        if wd < 0:
+            raise OSError(self._ctypes.get_errno(),
+                          f'inotify_add_watch failed: {directory}')
+        self._directories[wd] = directory
+
+    def read(self):
+        """
+        Return pending events as (directory, mask, name) tuples.
+        """
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                events.append((self._directories.get(wd), mask, name))
+
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def main():
+    """
+    Run facetd in the foreground.
+    """
+    try:
+        Daemon().serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    # The state of the daemon is that of facet.daemon, which other modules
+    # import, rather than of __main__.
+    from facet import daemon
+    daemon.main()
@@ -0,0 +1,276 @@
+"""
+Fetch JIRA data for many facets at once.
+
+Issues are requested in batches through the JIRA search API, rather than
+with one request per issue, and the results are written to each facet's
+jira.json. Requests are made through a Scheduler, which bounds concurrency
+and retries failures.
+
+For each facet, the time of its last successful fetch, the issue's
+`fields.updated`, and any ETag / Last-Modified headers are recorded in
+facet.refresh.SYNC_FILE. With `changed_only`, searches ask JIRA only for
+issues updated since the facets were last fetched. Per-issue requests are
+conditional on the recorded ETag / Last-Modified.
+"""
+import asyncio
+import math
+import sys
+import time
+from collections import Counter
+from collections import defaultdict
+from os import path
+
+import aiohttp
+
+from facet import settings
+from facet import trace
+from facet.jira import api_url
+from facet.refresh import read_sync_records
+from facet.refresh import update_sync_records
+from facet.scheduler import RETRY_STATUSES
+from facet.scheduler import Scheduler
+
+
+# Added to the time since a facet was last fetched, to allow for clock skew
+# and for the minute resolution of JQL dates.
+_SINCE_MARGIN_MINUTES = 2
+
+# Per-facet results
+OK = 'ok'
+UNCHANGED = 'unchanged'
+FAILED = 'failed'
+TIMED_OUT = 'timed out'
+
+
+def fetch_facets(facets, batch_size=None, per_issue=False,
+                 changed_only=False, max_in_flight=None, request_timeout=None,
+                 total_timeout=None, on_result=None, verbose=True):
+    """
+    Fetch and store JIRA data for `facets`.
+
+    With `per_issue`, each issue is fetched with its own request, as
+    `Facet.fetch` does. Facets still being fetched after `total_timeout`
+    seconds are abandoned. If `verbose`, each facet whose data is written is
+    printed.
+
+    Return {facet name: (result, detail)}, where result is one of OK,
+    UNCHANGED, FAILED and TIMED_OUT. If given, `on_result` is called with
+    each facet's name, result and detail as soon as they are known.
+    """
+    if batch_size is None:
+        batch_size = settings.JIRA_SEARCH_BATCH_SIZE
+    if max_in_flight is None:
+        max_in_flight = settings.FETCH_MAX_IN_FLIGHT
+    if total_timeout is None:
+        total_timeout = settings.FETCH_TOTAL_TIMEOUT
+    facets = [facet for facet in facets if facet.jira]
+    sync = read_sync_records()
+    results = {}
+
+    async def _fetch():
+        conn = aiohttp.TCPConnector(ssl=False, limit=max_in_flight)
+        async with aiohttp.ClientSession(
+                connector=conn,
+                trace_configs=trace.aiohttp_trace_configs()) as session:
+            scheduler = Scheduler(session,
+                                  max_in_flight=max_in_flight,
+                                  request_timeout=request_timeout)
+            fetcher = _Fetcher(scheduler, sync, results, on_result, verbose)
+            if per_issue:
+                coro = fetcher.fetch_per_issue(facets)
+            else:
+                coro = fetcher.fetch_by_search(facets, batch_size,
+                                               changed_only)
+            try:
+                await asyncio.wait_for(coro, total_timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    event_loop = asyncio.new_event_loop()
+    try:
+        event_loop.run_until_complete(_fetch())
+    finally:
+        event_loop.close()
+        update_sync_records({facet.name: sync[facet.name]
+                             for facet in facets if facet.name in sync})
+
+    for facet in facets:
+        if facet.name not in results:
+            results[facet.name] = (TIMED_OUT, 'fetch deadline exceeded')
+            if on_result:
+                on_result(facet.name, *results[facet.name])
+    return results
+
+
+def report(results, prefix='', file=sys.stderr):
+    """
+    Print a summary of `results`, as returned by `fetch_facets`, with each
+    line starting with `prefix`.
+    """
+    counts = Counter(result for result, _ in results.values())
+    for name, (result, detail) in sorted(results.items()):
+        if result in {FAILED, TIMED_OUT}:
+            print(f'{prefix}{name}: {result}: {detail}', file=file)
+    print(prefix + ', '.join(f'{counts[result]} {result}'
+                             for result in [OK, UNCHANGED, FAILED, TIMED_OUT]),
+          file=file)
+
+
+class _Fetcher:
+
+    def __init__(self, scheduler, sync, results, on_result=None,
+                 verbose=True):
+        self.scheduler = scheduler
+        self.sync = sync
+        self.results = results
+        self.on_result = on_result
+        self.verbose = verbose
+
+    def _set_result(self, facet, result, detail):
+        self.results[facet.name] = (result, detail)
+        if self.on_result:
+            self.on_result(facet.name, result, detail)
+
+    def _record(self, facet):
+        return self.sync.setdefault(facet.name, {})
+
+    async def fetch_per_issue(self, facets):
+        await asyncio.gather(*[self._fetch_issue(facet) for facet in facets])
+
+    async def _fetch_issue(self, facet):
+        started = time.time()
+        record = self._record(facet)
+        headers = {}
+        if path.exists(facet.jira_data_file):
+            if record.get('etag'):
+                headers['If-None-Match'] = record['etag']
+            if record.get('last_modified'):
+                headers['If-Modified-Since'] = record['last_modified']
+        try:
+            response = await self.scheduler.get_json(facet.jira_json_url,
+                                                     headers=headers)
+        except Exception as ex:
+            self._fail(facet, ex)
+            return
+        if response.status == 304:
+            record['synced_at'] = started
+            self._set_result(facet, UNCHANGED, 'not modified')
+            return
+        self._store(facet, response.json, started)
+        record['etag'] = response.headers.get('ETag')
+        record['last_modified'] = response.headers.get('Last-Modified')
+
+    async def fetch_by_search(self, facets, batch_size, changed_only):
+        # Facets that have been fetched before can be limited to issues
+        # updated since the least recent of those fetches; the rest need
+        # everything.
+        synced = []
+        unsynced = []
+        for facet in facets:
+            if (changed_only and
+                    self._record(facet).get('synced_at') and
+                    path.exists(facet.jira_data_file)):
+                synced.append(facet)
+            else:
+                unsynced.append(facet)
+
+        coros = []
+        for group in [synced, unsynced]:
+            key2facets = defaultdict(list)
+            for facet in group:
+                key2facets[facet.jira].append(facet)
+            keys = list(key2facets)
+            for i in range(0, len(keys), batch_size):
+                batch = [facet
+                         for key in keys[i:i + batch_size]
+                         for facet in key2facets[key]]
+                since = (min(self._record(facet)['synced_at']
+                             for facet in batch)
+                         if group is synced else None)
+                coros.append(self._fetch_batch(batch, since))
+        await asyncio.gather(*coros)
+
+    async def _fetch_batch(self, batch, since):
+        started = time.time()
+        try:
+            issues = await self.search_issues({facet.jira for facet in batch},
+                                              since)
+        except aiohttp.ClientResponseError as ex:
+            if ex.status in RETRY_STATUSES:
+                for facet in batch:
+                    self._fail(facet, ex)
+            else:
+                # The search API may be unavailable; fall back to fetching
+                # each issue individually.
+                await self.fetch_per_issue(batch)
+            return
+        except Exception as ex:
+            for facet in batch:
+                self._fail(facet, ex)
+            return
+
+        for facet in batch:
+            issue = issues.get(facet.jira)
+            if issue is not None:
+                self._store(facet, issue, started)
+            elif since is not None:
+                self._record(facet)['synced_at'] = started
+                self._set_result(facet, UNCHANGED, 'not updated')
+            else:
+                self._set_result(
+                    facet,
+                    FAILED,
+                    f'JIRA issue {facet.jira} was not returned by search '
+                    f'(deleted or moved?)',
+                )
+
+    async def search_issues(self, keys, since=None):
+        """
+        Return {key: issue JSON} for the issues with `keys` that JIRA
+        returns.
+
+        If `since` (a Unix time) is given, only issues updated since then are
+        requested.
+        """
+        keys = sorted(keys)
+        jql = 'key in (%s)' % ', '.join(f'"{key}"' for key in keys)
+        if since is not None:
+            minutes = (math.ceil((time.time() - since) / 60) +
+                       _SINCE_MARGIN_MINUTES)
+            jql += f' AND updated >= "-{minutes}m"'
+        params = {
+            'jql': jql,
+            'fields': '*all',
+            'maxResults': str(len(keys)),
+            # Report nonexistent keys as warnings instead of failing the
+            # query.
+            'validateQuery': 'warn',
+        }
+        issues = {}
+        start_at = 0
+        while True:
+            params['startAt'] = str(start_at)
+            response = await self.scheduler.get_json(api_url('search'),
+                                                     params=params)
+            page = response.json
+            for issue in page['issues']:
+                issues[issue['key']] = issue
+            start_at += len(page['issues'])
+            if not page['issues'] or start_at >= page['total']:
+                return issues
+
+    def _store(self, facet, issue, started):
+        changed = facet.write_jira_data(issue, verbose=self.verbose)
+        record = self._record(facet)
+        record['synced_at'] = started
+        record['updated'] = issue['fields'].get('updated')
+        if changed:
+            self._set_result(facet, OK, 'updated')
+        else:
+            self._set_result(facet, UNCHANGED, 'identical')
+
+    def _fail(self, facet, ex):
+        if isinstance(ex, asyncio.TimeoutError):
+            self._set_result(facet, TIMED_OUT, 'request timed out')
+        else:
+            self._set_result(facet, FAILED, f'{type(ex).__name__}: {ex}')
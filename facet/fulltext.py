@@ -0,0 +1,259 @@
+"""
+Full-text index of facet notes and PR descriptions.
+
+The words of each facet's notes files and PR.md are stored in an inverted
+index: a SQLite database under FACET_DIR mapping each word to the files that
+contain it. Before each search the facet directories are listed, and only
+files whose mtime or size has changed since they were indexed are read.
+
+A query is a list of words, "quoted phrases" and prefix* words, matched
+ignoring case. The index gives the files containing all of their words, and
+only those files are read, to check that each term, phrases included, is
+found on some line, and to find the lines containing any of them.
+"""
+import os
+import re
+from collections import namedtuple
+from os import path
+
+from facet import listing
+from facet import settings
+from facet.core import PR_FILE_NAME
+from facet.core import get_notes_file_names
+
+
+TEXT_INDEX_FILE = path.join(settings.FACET_DIR, 'text-index.sqlite')
+
+_SCHEMA_VERSION = 1
+
+_WORD_RE = re.compile(r'\w+')
+
+# The words of a query term, the last of which is a prefix if `prefix`
+Term = namedtuple('Term', ['words', 'prefix'])
+
+# A file's matching lines and their context
+Result = namedtuple('Result', ['facet', 'file_name', 'lines'])
+Line = namedtuple('Line', ['number', 'text', 'is_match'])
+
+_connection = None
+
+
+class QueryError(ValueError):
+    pass
+
+
+def parse_query(query):
+    """
+    Return the Terms of `query`.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', query):
+        words = _get_words(phrase or word)
+        if words:
+            terms.append(Term(words, prefix=word.endswith('*')))
+    if not terms:
+        raise QueryError(f'No words in query: {query!r}')
+    return terms
+
+
+def search(query, context=0):
+    """
+    Return a Result for each indexed file with every term of `query` on some
+    line, with its lines containing any of them, and `context` lines around
+    each. Results are ordered by facet and file name.
+    """
+    terms = parse_query(query)
+    update()
+    subqueries = []
+    params = []
+    for term in terms:
+        for i, word in enumerate(term.words):
+            if term.prefix and i == len(term.words) - 1:
+                subqueries.append('SELECT file_id FROM postings '
+                                  'WHERE term >= ? AND term < ?')
+                params.extend([word, word + '\U0010ffff'])
+            else:
+                subqueries.append('SELECT file_id FROM postings '
+                                  'WHERE term = ?')
+                params.append(word)
+    rows = _connect().execute(
+        f'SELECT facet, file_name FROM files '
+        f'WHERE id IN ({" INTERSECT ".join(subqueries)}) '
+        f'ORDER BY facet, file_name',
+        params,
+    ).fetchall()
+
+    patterns = [_compile(term) for term in terms]
+    results = []
+    for facet, file_name in rows:
+        try:
+            lines = _read(path.join(settings.FACETS_DIR, facet,
+                                    file_name)).splitlines()
+        except FileNotFoundError:
+            continue
+        # The index only tells that a phrase's words are in the file.
+        if all(any(pattern.search(line) for line in lines)
+               for pattern in patterns):
+            results.append(Result(facet, file_name,
+                                  _get_lines(lines, patterns, context)))
+    return results
+
+
+def update():
+    """
+    Re-index the notes and PR files that have changed since they were
+    indexed, and forget those that no longer exist.
+    """
+    file_names = set(get_notes_file_names() + [PR_FILE_NAME])
+    found = {}
+    for name in listing.get_name_set():
+        try:
+            with os.scandir(f'{settings.FACETS_DIR}/{name}') as entries:
+                for entry in entries:
+                    if entry.name in file_names and entry.is_file():
+                        stat = entry.stat()
+                        found[name, entry.name] = (stat.st_mtime_ns,
+                                                   stat.st_size)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+
+    conn = _connect()
+    if _get_changes(conn, found) == ([], []):
+        return
+    with conn:
+        # Another search may be updating the index too: the write lock is
+        # taken before the changes are read again, so that they are only
+        # applied once.
+        conn.execute('BEGIN IMMEDIATE')
+        removed, changed = _get_changes(conn, found)
+        # Each file's words are stored, so that its postings can be deleted
+        # without an index of postings by file.
+        conn.executemany(
+            'DELETE FROM postings WHERE term = ? AND file_id = ?',
+            [(word, file_id)
+             for file_id in removed
+             for [words] in conn.execute(
+                 'SELECT words FROM file_words WHERE file_id = ?', (file_id,))
+             for word in words.split()],
+        )
+        for table, column in [('files', 'id'), ('file_words', 'file_id')]:
+            conn.executemany(f'DELETE FROM {table} WHERE {column} = ?',
+                             [(file_id,) for file_id in removed])
+        postings = []
+        for facet, file_name in changed:
+            try:
+                text = _read(path.join(settings.FACETS_DIR, facet, file_name))
+            except FileNotFoundError:
+                continue
+            # The mtime from before reading the file is stored, so that a
+            # change made while it is read is noticed next time.
+            words = set(_get_words(text))
+            file_id = conn.execute(
+                'INSERT INTO files (facet, file_name, mtime, size) '
+                'VALUES (?, ?, ?, ?)',
+                (facet, file_name) + found[facet, file_name],
+            ).lastrowid
+            conn.execute(
+                'INSERT INTO file_words (file_id, words) VALUES (?, ?)',
+                (file_id, ' '.join(words)))
+            postings.extend((word, file_id) for word in words)
+        # Inserting in key order is much faster when indexing many files.
+        postings.sort()
+        conn.executemany('INSERT INTO postings (term, file_id) VALUES (?, ?)',
+                         postings)
+
+
+def _get_changes(conn, found):
+    """
+    Return the ids of the indexed files that have changed or no longer exist,
+    and the keys of those of `found` ({(facet, file name): (mtime, size)})
+    that have changed or are not indexed.
+    """
+    stored = {
+        (facet, file_name): (file_id, (mtime, size))
+        for file_id, facet, file_name, mtime, size in conn.execute(
+            'SELECT id, facet, file_name, mtime, size FROM files')
+    }
+    removed = [file_id for key, (file_id, stat) in stored.items()
+               if found.get(key) != stat]
+    changed = [key for key, stat in found.items()
+               if key not in stored or stored[key][1] != stat]
+    return removed, changed
+
+
+def _get_words(text):
+    return _WORD_RE.findall(text.casefold())
+
+
+def _compile(term):
+    pattern = r'\W+'.join(map(re.escape, term.words))
+    return re.compile(r'\b' + pattern + (r'\w*' if term.prefix else r'\b'),
+                      re.IGNORECASE)
+
+
+def _get_lines(lines, patterns, context):
+    matches = {i for i, line in enumerate(lines)
+               if any(pattern.search(line) for pattern in patterns)}
+    shown = sorted({j for i in matches
+                    for j in range(max(i - context, 0),
+                                   min(i + context + 1, len(lines)))})
+    return [Line(i + 1, lines[i], i in matches) for i in shown]
+
+
+def _read(file):
+    with open(file, encoding='utf-8', errors='replace') as fp:
+        return fp.read()
+
+
+def _connect():
+    global _connection
+    if _connection is None:
+        import sqlite3
+
+        conn = sqlite3.connect(TEXT_INDEX_FILE, timeout=10)
+        # Up to 64MB, for indexing many files at once
+        conn.execute('PRAGMA cache_size = -65536')
+        if _get_version(conn) != _SCHEMA_VERSION:
+            with conn:
+                # Check again under the write lock, in case another search
+                # has just created the tables.
+                conn.execute('BEGIN IMMEDIATE')
+                if _get_version(conn) != _SCHEMA_VERSION:
+                    _create_tables(conn)
+        _connection = conn
+    return _connection
+
+
+def _get_version(conn):
+    [version] = conn.execute('PRAGMA user_version').fetchone()
+    return version
+
+
+def _create_tables(conn):
+    conn.execute('DROP TABLE IF EXISTS files')
+    conn.execute('DROP TABLE IF EXISTS file_words')
+    conn.execute('DROP TABLE IF EXISTS postings')
+    conn.execute(
+        'CREATE TABLE files ('
+        ' id INTEGER PRIMARY KEY,'
+        ' facet TEXT,'
+        ' file_name TEXT,'
+        ' mtime INTEGER,'
+        ' size INTEGER,'
+        ' UNIQUE (facet, file_name)'
+        ')'
+    )
+    conn.execute(
+        'CREATE TABLE file_words ('
+        ' file_id INTEGER PRIMARY KEY,'
+        ' words TEXT'
+        ')'
+    )
+    conn.execute(
+        'CREATE TABLE postings ('
+        ' term TEXT,'
+        ' file_id INTEGER,'
+        ' PRIMARY KEY (term, file_id)'
+        ') WITHOUT ROWID'
+    )
+    conn.execute(f'PRAGMA user_version = {_SCHEMA_VERSION}')
@@ -0,0 +1,156 @@
+"""
+Fetch the status of facets' pull requests from GitHub.
+
+A facet's pull request is the most recent one whose head branch is the
+facet's branch, in the GitHub repository that is the origin remote of the
+facet's repo, or else settings.GITHUB_REPO_URL. Pull requests are looked up
+through the GraphQL API with one query per repository, each branch being a
+separate aliased field of the query, in batches of at most BATCH_SIZE
+branches. The state of each pull request is written to the facet's
+github.json, or {} if the branch has no pull request.
+"""
+import asyncio
+import re
+from collections import defaultdict
+from os import path
+
+import aiohttp
+
+from facet import settings
+from facet import trace
+from facet.fetch import FAILED
+from facet.fetch import OK
+from facet.fetch import UNCHANGED
+from facet.scheduler import Scheduler
+
+
+BATCH_SIZE = 50
+
+_PULL_REQUEST_FIELDS = '''
+    number
+    url
+    state
+    isDraft
+    reviewDecision
+    merged
+    commits(last: 1) { nodes { commit { statusCheckRollup { state } } } }
+'''
+
+_GITHUB_URL_RE = re.compile(
+    r'github\.com[:/]([^/\s]+)/([^/\s]+?)(?:\.git)?/?$')
+
+
+def fetch_pull_requests(facets, verbose=True):
+    """
+    Fetch and store the pull request status of those of `facets` that have a
+    branch and a GitHub repository.
+
+    Return {facet name: (result, detail)}, where result is one of
+    facet.fetch.OK, UNCHANGED and FAILED.
+    """
+    by_repo = defaultdict(list)
+    for facet in facets:
+        repo = get_github_repo(facet) if facet.entry.branch else None
+        if repo:
+            by_repo[repo].append(facet)
+    results = {}
+
+    async def _fetch():
+        conn = aiohttp.TCPConnector(limit=settings.FETCH_MAX_IN_FLIGHT)
+        async with aiohttp.ClientSession(
+                connector=conn,
+                headers={'Authorization': f'bearer {settings.GITHUB_TOKEN}'},
+                trace_configs=trace.aiohttp_trace_configs()) as session:
+            scheduler = Scheduler(session,
+                                  max_in_flight=settings.FETCH_MAX_IN_FLIGHT)
+            await asyncio.gather(*[
+                _fetch_batch(scheduler, repo, batch[i:i + BATCH_SIZE],
+                             results, verbose)
+                for repo, batch in by_repo.items()
+                for i in range(0, len(batch), BATCH_SIZE)
+            ])
+
+    event_loop = asyncio.new_event_loop()
+    try:
+        event_loop.run_until_complete(_fetch())
+    finally:
+        event_loop.close()
+    return results
+
+
+def get_github_repo(facet):
+    """
+    Return 'OWNER/NAME' of the GitHub repository of `facet`, or None.
+    """
+    if facet.entry.repo:
+        repo = _read_origin_url(path.expanduser(facet.entry.repo))
+        match = repo and _GITHUB_URL_RE.search(repo)
+        if match:
+            return '/'.join(match.groups())
+    match = _GITHUB_URL_RE.search(settings.GITHUB_REPO_URL or '')
+    return '/'.join(match.groups()) if match else None
+
+
+def _read_origin_url(repo):
+    from facet.gitstatus import get_git_dirs
+
+    try:
+        _, common_dir = get_git_dirs(repo)
+        with open(path.join(common_dir, 'config')) as fp:
+            config = fp.read()
+    except OSError:
+        return None
+    match = re.search(r'^\[remote "origin"\]\n(?:[ \t]+.*\n)*?'
+                      r'[ \t]+url\s*=\s*(.*)$', config, re.MULTILINE)
+    return match.group(1).strip() if match else None
+
+
+async def _fetch_batch(scheduler, repo, facets, results, verbose):
+    branches = list(dict.fromkeys(facet.entry.branch for facet in facets))
+    owner, name = repo.split('/')
+    query = 'query(%s) { repository(owner: $owner, name: $name) { %s } }' % (
+        ', '.join(['$owner: String!', '$name: String!'] +
+                  [f'$b{i}: String!' for i in range(len(branches))]),
+        ' '.join(
+            f'b{i}: pullRequests(headRefName: $b{i}, first: 1, '
+            f'orderBy: {{field: CREATED_AT, direction: DESC}}) '
+            f'{{ nodes {{ {_PULL_REQUEST_FIELDS} }} }}'
+            for i in range(len(branches))),
+    )
+    variables = dict(owner=owner, name=name,
+                     **{f'b{i}': branch for i, branch in enumerate(branches)})
+    try:
+        response = await scheduler.post_json(
+            settings.GITHUB_API_URL,
+            json={'query': query, 'variables': variables})
+        if response.json.get('errors'):
+            raise ValueError(response.json['errors'][0].get('message'))
+        repository = response.json['data']['repository']
+        if repository is None:
+            raise ValueError(f'Repository {repo} not found')
+    except Exception as ex:
+        for facet in facets:
+            results[facet.name] = (FAILED, f'{type(ex).__name__}: {ex}')
+        return
+
+    for facet in facets:
+        nodes = repository[f'b{branches.index(facet.entry.branch)}']['nodes']
+        pr = _read_node(nodes[0]) if nodes else {}
+        if facet.write_github_data(pr, verbose=verbose):
+            results[facet.name] = (OK, 'updated')
+        else:
+            results[facet.name] = (UNCHANGED, 'identical')
+
+
+def _read_node(node):
+    commits = node['commits']['nodes']
+    rollup = commits and commits[0]['commit']['statusCheckRollup']
+    return {
+        'number': node['number'],
+        'url': node['url'],
+        'state': node['state'],
+        'is_draft': node['isDraft'],
+        'review_decision': node['reviewDecision'],
+        'ci_status': rollup['state'] if rollup else None,
+        'merged': node['merged'],
+    }
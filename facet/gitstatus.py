@@ -0,0 +1,255 @@
+"""
+Status of facet branches in their git repositories.
+
+Facets are grouped by repo, so that each repository's refs are read by a
+single `git for-each-ref`, and the git commands for all repositories run
+concurrently, at most `jobs` at a time. Everything derived from refs --
+whether branches exist, how far they are ahead of and behind their upstream
+and the default branch, and their last commit times -- is cached in
+CACHE_FILE, keyed by the mtimes of the repository's ref files, so that it is
+only recomputed after refs change. Whether the checked-out branch has
+uncommitted changes to tracked files is checked on every run.
+"""
+import hashlib
+import os
+import subprocess
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+
+from facet import settings
+from facet import storage
+from facet.utils import warning
+
+
+CACHE_FILE = path.join(settings.FACET_DIR, 'git-status.json')
+
+BranchStatus = namedtuple('BranchStatus', [
+    'name',
+    'repo',
+    'branch',
+    'exists',
+    'upstream',
+    'ahead',
+    'behind',
+    'default_branch',
+    'ahead_default',
+    'behind_default',
+    'dirty',
+    'last_commit',
+])
+
+_FOR_EACH_REF_FORMAT = '\t'.join([
+    '%(refname)',
+    '%(symref)',
+    '%(upstream:short)',
+    '%(upstream:track,nobracket)',
+    '%(committerdate:unix)',
+])
+
+
+def get_statuses(facets, jobs=8):
+    """
+    Return a BranchStatus for each of `facets`, (name, repo, branch) tuples,
+    grouped by repo in order of first appearance.
+
+    Facets whose repo is not a git repository have `exists` None.
+    """
+    by_repo = {}
+    for name, repo, branch in facets:
+        by_repo.setdefault(repo, []).append((name, branch))
+    cache = _read_cache()
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        repos = dict(zip(by_repo, executor.map(
+            lambda repo: _read_repo(repo, cache.get(repo), by_repo[repo]),
+            by_repo)))
+        # Count commits relative to the default branch for branches whose
+        # counts are not cached.
+        pending = [
+            (repo, branch)
+            for repo, repo_facets in by_repo.items() if repos[repo]
+            for branch in {branch for _, branch in repo_facets}
+            if repos[repo][0]['default'] and
+            branch in repos[repo][0]['branches'] and
+            branch not in repos[repo][0]['counts']
+        ]
+        for (repo, branch), counts in zip(pending, executor.map(
+                lambda key: _count(key[0], key[1], repos[key[0]][0]),
+                pending)):
+            # Failures are not cached, so that they are retried.
+            if None not in counts:
+                repos[repo][0]['counts'][branch] = counts
+
+    def update(cache):
+        for repo, read in repos.items():
+            if read:
+                cache[repo] = read[0]
+
+    storage.update_json(CACHE_FILE, update)
+
+    statuses = []
+    for repo, repo_facets in by_repo.items():
+        for name, branch in repo_facets:
+            statuses.append(_get_status(name, repo, branch, repos[repo]))
+    return statuses
+
+
+def _get_status(name, repo, branch, read):
+    status = dict.fromkeys(BranchStatus._fields)
+    status.update(name=name, repo=repo, branch=branch)
+    if read is None:
+        return BranchStatus(**status)
+    refs, head, dirty = read
+    status['default_branch'] = refs['default']
+    status['exists'] = branch in refs['branches']
+    if status['exists']:
+        upstream, ahead, behind, last_commit = refs['branches'][branch]
+        ahead_default, behind_default = refs['counts'].get(branch,
+                                                           [None, None])
+        status.update(
+            upstream=upstream,
+            ahead=ahead,
+            behind=behind,
+            ahead_default=ahead_default,
+            behind_default=behind_default,
+            dirty=dirty if branch == head else False,
+            last_commit=last_commit,
+        )
+    return BranchStatus(**status)
+
+
+def _read_repo(repo, cached, repo_facets):
+    """
+    Return (refs, head, dirty) for `repo`, where `refs` is its cached ref
+    data if still current, `head` is the checked out branch, and `dirty` is
+    whether it has uncommitted changes, or None if `repo` is not a git
+    repository.
+    """
+    try:
+        git_dir, common_dir = get_git_dirs(repo)
+        key = _get_refs_key(common_dir)
+        if cached is not None and cached['key'] == key:
+            refs = cached
+        else:
+            refs = dict(_read_refs(repo), key=key, counts={})
+        head = _read_head(git_dir)
+        dirty = (head in {branch for _, branch in repo_facets} and
+                 _is_dirty(repo))
+    except FileNotFoundError:
+        return None
+    except (OSError, subprocess.CalledProcessError) as ex:
+        warning(f'Error reading git repository {repo}: {ex}')
+        return None
+    return refs, head, dirty
+
+
+def get_git_dirs(repo):
+    """
+    Return the git directory of `repo`, and the directory holding its refs,
+    which differ for a linked worktree.
+    """
+    git_dir = path.join(repo, '.git')
+    if path.isfile(git_dir):
+        with open(git_dir) as fp:
+            git_dir = path.join(repo, fp.read().split('gitdir:', 1)[1].strip())
+    try:
+        with open(path.join(git_dir, 'commondir')) as fp:
+            return git_dir, path.join(git_dir, fp.read().strip())
+    except FileNotFoundError:
+        return git_dir, git_dir
+
+
+def _get_refs_key(common_dir):
+    """
+    Return a digest of the names, mtimes and sizes of the files holding the
+    branches and remote-tracking branches of a repository.
+    """
+    stats = []
+    for name in ['packed-refs', 'reftable/tables.list']:
+        try:
+            stat = os.stat(path.join(common_dir, name))
+        except FileNotFoundError:
+            continue
+        stats.append(f'{name} {stat.st_mtime_ns} {stat.st_size}')
+    for refs in ['refs/heads', 'refs/remotes']:
+        for directory, _, files in os.walk(path.join(common_dir, refs)):
+            for file in files:
+                file = path.join(directory, file)
+                stat = os.stat(file)
+                stats.append(f'{file} {stat.st_mtime_ns} {stat.st_size}')
+    if not stats and not path.isdir(path.join(common_dir, 'refs')):
+        raise FileNotFoundError(f'Not a git repository: {common_dir}')
+    return hashlib.sha1('\n'.join(sorted(stats)).encode()).hexdigest()
+
+
+def _read_refs(repo):
+    """
+    Return {'branches': {branch: [upstream, ahead, behind, last_commit]},
+    'default': default branch}, where ahead and behind are relative to
+    the upstream, and the default branch is that of origin if known.
+    """
+    branches = {}
+    default = None
+    for line in _git(repo, 'for-each-ref', f'--format={_FOR_EACH_REF_FORMAT}',
+                     'refs/heads', 'refs/remotes/origin/HEAD').splitlines():
+        refname, symref, upstream, track, last_commit = line.split('\t')
+        if refname == 'refs/remotes/origin/HEAD':
+            default = symref.replace('refs/remotes/', '', 1) or None
+            continue
+        counts = dict(item.split() for item in track.split(', ')
+                      if item.startswith(('ahead ', 'behind ')))
+        branches[refname.replace('refs/heads/', '', 1)] = [
+            upstream or None,
+            int(counts.get('ahead', 0)) if upstream else None,
+            int(counts.get('behind', 0)) if upstream else None,
+            int(last_commit) if last_commit else None,
+        ]
+    if default is None:
+        default = next((branch for branch in ['main', 'master']
+                        if branch in branches), None)
+    return {'branches': branches, 'default': default}
+
+
+def _read_head(git_dir):
+    with open(path.join(git_dir, 'HEAD')) as fp:
+        head = fp.read().strip()
+    prefix = 'ref: refs/heads/'
+    return head[len(prefix):] if head.startswith(prefix) else None
+
+
+def _count(repo, branch, refs):
+    """
+    Return [ahead, behind] of `branch` relative to the default branch.
+    """
+    try:
+        output = _git(repo, 'rev-list', '--left-right', '--count',
+                      f'refs/heads/{branch}...{refs["default"]}')
+    except subprocess.CalledProcessError as ex:
+        warning(f'Error counting commits of {branch} in {repo}: {ex}')
+        return [None, None]
+    return [int(count) for count in output.split()]
+
+
+def _is_dirty(repo):
+    return bool(_git(repo, 'status', '--porcelain', '--untracked-files=no'))
+
+
+def _git(repo, *args):
+    return subprocess.run(
+        ['git', '-C', repo] + list(args),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    ).stdout
+
+
+def _read_cache():
+    import json
+
+    try:
+        with open(CACHE_FILE) as fp:
+            return json.load(fp)
+    except (FileNotFoundError, ValueError):
+        return {}
@@ -0,0 +1,479 @@
+"""
+Persistent index of facet metadata.
+
+Listing facets needs a few fields from every facet's facet.yaml, jira.json and
+github.json.
+Those fields are stored in a SQLite database under FACET_DIR together with the
+mtimes of the files they were read from, and a facet's files are only parsed
+again when one of those mtimes changes.
+
+Alongside each entry, the index stores the trigrams of the facet's name, JIRA
+key and JIRA summary, for `facet find` (see facet.search).
+"""
+import os
+import re
+from collections import namedtuple
+from os import path
+
+from facet import listing
+from facet import settings
+from facet.utils import warning
+
+
+INDEX_FILE = path.join(settings.FACET_DIR, 'index.sqlite')
+
+_SCHEMA_VERSION = 5
+
+Entry = namedtuple('Entry', [
+    'name',
+    'mtime',
+    'config_mtime',
+    'jira_mtime',
+    'github_mtime',
+    'follow',
+    'status',
+    'repo',
+    'branch',
+    'jira',
+    'summary',
+    'jira_status',
+    'jira_ttl',
+    'assignee',
+    'priority',
+    'fix_versions',
+    'pr_status',
+])
+
+# Fields read from jira.json
+JIRA_FIELDS = ['summary', 'jira_status', 'assignee', 'priority',
+               'fix_versions']
+
+_COLUMNS = ', '.join(Entry._fields)
+_PLACEHOLDERS = ', '.join('?' for _ in Entry._fields)
+
+# Lookups of up to this many entries select them rather than loading all
+# entries
+_MAX_SELECTED = 100
+
+# Fields whose trigrams are stored, by the bit that marks them
+_TRIGRAM_FIELDS = {1: ['name', 'jira'], 2: ['summary']}
+
+# Holds each thread's database connection
+_local = None
+
+# Entries known to be current. A long-running process that watches the
+# facets directory for changes (see facet.daemon) keeps entries here, and
+# trusts them until it calls `invalidate`.
+_watched = None
+
+
+def get_entry(name):
+    """
+    Return the index entry for facet `name`, re-reading its files if needed.
+    """
+    if _watched is not None and name in _watched:
+        return _watched[name]
+    [entry] = _refresh([name], _load([name]), on_error=None)
+    return entry
+
+
+def get_entries(names, config_only=False):
+    """
+    Return index entries for `names`, in the same order.
+
+    Facets whose files cannot be read are reported and omitted.
+
+    With `config_only`, no jira.json is read: a facet whose jira.json has
+    changed since it was indexed gets an entry with jira_mtime None and no
+    JIRA fields, which is not stored.
+    """
+    names = list(names)
+    if _watched is not None and all(name in _watched for name in names):
+        return [_watched[name] for name in names]
+    # Removed facets are only looked for when loading all rows.
+    few = len(names) <= _MAX_SELECTED
+    rows = _load(names if few else None)
+    entries = _refresh(names, rows, on_error=_warn, config_only=config_only)
+    gone = [] if few else [name for name in rows.keys() - set(names)
+                           if not listing.exists(name)]
+    if gone:
+        with _connect() as conn:
+            _delete(conn, gone)
+    return entries
+
+
+def update(name, config=None, jira_json=None, github_json=None):
+    """
+    Re-index facet `name` after its files have been written.
+
+    `config`, `jira_json` and `github_json`, if supplied, are the data that
+    was just written, and are used instead of parsing the files again.
+    """
+    entry = _read_entry(name, _stat(name), config=config, jira_json=jira_json,
+                        github_json=github_json,
+                        previous=_load([name]).get(name))
+    _store([entry])
+    if _watched is not None:
+        _watched[name] = entry
+    return entry
+
+
+def remove(name):
+    invalidate(name)
+    with _connect() as conn:
+        _delete(conn, [name])
+
+
+def get_names():
+    """
+    Return the names of all indexed facets.
+    """
+    return [name for [name] in _connect().execute('SELECT name FROM facets')]
+
+
+def match_trigrams(trigrams, min_matched=1):
+    """
+    Return (name, mtime, matched, matched_in_name) for each indexed facet
+    with at least `min_matched` of `trigrams`, where `matched` is the number
+    of `trigrams` found in the facet's name, JIRA key or summary, and
+    `matched_in_name` the number found in its name or JIRA key.
+    """
+    trigrams = list(trigrams)
+    if not trigrams:
+        return []
+    return _connect().execute(
+        f'SELECT name, mtime, matched, matched_in_name FROM ('
+        f' SELECT name, COUNT(*) AS matched,'
+        f'  SUM(fields & 1) AS matched_in_name'
+        f' FROM trigrams'
+        f' WHERE trigram IN ({", ".join("?" for _ in trigrams)})'
+        f' GROUP BY name HAVING matched >= ?'
+        f') JOIN facets USING (name)',
+        trigrams + [min_matched],
+    ).fetchall()
+
+
+def get_trigrams(text):
+    """
+    Return the set of trigrams of the words in `text`, ignoring case.
+
+    Each word is padded with two spaces before and one after, so that short
+    words have trigrams, and word starts weigh more than word ends.
+    """
+    trigrams = set()
+    for word in re.findall(r'[^\W_]+', text.casefold()):
+        word = f'  {word} '
+        trigrams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return trigrams
+
+
+def watch():
+    """
+    Keep entries in memory until they are invalidated.
+    """
+    global _watched
+    _watched = {}
+
+
+def invalidate(name=None):
+    """
+    Forget the in-memory entry for facet `name`, or all entries.
+    """
+    if _watched is not None:
+        if name is None:
+            _watched.clear()
+        else:
+            _watched.pop(name, None)
+
+
+def _refresh(names, rows, on_error, config_only=False):
+    """
+    Return current entries for `names`, given `rows`, their stored entries,
+    re-reading the files of facets that have changed and storing the
+    results.
+
+    The facets whose files must be read, those with no stored entry, such as
+    all of them when the index is new, and those that have changed, are read
+    concurrently by up to settings.INDEX_READ_JOBS threads, since on network
+    file systems each facet's reads are dominated by round trips.
+    """
+    entries = []
+    stale = []
+    # name: mtimes, or the exception raised in reading them
+    mtimes = {}
+    to_read = []
+    for name in names:
+        if _watched is not None and name in _watched:
+            continue
+        entry = rows.get(name)
+        if entry is None:
+            to_read.append(name)
+            continue
+        try:
+            mtimes[name] = _stat(name)
+        except Exception as exc:
+            mtimes[name] = exc
+            continue
+        if (_is_jira_unread(entry, mtimes[name], config_only) or
+                _is_changed(entry, mtimes[name])):
+            to_read.append(name)
+
+    def refresh_entry(name):
+        try:
+            return _refresh_entry(name, rows.get(name), config_only,
+                                  mtimes.get(name))
+        except Exception as exc:
+            return exc
+
+    if len(to_read) > 1 and settings.INDEX_READ_JOBS > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=min(
+                settings.INDEX_READ_JOBS, len(to_read))) as executor:
+            read = dict(zip(to_read, executor.map(refresh_entry, to_read)))
+    else:
+        read = {name: refresh_entry(name) for name in to_read}
+    for name in names:
+        if _watched is not None and name in _watched:
+            entries.append(_watched[name])
+            continue
+        try:
+            result = read[name] if name in read else refresh_entry(name)
+            if isinstance(result, Exception):
+                raise result
+            entry, is_stale = result
+        except Exception as exc:
+            if on_error is None:
+                raise
+            on_error(name, exc)
+        else:
+            entries.append(entry)
+            if is_stale:
+                stale.append(entry)
+            if _watched is not None and is_stale is not None:
+                _watched[name] = entry
+    _store(stale)
+    return entries
+
+
+def _refresh_entry(name, entry, config_only, mtimes=None):
+    """
+    Return (entry, stale) for facet `name`, given `entry`, its stored entry
+    or None, and `mtimes`, its files' mtimes if already read, where `stale`
+    is whether the entry should be stored, or None if it is a config_only
+    entry that must not be.
+    """
+    if isinstance(mtimes, Exception):
+        raise mtimes
+    if mtimes is None:
+        mtimes = _stat(name)
+    if _is_jira_unread(entry, mtimes, config_only):
+        return _read_entry(name, mtimes[:2] + (None,) + mtimes[3:],
+                           previous=entry), None
+    if _is_changed(entry, mtimes):
+        return _read_entry(name, mtimes, previous=entry), True
+    if entry.mtime != mtimes[0]:
+        return entry._replace(mtime=mtimes[0]), True
+    return entry, False
+
+
+def _is_jira_unread(entry, mtimes, config_only):
+    # config_only entries are read without their jira.json.
+    return (config_only and mtimes[2] is not None and
+            (entry is None or entry.jira_mtime != mtimes[2]))
+
+
+def _is_changed(entry, mtimes):
+    return (entry is None or
+            (entry.config_mtime, entry.jira_mtime,
+             entry.github_mtime) != mtimes[1:])
+
+
+def _read_entry(name, mtimes, config=None, jira_json=None, github_json=None,
+                previous=None):
+    """
+    Return an entry for facet `name`, reading its files unless their data
+    is supplied. JIRA fields are taken from `previous`, an earlier entry, if
+    the facet's JIRA issue and jira.json are unchanged since then, and
+    likewise for the pull request status and github.json.
+    """
+    from facet.core import Facet
+
+    facet = Facet(name=name)
+    if config is None:
+        config = facet.read_config()
+    jira_fields = dict.fromkeys(JIRA_FIELDS)
+    if config.get('jira') and mtimes[2] is not None:
+        if (jira_json is None and previous is not None and
+                previous.jira == config.get('jira') and
+                previous.jira_mtime == mtimes[2]):
+            jira_fields = {field: getattr(previous, field)
+                           for field in JIRA_FIELDS}
+        else:
+            if jira_json is None:
+                jira_issue = facet.read_jira_issue()
+            else:
+                from facet.jira import JiraIssue
+                jira_issue = JiraIssue(jira_json)
+            jira_fields = {
+                'summary': jira_issue.summary,
+                'jira_status': jira_issue.jira_status,
+                'assignee': jira_issue.assignee,
+                'priority': jira_issue.priority,
+                'fix_versions': ', '.join(jira_issue.fix_versions) or None,
+            }
+    pr_status = None
+    if mtimes[3] is not None:
+        if (github_json is None and previous is not None and
+                previous.github_mtime == mtimes[3]):
+            pr_status = previous.pr_status
+        else:
+            from facet.core import get_pull_request_status
+            if github_json is None:
+                github_json = facet.read_pull_request()
+            status = get_pull_request_status(github_json)
+            pr_status = status.name if status else None
+    return Entry(
+        name=name,
+        mtime=mtimes[0],
+        config_mtime=mtimes[1],
+        jira_mtime=mtimes[2],
+        github_mtime=mtimes[3],
+        follow=bool(config.get('follow')),
+        status=config.get('status'),
+        repo=config.get('repo'),
+        branch=config.get('branch'),
+        jira=config.get('jira'),
+        jira_ttl=config.get('jira_ttl'),
+        pr_status=pr_status,
+        **jira_fields
+    )
+
+
+def _stat(name):
+    """
+    Return mtimes of the facet directory, its config file, its JIRA file and
+    its GitHub file.
+
+    A missing JIRA or GitHub file has mtime None; a missing directory or
+    config file is an error.
+    """
+    from facet.core import Facet
+
+    facet = Facet(name=name)
+    return (
+        listing.get_mtime(name),
+        os.stat(facet.config_file).st_mtime_ns,
+        _get_mtime(facet.jira_data_file),
+        _get_mtime(facet.github_data_file),
+    )
+
+
+def _get_mtime(file):
+    try:
+        return os.stat(file).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _load(names=None):
+    """
+    Return {name: entry} for all stored entries, or only those of `names`.
+    """
+    if names is None:
+        cursor = _connect().execute(f'SELECT {_COLUMNS} FROM facets')
+    else:
+        cursor = _connect().execute(
+            f'SELECT {_COLUMNS} FROM facets '
+            f'WHERE name IN ({", ".join("?" for _ in names)})', names)
+    return {row[0]: Entry._make(row) for row in cursor}
+
+
+def _store(entries):
+    if not entries:
+        return
+    with _connect() as conn:
+        conn.executemany(
+            f'INSERT OR REPLACE INTO facets ({_COLUMNS}) '
+            f'VALUES ({_PLACEHOLDERS})',
+            entries,
+        )
+        conn.executemany('DELETE FROM trigrams WHERE name = ?',
+                         [(entry.name,) for entry in entries])
+        conn.executemany(
+            'INSERT INTO trigrams (trigram, name, fields) VALUES (?, ?, ?)',
+            [(trigram, entry.name, fields)
+             for entry in entries
+             for trigram, fields in _get_trigram_fields(entry).items()],
+        )
+
+
+def _get_trigram_fields(entry):
+    """
+    Return {trigram: bits of the fields of `entry` containing it}.
+    """
+    trigram_fields = {}
+    for bit, names in _TRIGRAM_FIELDS.items():
+        text = ' '.join(getattr(entry, name) or '' for name in names)
+        for trigram in get_trigrams(text):
+            trigram_fields[trigram] = trigram_fields.get(trigram, 0) | bit
+    return trigram_fields
+
+
+def _delete(conn, names):
+    for table in ['facets', 'trigrams']:
+        conn.executemany(f'DELETE FROM {table} WHERE name = ?',
+                         [(name,) for name in names])
+
+
+def _connect():
+    global _local
+    if _local is None:
+        import threading
+        _local = threading.local()
+    if getattr(_local, 'connection', None) is None:
+        import sqlite3
+
+        conn = sqlite3.connect(INDEX_FILE, timeout=10)
+        [version] = conn.execute('PRAGMA user_version').fetchone()
+        if version != _SCHEMA_VERSION:
+            with conn:
+                conn.execute('DROP TABLE IF EXISTS facets')
+                conn.execute('DROP TABLE IF EXISTS trigrams')
+                conn.execute(
+                    'CREATE TABLE facets ('
+                    ' name TEXT PRIMARY KEY,'
+                    ' mtime INTEGER,'
+                    ' config_mtime INTEGER,'
+                    ' jira_mtime INTEGER,'
+                    ' github_mtime INTEGER,'
+                    ' follow INTEGER,'
+                    ' status TEXT,'
+                    ' repo TEXT,'
+                    ' branch TEXT,'
+                    ' jira TEXT,'
+                    ' summary TEXT,'
+                    ' jira_status TEXT,'
+                    ' jira_ttl REAL,'
+                    ' assignee TEXT,'
+                    ' priority TEXT,'
+                    ' fix_versions TEXT,'
+                    ' pr_status TEXT'
+                    ')'
+                )
+                conn.execute(
+                    'CREATE TABLE trigrams ('
+                    ' trigram TEXT,'
+                    ' name TEXT,'
+                    ' fields INTEGER,'
+                    ' PRIMARY KEY (trigram, name)'
+                    ') WITHOUT ROWID'
+                )
+                conn.execute('CREATE INDEX trigrams_name ON trigrams (name)')
+                conn.execute(f'PRAGMA user_version = {_SCHEMA_VERSION}')
+        _local.connection = conn
+    return _local.connection
+
+
+def _warn(name, exc):
+    warning(f'Error fetching Facet({name}): {type(exc).__name__}({exc})')
@@ -1,7 +1,7 @@
-from clint.textui import colored
-
+from facet import settings
 from facet.core import Status
 from facet.utils import default_color
+from facet.utils import get_auth
 
 
 JIRA_STATUS2STATUS = {
@@ -16,6 +16,16 @@ JIRA_STATUS2STATUS = {
 }
 
 
+def api_url(resource):
+    return ("{protocol}://{username}:{password}@{host}"
+            "/rest/api/latest/{resource}".format(
+                protocol=settings.JIRA_PROTOCOL,
+                host=settings.JIRA_HOST,
+                resource=resource,
+                **get_auth()
+            ))
+
+
 class JiraIssue:
     def __init__(self, json):
         self.json = json
@@ -28,6 +38,23 @@ class JiraIssue:
     def jira_status(self):
         return self.json['fields']['status']['name']
 
+    @property
+    def assignee(self):
+        assignee = self.json['fields'].get('assignee')
+        if not assignee:
+            return None
+        return assignee.get('displayName') or assignee.get('name')
+
+    @property
+    def priority(self):
+        priority = self.json['fields'].get('priority')
+        return priority.get('name') if priority else None
+
+    @property
+    def fix_versions(self):
+        return [version['name']
+                for version in self.json['fields'].get('fixVersions') or []]
+
     @property
     def status(self):
         return JIRA_STATUS2STATUS[self.jira_status]
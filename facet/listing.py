@@ -0,0 +1,92 @@
+"""
+In-process listing of the facets directory.
+
+The directory is read once per process with os.scandir, and the result is
+kept up to date by the functions here that change it, so that callers can ask
+for facet names repeatedly without touching the file system again.
+"""
+import os
+from os import path
+
+from facet import settings
+
+
+# {name: mtime_ns} of entries in FACETS_DIR, or None if not yet read.
+_mtimes = None
+
+
+def get_names():
+    """
+    Return facet names, most recently modified first.
+
+    Ties are broken by name, as `ls -t` does.
+    """
+    mtimes = _get_mtimes()
+    return sorted(mtimes, key=lambda name: (-mtimes[name], name))
+
+
+def get_name_set():
+    """
+    Return the set of facet names, without reading their mtimes if they are
+    not already known.
+    """
+    if _mtimes is not None:
+        return set(_mtimes)
+    with os.scandir(settings.FACETS_DIR) as entries:
+        return {entry.name for entry in entries
+                if not entry.name.startswith('.')}
+
+
+def get_mtime(name):
+    """
+    Return the mtime (in nanoseconds) of the directory of facet `name`.
+    """
+    if _mtimes is not None and name in _mtimes:
+        return _mtimes[name]
+    return _lstat(name).st_mtime_ns
+
+
+def exists(name):
+    if not name or name.startswith('.') or '/' in name:
+        return False
+    if _mtimes is not None:
+        return name in _mtimes
+    try:
+        _lstat(name)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def touch(name):
+    """
+    Update the mtime of facet `name`, making it the most recent.
+    """
+    os.utime(path.join(settings.FACETS_DIR, name))
+    if _mtimes is not None:
+        _mtimes[name] = _lstat(name).st_mtime_ns
+
+
+def invalidate():
+    """
+    Forget the cached listing, after creating or removing a facet.
+    """
+    global _mtimes
+    _mtimes = None
+
+
+def _get_mtimes():
+    global _mtimes
+    if _mtimes is None:
+        mtimes = {}
+        with os.scandir(settings.FACETS_DIR) as entries:
+            for entry in entries:
+                if not entry.name.startswith('.'):
+                    stat = entry.stat(follow_symlinks=False)
+                    mtimes[entry.name] = stat.st_mtime_ns
+        _mtimes = mtimes
+    return _mtimes
+
+
+def _lstat(name):
+    return os.lstat(path.join(settings.FACETS_DIR, name))
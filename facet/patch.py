@@ -0,0 +1,151 @@
+"""
+Patches to facet configs.
+
+A patch is either a JSON object, or a JSON Patch document (RFC 6902): a list
+of operations. An object supplies defaults: each of its keys is added to the
+config where missing, recursively for nested objects, and existing values
+are kept.
+"""
+import copy
+
+
+class PatchError(ValueError):
+    pass
+
+
+def apply(config, patch):
+    """
+    Return a copy of `config` with `patch` applied.
+    """
+    config = copy.deepcopy(config)
+    if isinstance(patch, dict):
+        return merge_defaults(config, patch)
+    elif isinstance(patch, list):
+        return apply_json_patch(config, patch)
+    else:
+        raise PatchError(f'Patch must be an object or a list: {patch!r}')
+
+
+def merge_defaults(config, defaults):
+    """
+    Add the keys of `defaults` missing from `config`, recursively, modifying
+    `config` in place. Return `config`.
+    """
+    for key, value in defaults.items():
+        if key not in config:
+            config[key] = copy.deepcopy(value)
+        elif isinstance(config[key], dict) and isinstance(value, dict):
+            merge_defaults(config[key], value)
+    return config
+
+
+def apply_json_patch(doc, operations):
+    """
+    Apply JSON Patch `operations` to `doc`, modifying it in place where
+    possible. Return the patched document.
+    """
+    for operation in operations:
+        try:
+            op = operation['op']
+            pointer = operation['path']
+        except (KeyError, TypeError):
+            raise PatchError(f'Invalid operation: {operation!r}')
+        if op == 'add':
+            doc = _add(doc, pointer, _value(operation))
+        elif op == 'remove':
+            doc = _remove(doc, pointer)
+        elif op == 'replace':
+            doc = _remove(doc, pointer)
+            doc = _add(doc, pointer, _value(operation))
+        elif op == 'move':
+            value = _get(doc, _from(operation))
+            doc = _remove(doc, _from(operation))
+            doc = _add(doc, pointer, value)
+        elif op == 'copy':
+            value = copy.deepcopy(_get(doc, _from(operation)))
+            doc = _add(doc, pointer, value)
+        elif op == 'test':
+            if _get(doc, pointer) != _value(operation):
+                raise PatchError(f'Test failed: {operation!r}')
+        else:
+            raise PatchError(f'Unknown operation: {op!r}')
+    return doc
+
+
+def _value(operation):
+    try:
+        return copy.deepcopy(operation['value'])
+    except KeyError:
+        raise PatchError(f'Operation has no value: {operation!r}')
+
+
+def _from(operation):
+    try:
+        return operation['from']
+    except KeyError:
+        raise PatchError(f'Operation has no from: {operation!r}')
+
+
+def _parse_pointer(pointer):
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise PatchError(f'Invalid JSON pointer: {pointer!r}')
+    return [token.replace('~1', '/').replace('~0', '~')
+            for token in pointer[1:].split('/')]
+
+
+def _resolve(doc, tokens, pointer):
+    for token in tokens:
+        try:
+            if isinstance(doc, list):
+                doc = doc[int(token)]
+            else:
+                doc = doc[token]
+        except (KeyError, IndexError, ValueError, TypeError):
+            raise PatchError(f'Path not found: {pointer!r}')
+    return doc
+
+
+def _get(doc, pointer):
+    return _resolve(doc, _parse_pointer(pointer), pointer)
+
+
+def _add(doc, pointer, value):
+    tokens = _parse_pointer(pointer)
+    if not tokens:
+        return value
+    parent = _resolve(doc, tokens[:-1], pointer)
+    key = tokens[-1]
+    if isinstance(parent, list):
+        if key == '-':
+            parent.append(value)
+        else:
+            try:
+                index = int(key)
+            except ValueError:
+                raise PatchError(f'Invalid array index: {pointer!r}')
+            if not 0 <= index <= len(parent):
+                raise PatchError(f'Path not found: {pointer!r}')
+            parent.insert(index, value)
+    elif isinstance(parent, dict):
+        parent[key] = value
+    else:
+        raise PatchError(f'Path not found: {pointer!r}')
+    return doc
+
+
+def _remove(doc, pointer):
+    tokens = _parse_pointer(pointer)
+    if not tokens:
+        return None
+    parent = _resolve(doc, tokens[:-1], pointer)
+    key = tokens[-1]
+    try:
+        if isinstance(parent, list):
+            del parent[int(key)]
+        else:
+            del parent[key]
+    except (KeyError, IndexError, ValueError, TypeError):
+        raise PatchError(f'Path not found: {pointer!r}')
+    return doc
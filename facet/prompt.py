@@ -0,0 +1,83 @@
+"""
+The current facet, for shell prompts.
+
+PROMPT_FILE holds one line describing the current facet, with tab-separated
+fields name, status and JIRA summary. It is rewritten whenever the current
+facet changes, or its config, JIRA data or pull request is written, so that
+rendering a prompt only has to read it.
+
+Reading the file is the prompt's whole latency budget: the facet_prompt
+shell function printed by `facet shell-init` reads it with shell builtins,
+in well under 5ms, and `python -m facet.prompt` reads it without importing
+anything beyond the standard library's os and facet.settings. `facet prompt`
+does the same after facet's usual startup.
+"""
+import os
+from os import path
+
+from facet import settings
+
+
+PROMPT_FILE = path.join(settings.FACET_DIR, 'prompt.tsv')
+
+
+def update(facet):
+    """
+    Rewrite PROMPT_FILE for `facet`, the current facet, or None if there is
+    none.
+    """
+    from facet import storage
+
+    if facet is None:
+        try:
+            os.remove(PROMPT_FILE)
+        except FileNotFoundError:
+            pass
+        return
+    from facet.core import get_entry_status
+    from facet.utils import format_tsv
+
+    entry = facet.entry
+    status = get_entry_status(entry)
+    storage.write(PROMPT_FILE, format_tsv([
+        entry.name,
+        status.name if status else None,
+        entry.summary,
+    ]) + '\n')
+
+
+def read():
+    """
+    Return the fields of PROMPT_FILE: (name, status, summary), with None for
+    those that are empty, or None if there is no current facet.
+    """
+    try:
+        with open(PROMPT_FILE) as fp:
+            line = fp.readline().rstrip('\n')
+    except FileNotFoundError:
+        return None
+    if not line:
+        return None
+    fields = (line.split('\t') + ['', ''])[:3]
+    return tuple(field or None for field in fields)
+
+
+def format_segment(fields):
+    """
+    Return the prompt segment for `fields`, as returned by `read`: the
+    facet's name, followed by its status in parentheses.
+    """
+    if fields is None:
+        return ''
+    name, status, _ = fields
+    return f'{name} ({status})' if status else name
+
+
+def main():
+    segment = format_segment(read())
+    if segment:
+        print(segment)
+
+
+if __name__ == '__main__':
+    main()
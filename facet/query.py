@@ -0,0 +1,273 @@
+"""
+Selecting facets by their config and JIRA fields.
+
+A `--where` expression is a list of clauses joined by `and` and `or`, with
+`and` binding more tightly, e.g.
+
+    status=doing and repo~website or assignee=me
+
+A clause compares a field with a value: `=` and `!=` test equality, and `~`
+and `!~` a regular expression search; both are case-insensitive. Values may
+be quoted. fix_version matches if any of the issue's fix versions does.
+
+Config fields are name, repo, branch, follow and jira. JIRA fields are
+summary, jira_status, assignee, priority and fix_version. status is the
+JIRA issue's status for facets with JIRA data, and the configured status
+otherwise; the JIRA fields of a facet without JIRA data are empty, and can
+be tested with e.g. `jira_status=""`.
+
+Facets are first selected using only their configs, so that jira.json is
+read only for facets that may match, or that are to be displayed.
+"""
+import re
+from collections import namedtuple
+
+from facet import index
+from facet.core import Status
+from facet.core import get_entry_status
+
+
+CONFIG_FIELDS = ['name', 'repo', 'branch', 'follow', 'jira']
+JIRA_FIELDS = ['summary', 'jira_status', 'assignee', 'priority',
+               'fix_version']
+FIELDS = CONFIG_FIELDS + ['status'] + JIRA_FIELDS
+
+_ALIASES = {
+    'fixVersion': 'fix_version',
+    'fixVersions': 'fix_version',
+    'fix_versions': 'fix_version',
+}
+
+# Quoted strings, whitespace, and the words and stray quotes between them
+_TOKEN_RE = re.compile(r'"[^"]*"|\'[^\']*\'|\s+|[^\s"\']+|["\']')
+
+_CLAUSE_RE = re.compile(r'\s*(\w+)\s*(!=|!~|=|~)\s*(.*?)\s*$')
+
+Clause = namedtuple('Clause', ['field', 'op', 'value'])
+
+
+class QueryError(ValueError):
+    pass
+
+
+def parse_where(expression):
+    """
+    Return `expression` as a list of alternatives, each a list of Clauses
+    that must all hold.
+    """
+    alternatives = []
+    for alternative in _split(expression):
+        clauses = []
+        for clause in alternative:
+            match = _CLAUSE_RE.fullmatch(clause)
+            if not match:
+                raise QueryError(f'Invalid clause: {clause!r}')
+            field, op, value = match.groups()
+            field = _get_field(field)
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+                value = value[1:-1]
+            if '~' in op:
+                try:
+                    value = re.compile(value, re.IGNORECASE)
+                except re.error as ex:
+                    raise QueryError(f'Invalid regex in {clause!r}: {ex}')
+            clauses.append(Clause(field, op, value))
+        alternatives.append(clauses)
+    return alternatives
+
+
+def _split(expression):
+    """
+    Return the clauses of `expression` as lists of alternatives, split on
+    `and` and `or`, except within quoted values.
+    """
+    tokens = _TOKEN_RE.findall(expression.strip())
+    alternatives = [[[]]]
+    for i, token in enumerate(tokens):
+        if (token.lower() in {'and', 'or'} and 0 < i < len(tokens) - 1 and
+                tokens[i - 1].isspace() and tokens[i + 1].isspace()):
+            if token.lower() == 'or':
+                alternatives.append([[]])
+            else:
+                alternatives[-1].append([])
+        else:
+            alternatives[-1][-1].append(token)
+    return [[''.join(clause) for clause in alternative]
+            for alternative in alternatives]
+
+
+def parse_sort(fields):
+    """
+    Return comma-separated `fields`, each optionally prefixed with `-` for
+    descending order, as a list of (field, descending) pairs.
+    """
+    keys = []
+    for field in fields.split(','):
+        field = field.strip()
+        descending = field.startswith('-')
+        keys.append((_get_field(field.lstrip('-')), descending))
+    return keys
+
+
+def select(names, where=None, sort=None, limit=None, include_inactive=False):
+    """
+    Return index entries of the facets among `names` matching `where` (as
+    returned by `parse_where`), ordered by `sort` (as returned by
+    `parse_sort`) and then by the order of `names`, and at most `limit` of
+    them. Unless `include_inactive`, only followed facets are selected.
+    """
+    entries = index.get_entries(names, config_only=True)
+    if not include_inactive:
+        entries = [entry for entry in entries if entry.follow]
+    matches = [True] * len(entries)
+    if where:
+        matches = [_matches(entry, where) for entry in entries]
+        entries, matches = _compress(entries, matches,
+                                     [match is not False for match in matches])
+    sort_needs_jira = any(_needs_jira(field) for field, _ in sort or [])
+    if sort and not sort_needs_jira:
+        order = _sort(range(len(entries)), entries, sort)
+        entries = [entries[i] for i in order]
+        matches = [matches[i] for i in order]
+    if limit is not None and not sort_needs_jira:
+        # Keep entries up to the limit-th certain match.
+        certain = 0
+        for i, match in enumerate(matches):
+            certain += bool(match)
+            if certain == limit:
+                entries, matches = entries[:i + 1], matches[:i + 1]
+                break
+
+    # Read JIRA data of the remaining facets that need it.
+    partial = [entry.name for entry in entries
+               if entry.jira and entry.jira_mtime is None]
+    if partial:
+        complete = {entry.name: entry
+                    for entry in index.get_entries(partial)}
+        entries = [complete.get(entry.name, entry) for entry in entries]
+    if where:
+        entries = [entry for entry in entries
+                   if _matches(entry, where, jira_read=True)]
+    if sort and sort_needs_jira:
+        entries = [entries[i]
+                   for i in _sort(range(len(entries)), entries, sort,
+                                  jira_read=True)]
+    if limit is not None:
+        entries = entries[:limit]
+    return entries
+
+
+def _compress(entries, matches, selectors):
+    return ([entry for entry, keep in zip(entries, selectors) if keep],
+            [match for match, keep in zip(matches, selectors) if keep])
+
+
+def _get_field(field):
+    field = _ALIASES.get(field, field)
+    if field not in FIELDS:
+        raise QueryError(f'Unknown field: {field!r} '
+                         f'(expected one of {", ".join(FIELDS)})')
+    return field
+
+
+def _needs_jira(field):
+    return field == 'status' or field in JIRA_FIELDS
+
+
+def _get_value(entry, field, jira_read=False):
+    """
+    Return `field` of `entry` as a list of strings, or None if it depends on
+    JIRA data that may not have been read. Unless `jira_read`, an entry
+    without jira_mtime may have been read without its jira.json; otherwise
+    the facet has no jira.json, and its JIRA fields are empty.
+    """
+    if (_needs_jira(field) and entry.jira and entry.jira_mtime is None and
+            not jira_read):
+        return None
+    if field == 'status':
+        status = get_entry_status(entry)
+        value = status.name if status else None
+    elif field == 'follow':
+        value = 'true' if entry.follow else 'false'
+    elif field == 'fix_version':
+        return (entry.fix_versions or '').split(', ')
+    else:
+        value = getattr(entry, field)
+    return ['' if value is None else str(value)]
+
+
+def _matches(entry, where, jira_read=False):
+    """
+    Return whether `entry` matches `where`, or None if that depends on JIRA
+    data that may not have been read (see `_get_value`).
+    """
+    result = False
+    for clauses in where:
+        alternative = True
+        for clause in clauses:
+            values = _get_value(entry, clause.field, jira_read)
+            if values is None:
+                alternative = None
+                continue
+            if '~' in clause.op:
+                matched = any(clause.value.search(value) for value in values)
+            else:
+                matched = any(value.casefold() == clause.value.casefold()
+                              for value in values)
+            if clause.op.startswith('!'):
+                matched = not matched
+            if not matched:
+                alternative = False
+                break
+        if alternative:
+            return True
+        if alternative is None:
+            result = None
+    return result
+
+
+def _sort(indices, entries, sort, jira_read=False):
+    """
+    Return `indices` of `entries`, sorted by `sort`.
+    """
+    # Sort by the least significant key first; Python's sort is stable.
+    for field, descending in reversed(sort):
+        indices = sorted(
+            indices,
+            key=lambda i: _sort_key(entries[i], field, descending,
+                                    jira_read),
+        )
+    return indices
+
+
+def _sort_key(entry, field, descending, jira_read):
+    # Missing values sort last in either direction.
+    [value, *_] = _get_value(entry, field, jira_read) or ['']
+    if field == 'priority':
+        value = _PRIORITIES.get(value.casefold(), value)
+    elif field == 'status' and value:
+        value = str(Status[value].value)
+    missing = value == ''
+    if descending and not missing:
+        return (missing, _Descending(value))
+    return (missing, value)
+
+
+# JIRA's default priorities, most urgent first
+_PRIORITIES = {
+    name: str(i) for i, name in
+    enumerate(['blocker', 'highest', 'critical', 'high', 'major', 'medium',
+               'minor', 'low', 'lowest', 'trivial'])
+}
+
+
+class _Descending:
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+    def __eq__(self, other):
+        return self.value == other.value
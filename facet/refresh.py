@@ -0,0 +1,176 @@
+"""
+Keep JIRA data fresh without making interactive commands wait for it.
+
+`ls` and `show` display the JIRA data already on disk. Facets whose data is
+older than its time-to-live are then refreshed by a detached
+`python -m facet.refresh` process, which holds LOCK_FILE while it runs so
+that concurrent commands don't request the same issues.
+
+A facet's TTL is its `jira_ttl` config value if set, otherwise the entry in
+JIRA_TTL_BY_STATUS for its status, otherwise JIRA_TTL (all in seconds). The
+age of its data is the time since it was last fetched, as recorded in
+SYNC_FILE, or else the age of its jira.json. Each refresh is also recorded
+in SYNC_FILE when it starts, and a facet is not refreshed again within
+JIRA_REFRESH_RETRY_INTERVAL seconds, so that commands don't start a refresh
+each time while JIRA is unreachable. The refresh process never prompts for
+credentials.
+"""
+import os
+import json
+import subprocess
+import sys
+import time
+from os import path
+
+from facet import settings
+from facet import storage
+
+
+SYNC_FILE = path.join(settings.FACET_DIR, 'jira-sync.json')
+LOCK_FILE = path.join(settings.FACET_DIR, 'jira-refresh.lock')
+
+
+def get_ttl(entry):
+    """
+    Return the number of seconds for which the JIRA data of the facet with
+    index entry `entry` is considered fresh.
+    """
+    if entry.jira_ttl is not None:
+        return entry.jira_ttl
+    from facet.core import get_entry_status
+
+    status = get_entry_status(entry)
+    return settings.JIRA_TTL_BY_STATUS.get(status.name if status else None,
+                                           settings.JIRA_TTL)
+
+
+def get_expired(entries, now=None):
+    """
+    Return the names of the facets among index entries `entries` whose JIRA
+    data has outlived its TTL.
+
+    Facets without JIRA data on disk, and those whose refresh was attempted
+    in the last JIRA_REFRESH_RETRY_INTERVAL seconds, are not included.
+    """
+    if now is None:
+        now = time.time()
+    # jira.json is only rewritten when its content changes, so it can be
+    # older than the last fetch; the sync records are only read for facets
+    # whose jira.json looks expired.
+    candidates = [entry for entry in entries
+                  if entry.jira and entry.jira_mtime is not None and
+                  now - entry.jira_mtime / 1e9 > get_ttl(entry)]
+    if not candidates:
+        return []
+    sync = read_sync_records()
+    return [entry.name for entry in candidates
+            if now - sync.get(entry.name, {}).get('synced_at', 0) >
+            get_ttl(entry) and
+            now - sync.get(entry.name, {}).get('attempted_at', 0) >
+            settings.JIRA_REFRESH_RETRY_INTERVAL]
+
+
+def refresh_in_background(entries):
+    """
+    Start a detached process to refresh expired JIRA data among `entries`,
+    unless one is already running.
+    """
+    if not settings.JIRA_BACKGROUND_REFRESH:
+        return
+    names = get_expired(entries)
+    if not names:
+        return
+    from facet import daemon
+
+    if daemon.serving:
+        daemon.expired.extend(names)
+    else:
+        start(names)
+
+
+def start(names):
+    """
+    Start a detached process to refresh the JIRA data of the facets `names`,
+    unless one is already running.
+    """
+    lock = _lock()
+    if lock is None:
+        return
+    lock.close()
+    subprocess.Popen(
+        [sys.executable, '-m', 'facet.refresh'] + names,
+        env=dict(os.environ, FACET_NO_PROMPT='1'),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def read_sync_records():
+    try:
+        with open(SYNC_FILE) as fp:
+            return json.load(fp)
+    except FileNotFoundError:
+        return {}
+
+
+def update_sync_records(records):
+    """
+    Store `records` ({facet name: sync record}) in SYNC_FILE, keeping those
+    of other facets, which concurrent fetches may have updated.
+    """
+    storage.update_json(SYNC_FILE, lambda sync: sync.update(records))
+
+
+def _record_attempt(names):
+    now = time.time()
+
+    def update(sync):
+        for name in names:
+            sync.setdefault(name, {})['attempted_at'] = now
+
+    storage.update_json(SYNC_FILE, update)
+
+
+def _lock():
+    """
+    Return LOCK_FILE opened and exclusively locked, or None if another
+    process holds the lock.
+    """
+    import fcntl
+
+    fp = open(LOCK_FILE, 'w')
+    try:
+        fcntl.flock(fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        fp.close()
+        return None
+    return fp
+
+
+def main(names):
+    from facet import completion
+    from facet import fetch
+    from facet import index
+    from facet.core import Facet
+
+    lock = _lock()
+    if lock is None:
+        return
+    with lock:
+        # Another process may have refreshed some of these since they were
+        # found to be expired.
+        entries = index.get_entries(name for name in names
+                                    if Facet(name=name).exists())
+        expired = set(get_expired(entries))
+        facets = [Facet(name=entry.name, entry=entry)
+                  for entry in entries if entry.name in expired]
+        if facets:
+            _record_attempt([facet.name for facet in facets])
+            fetch.fetch_facets(facets, changed_only=True)
+            completion.update()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
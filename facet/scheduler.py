@@ -0,0 +1,113 @@
+"""
+Bounded-concurrency HTTP requests with timeouts and retries.
+
+All requests made by `facet fetch` go through a Scheduler. It limits the
+number in flight, and applies a timeout to each one. It retries rate-limited,
+unavailable and timed-out requests with exponential back-off and jitter,
+honouring any Retry-After header.
+"""
+import asyncio
+import random
+import time
+from collections import namedtuple
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+
+from facet import settings
+
+
+Response = namedtuple('Response', ['status', 'headers', 'json'])
+
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class Scheduler:
+
+    def __init__(self, session, max_in_flight=None, request_timeout=None,
+                 max_retries=None, backoff_base=None, backoff_max=None):
+        self.session = session
+        self.max_in_flight = max_in_flight or settings.FETCH_MAX_IN_FLIGHT
+        self.request_timeout = (request_timeout or
+                                settings.FETCH_REQUEST_TIMEOUT)
+        self.max_retries = (settings.FETCH_MAX_RETRIES
+                            if max_retries is None else max_retries)
+        self.backoff_base = (settings.FETCH_BACKOFF_BASE
+                             if backoff_base is None else backoff_base)
+        self.backoff_max = (settings.FETCH_BACKOFF_MAX
+                            if backoff_max is None else backoff_max)
+        self.retries = 0
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+    async def get_json(self, url, **kwargs):
+        """
+        GET `url`, retrying as necessary, and return a Response.
+
+        The body is decoded as JSON unless the status is 304. Other non-2xx
+        statuses raise aiohttp.ClientResponseError once retries are
+        exhausted, and asyncio.TimeoutError is raised if the last attempt
+        timed out.
+        """
+        return await self.request_json('GET', url, **kwargs)
+
+    async def post_json(self, url, **kwargs):
+        """
+        POST to `url`, retrying as `get_json` does, and return a Response.
+        """
+        return await self.request_json('POST', url, **kwargs)
+
+    async def request_json(self, method, url, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    response = await asyncio.wait_for(
+                        self._request_json(method, url, **kwargs),
+                        self.request_timeout,
+                    )
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError):
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+            except aiohttp.ClientResponseError as ex:
+                if (ex.status not in RETRY_STATUSES or
+                        attempt >= self.max_retries):
+                    raise
+                delay = max(self._backoff(attempt),
+                            _parse_retry_after(ex.headers))
+            else:
+                return response
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    async def _request_json(self, method, url, **kwargs):
+        async with self.session.request(method, url, **kwargs) as resp:
+            if resp.status == 304:
+                return Response(resp.status, resp.headers, None)
+            resp.raise_for_status()
+            return Response(resp.status, resp.headers, await resp.json())
+
+    def _backoff(self, attempt):
+        """
+        Return a delay drawn uniformly from [0, base * 2**attempt], capped.
+        """
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+def _parse_retry_after(headers):
+    """
+    Return the delay in seconds requested by a Retry-After header, or 0.
+    """
+    value = (headers or {}).get('Retry-After')
+    if not value:
+        return 0
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0
@@ -0,0 +1,91 @@
+"""
+Fuzzy search of facets by name, JIRA key and JIRA summary.
+
+A facet matches a query by the fraction of the query's trigrams (see
+`index.get_trigrams`) found in its name, JIRA key or summary, so that words
+may be abbreviated, misspelt or given in any order. Trigrams are looked up
+in the index, which is updated whenever facet writes a facet's files; facets
+whose files were changed by other means are re-indexed by the next command
+that reads every facet, such as ls.
+"""
+import math
+import re
+from collections import defaultdict
+from collections import namedtuple
+
+from facet import index
+from facet import listing
+
+
+# Fraction of a query's trigrams that a facet must have to match
+THRESHOLD = 0.5
+
+Match = namedtuple('Match', ['name', 'score'])
+
+
+def find(query, limit=None):
+    """
+    Return up to `limit` Matches for `query`, best first.
+
+    Matches with equal scores are ordered by whether the query's words are
+    those of the facet's name, whether they occur in the name, how many of
+    the query's trigrams are in the name or JIRA key, the length of the name
+    and then recency.
+    """
+    return [match for _, match in _rank(query, limit)[:limit]]
+
+
+def resolve(query):
+    """
+    Return the names of the facets that best match `query`: one name if the
+    best match is unique, none if nothing matches.
+
+    Facets are equally good matches if they have the same score, and the
+    query's words are, or occur in, the names of both or neither.
+    """
+    ranked = _rank(query, limit=1)
+    return [match.name for key, match in ranked
+            if key[:3] == ranked[0][0][:3]]
+
+
+def _rank(query, limit=None):
+    """
+    Return [(key, Match)] for the facets matching `query`, sorted by key, or
+    at least the best `limit` of them.
+    """
+    trigrams = index.get_trigrams(query)
+    if not trigrams:
+        return []
+    names = listing.get_name_set()
+    _index_new_facets(names)
+    query = _normalize(query)
+
+    # Only the facets with the most matched trigrams need the rest of their
+    # keys computed.
+    by_matched = defaultdict(list)
+    for row in index.match_trigrams(
+            trigrams, min_matched=math.ceil(THRESHOLD * len(trigrams))):
+        if row[0] in names:
+            by_matched[row[2]].append(row)
+    ranked = []
+    for matched in sorted(by_matched, reverse=True):
+        if limit is not None and len(ranked) >= limit:
+            break
+        group = []
+        for name, mtime, matched, matched_in_name in by_matched[matched]:
+            normalized = _normalize(name)
+            key = (-matched, normalized != query, query not in normalized,
+                   -matched_in_name, len(name), -mtime, name)
+            group.append((key, Match(name, matched / len(trigrams))))
+        ranked.extend(sorted(group))
+    return ranked
+
+
+def _normalize(text):
+    return ' '.join(re.findall(r'[^\W_]+', text.casefold()))
+
+
+def _index_new_facets(names):
+    new = names - set(index.get_names())
+    if new:
+        index.get_entries(sorted(new))
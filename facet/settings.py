@@ -1,8 +1,7 @@
 from os import environ
 from os import getenv
 from os import path
-
-import yaml
+from os import stat
 
 
 FACET_DIR = path.expanduser(environ.get('FACET_DIRECTORY', '~/.facet'))
@@ -10,30 +9,119 @@ FACETS_DIR = path.join(FACET_DIR, 'facets')
 JIRA_AUTH_FILE = path.join(FACET_DIR, 'auth.yaml')
 LOCAL_SETTINGS_FILE = path.join(FACET_DIR, 'settings.yaml')
 
-NOTES_FILE_NAME = 'notes.txt'
-
-# Set these in LOCAL_SETTINGS_FILE
-JIRA_HOST = None
-GITHUB_REPO_URL = None
-DEFAULT_REPO = None
-
-# Path to a file that facet can write shell commands to and delete. If setting
-# this, you must arrange for your shell to source the file when generating its
-# prompt, i.e. in $PROMPT_COMMAND in bash
-PROMPT_COMMANDS_FILE = None
-
-# Import local settings
-if path.exists(LOCAL_SETTINGS_FILE):
-    with open(LOCAL_SETTINGS_FILE) as fp:
-        locals().update(yaml.load(fp))
-
-for path_var in [
-        'DEFAULT_REPO',
-        'PROMPT_COMMANDS_FILE',
-]:
-    path_val = locals()[path_var]
-    if path_val:
-        locals()[path_var] = path.expanduser(path_val)
-
-if locals()['DEFAULT_REPO'].endswith('website') and getenv('WEBSITE'):
-    locals()['DEFAULT_REPO'] += '-' + getenv('WEBSITE')
+# Settings below here may be overridden in LOCAL_SETTINGS_FILE. That file is
+# only read when one of them is first accessed, so that commands which don't
+# need them don't pay for parsing it.
+_DEFAULTS = {
+    'NOTES_FILE_NAME': 'notes.txt',
+
+    # Set these in LOCAL_SETTINGS_FILE
+    'JIRA_HOST': None,
+    'GITHUB_REPO_URL': None,
+    'DEFAULT_REPO': None,
+
+    'JIRA_PROTOCOL': 'https',
+
+    # Number of issues requested by each JIRA search in `facet fetch`
+    'JIRA_SEARCH_BATCH_SIZE': 50,
+
+    # Limits for HTTP requests made by `facet fetch`. Timeouts are in seconds.
+    'FETCH_MAX_IN_FLIGHT': 8,
+    'FETCH_REQUEST_TIMEOUT': 30,
+    'FETCH_TOTAL_TIMEOUT': 300,
+    'FETCH_MAX_RETRIES': 4,
+    'FETCH_BACKOFF_BASE': 0.5,
+    'FETCH_BACKOFF_MAX': 30,
+
+    # Seconds for which fetched JIRA data is used before `ls` and `show`
+    # refresh it in the background, by facet status. A facet's `jira_ttl`
+    # config value overrides these.
+    'JIRA_TTL': 60 * 60,
+    'JIRA_TTL_BY_STATUS': {
+        'todo': 60 * 60,
+        'doing': 10 * 60,
+        'under_review': 10 * 60,
+        'done': 7 * 24 * 60 * 60,
+    },
+    'JIRA_BACKGROUND_REFRESH': True,
+    # Seconds after a background refresh of a facet is attempted before
+    # another is, should it fail, e.g. while JIRA is down
+    'JIRA_REFRESH_RETRY_INTERVAL': 10 * 60,
+
+    # Number of threads reading the files of facets missing from the index,
+    # e.g. on the first ls
+    'INDEX_READ_JOBS': 8,
+
+    # `facet fetch` looks up pull requests of facet branches through this
+    # GitHub GraphQL API endpoint, if it has a token. The token may also be
+    # given by $GITHUB_TOKEN.
+    'GITHUB_API_URL': 'https://api.github.com/graphql',
+    'GITHUB_TOKEN': None,
+
+    # Path to a file that facet can write shell commands to and delete. If
+    # setting this, you must arrange for your shell to source the file when
+    # generating its prompt, i.e. in $PROMPT_COMMAND in bash. Not needed with
+    # the shell function printed by `facet shell-init`.
+    'PROMPT_COMMANDS_FILE': None,
+}
+
+
+def __getattr__(name):
+    if name not in _DEFAULTS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    globals().update(_read_local_settings())
+    return globals()[name]
+
+
+def _read_local_settings():
+    settings = dict(_DEFAULTS)
+
+    # Import local settings
+    if path.exists(LOCAL_SETTINGS_FILE):
+        settings.update(_load_local_settings_file())
+
+    for path_var in [
+            'DEFAULT_REPO',
+            'PROMPT_COMMANDS_FILE',
+    ]:
+        path_val = settings[path_var]
+        if path_val:
+            settings[path_var] = path.expanduser(path_val)
+
+    if ((settings['DEFAULT_REPO'] or '').endswith('website') and
+            getenv('WEBSITE')):
+        settings['DEFAULT_REPO'] += '-' + getenv('WEBSITE')
+
+    if not settings['GITHUB_TOKEN']:
+        settings['GITHUB_TOKEN'] = getenv('GITHUB_TOKEN')
+
+    return settings
+
+
+def _load_local_settings_file():
+    """
+    Return the contents of LOCAL_SETTINGS_FILE, which are cached on disk
+    until it changes, so that YAML needn't be imported to read them. Settings
+    that JSON can't represent as they are, e.g. dates, are not cached.
+    """
+    import json
+
+    from facet.cache import Cache
+
+    file_stat = stat(LOCAL_SETTINGS_FILE)
+    key = (file_stat.st_mtime_ns, file_stat.st_size)
+    cache = Cache(maxsize=1, name='settings')
+    local_settings = cache.get(key)
+    if local_settings is None:
+        from facet.utils import load_yaml
+
+        with open(LOCAL_SETTINGS_FILE) as fp:
+            local_settings = load_yaml(fp) or {}
+        try:
+            is_lossless = (json.loads(json.dumps(local_settings)) ==
+                           local_settings)
+        except (TypeError, ValueError):
+            is_lossless = False
+        if is_lossless:
+            cache.set(key, local_settings)
+    return local_settings
@@ -0,0 +1,77 @@
+"""
+Integration with the user's shell.
+
+`facet shell-init SHELL` prints a shell function named facet, to be
+evaluated in the shell's startup file. The function runs the facet command
+with FACET_SHELL_FD set to a file descriptor on which facet writes
+directives for the shell, one per line, as a name and an argument separated
+by a tab. The function reads them once facet has exited, and applies them
+in the calling shell:
+
+  cd DIRECTORY       change directory
+
+It also prints a facet_prompt function, which prints the current facet and
+its status, as `facet prompt` does, by reading facet.prompt.PROMPT_FILE, for
+use in a prompt, e.g. PS1='$(facet_prompt) \\w\\$ '.
+
+Without the function, facet changes directory by writing commands to
+settings.PROMPT_COMMANDS_FILE for the shell to source, if set, and otherwise
+by starting a new shell in the directory.
+"""
+import os
+
+
+SHELLS = ['bash', 'zsh']
+
+# The directives are read from fd 3, while the function's stdout is kept on
+# fd 4 for facet's output.
+_FUNCTION = r'''facet() {
+    local __facet_directives __facet_status __facet_directive __facet_arg
+    {
+        __facet_directives=$(FACET_SHELL_FD=3 command facet "$@" \
+            3>&1 1>&4 4>&-)
+        __facet_status=$?
+    } 4>&1
+    while IFS=$'\t' read -r __facet_directive __facet_arg; do
+        case $__facet_directive in
+            cd) cd -- "$__facet_arg" ;;
+        esac
+    done <<< "$__facet_directives"
+    return $__facet_status
+}
+
+facet_prompt() {
+    local __facet_name __facet_status __facet_summary
+    IFS=$'\t' read -r __facet_name __facet_status __facet_summary \
+        < "${FACET_DIRECTORY:-$HOME/.facet}/prompt.tsv" 2>/dev/null ||
+        return 0
+    printf '%s' "$__facet_name${__facet_status:+ ($__facet_status)}"
+}
+'''
+
+
+def get_init_script(shell):
+    """
+    Return the code that `shell` should evaluate to define the facet
+    function.
+    """
+    if shell not in SHELLS:
+        raise ValueError(f'Unsupported shell: {shell} '
+                         f'(expected one of {", ".join(SHELLS)})')
+    return _FUNCTION
+
+
+def write_directive(name, arg):
+    """
+    Send a directive to the shell function, returning False if facet was not
+    run by it.
+    """
+    fd = os.environ.get('FACET_SHELL_FD')
+    # Directives are not escaped, so they cannot contain tabs or newlines.
+    if not fd or {'\t', '\n'} & set(arg):
+        return False
+    try:
+        os.write(int(fd), os.fsencode(f'{name}\t{arg}\n'))
+    except (ValueError, OSError):
+        return False
+    return True
@@ -1,24 +1,37 @@
 import json
+import os
 from os import path
 
 from facet import settings
-from facet.utils import dump_json
+from facet import storage
 
 
 _FILE = path.join(settings.FACET_DIR, "state.json")
 
+# ((mtime, size), state) as last read from _FILE
+_cache = None
+
 
 def read(key=None):
-    try:
-        with open(_FILE) as fp:
-            state = json.load(fp)
-    except FileNotFoundError:
-        state = {}
-    return state.get(key) if key is not None else state
+    state = _read()
+    return state.get(key) if key is not None else dict(state)
 
 
 def write(**kwargs):
-    state = read()
-    state.update(kwargs)
-    with open(_FILE, 'w') as fp:
-        return dump_json(state, fp)
+    storage.update_json(_FILE, lambda state: state.update(kwargs))
+
+
+def _read():
+    global _cache
+    try:
+        stat = os.stat(_FILE)
+    except FileNotFoundError:
+        return {}
+    key = (stat.st_mtime_ns, stat.st_size)
+    if _cache is None or _cache[0] != key:
+        try:
+            with open(_FILE) as fp:
+                _cache = (key, json.load(fp))
+        except FileNotFoundError:
+            return {}
+    return _cache[1]
@@ -0,0 +1,99 @@
+"""
+Safe updates of the files facet stores.
+
+Files are replaced atomically: the new contents are written to a temporary
+file in the same directory, with the target's permissions (or the default
+ones, for a new file), and synced to disk, before it is renamed over the
+target, so that readers never see a partially written file, even after a
+crash. Read-modify-write cycles hold an exclusive fcntl lock on the file's
+directory, so that concurrent facet processes don't lose each other's
+updates. `update_json` applies any number of changes to a file with a single
+write.
+"""
+import json
+import os
+from contextlib import contextmanager
+from os import path
+
+from facet.utils import format_json
+
+
+def write(file, text, keep_directory_mtime=False, mode=None):
+    """
+    Replace the contents of `file` with `text`.
+
+    If `keep_directory_mtime`, the mtime of the directory containing `file`
+    is left as it was, since facet directory mtimes order `facet ls`. The
+    file's permissions are `mode`, if given, and are otherwise kept.
+    """
+    import tempfile
+
+    directory, name = path.split(file)
+    if keep_directory_mtime:
+        stat = os.stat(directory)
+    if mode is None:
+        mode = _get_mode(file)
+    fd, tmp_file = tempfile.mkstemp(dir=directory, prefix=f'.{name}.')
+    try:
+        os.fchmod(fd, mode)
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(text)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_file, file)
+    except BaseException:
+        os.unlink(tmp_file)
+        raise
+    if keep_directory_mtime:
+        os.utime(directory, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def _get_mode(file):
+    try:
+        return os.stat(file).st_mode & 0o7777
+    except FileNotFoundError:
+        # The umask can only be read by setting it.
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+@contextmanager
+def lock(file):
+    """
+    Hold an exclusive lock for `file`, blocking until it is available.
+
+    The lock is taken on the directory containing `file`, which is not
+    modified by locking it, and which survives `file` being replaced. Locks
+    are advisory, and must not be nested for files in the same directory.
+    """
+    import fcntl
+
+    fd = os.open(path.dirname(path.abspath(file)), os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def update_json(file, update, mode=None):
+    """
+    Apply `update` to the JSON object stored in `file`, under its lock, and
+    return the result.
+
+    `update` is called with the current object ({} if `file` does not
+    exist), which it modifies in place. The file is only written if the
+    object changed, with permissions `mode` if given.
+    """
+    with lock(file):
+        try:
+            with open(file) as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            data = {}
+        original = json.loads(json.dumps(data))
+        update(data)
+        if data != original:
+            write(file, format_json(data), mode=mode)
+    return data
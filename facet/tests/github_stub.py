@@ -0,0 +1,54 @@
+"""
+A local stand-in for the GitHub GraphQL API, served from a background thread.
+"""
+import re
+
+from aiohttp import web
+
+from facet.benchmarks.jira_stub import JiraStub
+
+
+def make_pull_request(number, state='OPEN', is_draft=False, merged=False,
+                      ci_status='SUCCESS'):
+    return {
+        'number': number,
+        'url': f'https://github.com/owner/repo/pull/{number}',
+        'state': state,
+        'isDraft': is_draft,
+        'reviewDecision': None,
+        'merged': merged,
+        'commits': {'nodes': [
+            {'commit': {'statusCheckRollup': {'state': ci_status}}},
+        ]},
+    }
+
+
+class GithubStub(JiraStub):
+    """
+    Serve `pull_requests` ({('OWNER/NAME', branch): pull request node})
+    through the GraphQL endpoint, answering the pullRequests queries that
+    facet makes.
+
+    Requests are recorded in `requests` as in JiraStub, and the variables of
+    each query in `queries`.
+    """
+
+    def __init__(self, pull_requests=None, **kwargs):
+        super().__init__(**kwargs)
+        self.pull_requests = dict(pull_requests or {})
+
+    def _add_routes(self, app):
+        app.router.add_post('/graphql', self._graphql)
+
+    async def _graphql(self, request):
+        self.requests.append(request.path)
+        body = await request.json()
+        variables = body['variables']
+        self.queries.append(variables)
+        repo = f'{variables["owner"]}/{variables["name"]}'
+        repository = {}
+        for alias, variable in re.findall(
+                r'(\w+): pullRequests\(headRefName: \$(\w+)', body['query']):
+            pr = self.pull_requests.get((repo, variables[variable]))
+            repository[alias] = {'nodes': [pr] if pr else []}
+        return web.json_response({'data': {'repository': repository}})
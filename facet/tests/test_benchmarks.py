@@ -0,0 +1,65 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from docopt import docopt
+
+from facet.benchmarks import __main__ as benchmarks_main
+from facet.benchmarks.scenarios import SCENARIOS
+from facet.benchmarks.scenarios import compare
+from facet.benchmarks.scenarios import run_benchmarks
+from facet.benchmarks.tree import make_tree
+
+
+class TestBenchmarks(TestCase):
+
+    def test_make_tree(self):
+        facet_dir = os.path.join(tempfile.mkdtemp(), 'facet')
+        self.addCleanup(shutil.rmtree, os.path.dirname(facet_dir))
+
+        issues = make_tree(facet_dir, 20, jira_fraction=0.5)
+
+        facets_dir = os.path.join(facet_dir, 'facets')
+        self.assertEqual(len(os.listdir(facets_dir)), 20)
+        jira_facets = [name for name in os.listdir(facets_dir)
+                       if os.path.exists(os.path.join(facets_dir, name,
+                                                      'jira.json'))]
+        self.assertEqual(sorted(issue['key'] for issue in issues),
+                         sorted(jira_facets))
+
+    def test_scenarios_run(self):
+        results = run_benchmarks(sizes=[3], scenarios=['ls', 'workon'],
+                                 repeat=1)
+        self.assertEqual(sorted(results), ['ls/3', 'workon/3'])
+        self.assertGreater(results['ls/3']['median'], 0)
+
+    def test_compare_reports_regressions(self):
+        baseline = {'ls/10': {'min': 1.0, 'median': 1.0},
+                    'current/10': {'min': 1.0, 'median': 1.0}}
+        results = {'ls/10': {'min': 1.5, 'median': 1.5},
+                   'current/10': {'min': 1.1, 'median': 1.1},
+                   'fetch/10': {'min': 9.0, 'median': 9.0}}
+        self.assertEqual(compare(results, baseline, tolerance=0.2),
+                         ['ls/10: 1.500s, baseline 1.000s'])
+
+    def test_baseline_covers_default_run(self):
+        options = docopt(benchmarks_main.__doc__,
+                         ['run', '--baseline=baseline.json'])
+        self.assertEqual(options['--baseline'], 'baseline.json')
+        with open(os.path.join(os.path.dirname(benchmarks_main.__file__),
+                               'baseline.json')) as fp:
+            baseline = json.load(fp)
+        self.assertEqual(sorted(baseline),
+                         sorted(f'{scenario}/{size}' for scenario in SCENARIOS
+                                for size in options['--sizes'].split(',')))
+
+    def test_cold_ls_reads_facets_concurrently(self):
+        def cold_ls(read_jobs):
+            results = run_benchmarks(sizes=[40], scenarios=['ls cold'],
+                                     repeat=1, io_latency=0.005,
+                                     read_jobs=read_jobs)
+            return results['ls cold/40']['median']
+
+        self.assertLess(cold_ls(8), cold_ls(1) / 2)
@@ -0,0 +1,130 @@
+import datetime
+import os
+import shutil
+import stat
+import tempfile
+from unittest import TestCase
+from unittest import mock
+
+from facet import cache
+from facet import settings
+from facet import utils
+from facet.cache import Cache
+
+
+class TestCache(TestCase):
+
+    def setUp(self):
+        self.facet_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.facet_dir)
+        patcher = mock.patch.object(cache, 'CACHE_DIR',
+                                    os.path.join(self.facet_dir, 'cache'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.now = 1000.0
+        patcher = mock.patch('facet.cache.time.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        lru = Cache(maxsize=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        self.assertEqual(lru.get('a'), 1)
+        lru.set('c', 3)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual((lru.get('a'), lru.get('c')), (1, 3))
+        self.assertEqual((lru.hits, lru.misses), (3, 1))
+
+    def test_entries_expire(self):
+        ttl = Cache(ttl=10)
+        ttl.set('a', 1)
+        ttl.set('b', 2, ttl=20)
+        self.now += 15
+        self.assertEqual((ttl.get('a'), ttl.get('b')), (None, 2))
+
+    def test_unhashable_keys(self):
+        lru = Cache()
+        lru.set([1, {'a': 2}], 3)
+        self.assertEqual(lru.get([1, {'a': 2}]), 3)
+        self.assertIsNone(lru.get([1, {'a': 3}]))
+
+    def test_named_cache_persists(self):
+        Cache(name='test').set(('a', 1), {'b': [2]}, ttl=10)
+        self.assertEqual(Cache(name='test').get(('a', 1)), {'b': [2]})
+        mode = os.stat(os.path.join(cache.CACHE_DIR, 'test.json')).st_mode
+        self.assertEqual(stat.S_IMODE(mode), 0o600)
+        self.now += 15
+        self.assertIsNone(Cache(name='test').get(('a', 1)))
+
+    def test_named_cache_sees_entries_of_other_processes(self):
+        daemon_cache = Cache(name='test')
+        self.assertIsNone(daemon_cache.get('a'))
+        Cache(name='test').set('a', 1)
+        self.assertEqual(daemon_cache.get('a'), 1)
+
+    def test_named_cache_is_bounded(self):
+        for key in 'abc':
+            Cache(maxsize=2, name='test').set(key, key)
+        self.assertEqual(
+            [Cache(name='test').get(key) for key in 'abc'], [None, 'b', 'c'])
+
+
+class TestAuth(TestCase):
+
+    def setUp(self):
+        self.facet_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.facet_dir)
+        auth_file = os.path.join(self.facet_dir, 'auth.yaml')
+        with open(auth_file, 'w') as fp:
+            fp.write('username: user\n')
+        for patcher in [
+                mock.patch.object(cache, 'CACHE_DIR',
+                                  os.path.join(self.facet_dir, 'cache')),
+                mock.patch.object(settings, 'JIRA_AUTH_FILE', auth_file),
+                mock.patch.object(utils, '_auth_cache', Cache(maxsize=1)),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_password_is_prompted_for_once(self):
+        with mock.patch('getpass.getpass', return_value='pass') as getpass:
+            for _ in range(2):
+                self.assertEqual(utils.get_auth(),
+                                 {'username': 'user', 'password': 'pass'})
+        self.assertEqual(getpass.call_count, 1)
+        # The password is not written to disk.
+        self.assertFalse(os.path.exists(cache.CACHE_DIR))
+
+
+class TestSettings(TestCase):
+
+    def setUp(self):
+        self.facet_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.facet_dir)
+        self.settings_file = os.path.join(self.facet_dir, 'settings.yaml')
+        for patcher in [
+                mock.patch.object(cache, 'CACHE_DIR',
+                                  os.path.join(self.facet_dir, 'cache')),
+                mock.patch.object(settings, 'LOCAL_SETTINGS_FILE',
+                                  self.settings_file),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _load(self, text):
+        with open(self.settings_file, 'w') as fp:
+            fp.write(text)
+        return [settings._load_local_settings_file() for _ in range(2)]
+
+    def test_settings_are_cached(self):
+        self.assertEqual(self._load('JIRA_URL: https://jira\n'),
+                         [{'JIRA_URL': 'https://jira'}] * 2)
+        self.assertTrue(os.path.exists(
+            os.path.join(cache.CACHE_DIR, 'settings.json')))
+
+    def test_settings_unlike_json_are_not_cached(self):
+        self.assertEqual(self._load('A: 2020-01-01\nB: {1: one}\n'),
+                         [{'A': datetime.date(2020, 1, 1),
+                           'B': {1: 'one'}}] * 2)
+        self.assertFalse(os.path.exists(cache.CACHE_DIR))
@@ -0,0 +1,101 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+from facet.cli import Command
+from facet.cli_dispatch import Dispatcher
+from facet.cli_dispatch import generate_command_table
+from facet.command_table import COMMANDS
+
+
+# Modules that `facet current` must not import: heavy dependencies, and
+# facet modules used only by other commands.
+HEAVY_MODULES = {'aiohttp', 'asyncio', 'docopt', 'requests', 'yaml'}
+LAZY_MODULES = {'facet.fetch', 'facet.fulltext', 'facet.github',
+                'facet.gitstatus', 'facet.jira', 'facet.patch', 'facet.query',
+                'facet.scheduler', 'facet.search', 'facet.trace'}
+
+
+class TestCommandTable(TestCase):
+
+    def test_command_table_is_up_to_date(self):
+        table_file = os.path.join(os.path.dirname(__file__),
+                                  '..', 'command_table.py')
+        with open(table_file) as fp:
+            self.assertEqual(
+                fp.read(),
+                generate_command_table(Command()),
+                'Run `make command-table` to regenerate '
+                'facet/command_table.py',
+            )
+
+    def test_table_parse_matches_docopt(self):
+        command = Command()
+        with_table = Dispatcher(command, {'options_first': True},
+                                table=COMMANDS)
+        without_table = Dispatcher(command, {'options_first': True})
+        for argv in [
+                ['ls'],
+                ['ls', '-a', '--regex=abc'],
+                ['ls', '-r', 'abc'],
+                ['create', '-j', '-y', 'ABC-1'],
+                ['follow', '--unfollow', 'a-facet'],
+                ['migrate', 'a-facet', '{}'],
+                ['migrate', '{}'],
+                ['migrate', '-a', '--dry-run', '{}'],
+                ['workon', '-c'],
+                ['show', 'a-facet'],
+        ]:
+            self.assertIsNotNone(with_table._parse_from_table(argv), argv)
+            self.assertEqual(
+                [dict(options) if isinstance(options, dict) else options
+                 for options in with_table.parse(argv)],
+                [dict(options) if isinstance(options, dict) else options
+                 for options in without_table.parse(argv)],
+                argv,
+            )
+
+    def test_table_defers_to_docopt(self):
+        dispatcher = Dispatcher(Command(), {'options_first': True},
+                                table=COMMANDS)
+        for argv in [
+                [],
+                ['--version'],
+                ['ls', '--help'],
+                ['ls', '--bogus'],
+                ['show', 'a-facet', 'another-facet'],
+                ['migrate', 'a-facet', '{}', '[]'],
+                ['no-such-command'],
+        ]:
+            self.assertIsNone(dispatcher._parse_from_table(argv), argv)
+
+
+class TestStartup(TestCase):
+
+    def setUp(self):
+        self.facet_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.facet_dir)
+        facet_directory = os.path.join(self.facet_dir, 'facets', 'a-facet')
+        os.makedirs(facet_directory)
+        with open(os.path.join(facet_directory, 'facet.yaml'), 'w') as fp:
+            fp.write('name: a-facet\nfollow: true\nstatus: doing\n')
+        with open(os.path.join(self.facet_dir, 'state.json'), 'w') as fp:
+            fp.write('{"facet": "a-facet"}')
+        self.env = dict(os.environ, FACET_DIRECTORY=self.facet_dir)
+
+    def test_current_imports(self):
+        code = ('import sys; from facet.cli import main; '
+                'sys.argv[1:] = ["current"]; main(); '
+                'print(" ".join(sys.modules))')
+        # The first run builds the facet index.
+        for _ in range(2):
+            output = subprocess.check_output([sys.executable, '-c', code],
+                                             env=self.env).decode('utf-8')
+        modules = set(output.splitlines()[-1].split())
+        self.assertIn('facet.cli', modules)
+        self.assertFalse({module.split('.')[0] for module in modules} &
+                         HEAVY_MODULES)
+        self.assertFalse(modules & LAZY_MODULES)
@@ -0,0 +1,173 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+from unittest import mock
+
+from facet import core
+from facet import index
+from facet import listing
+from facet import settings
+from facet.core import Facet
+from facet.core import Status
+
+
+class TestConfigCache(TestCase):
+
+    def setUp(self):
+        self.facets_dir = tempfile.mkdtemp()
+        for patcher in [
+                mock.patch.object(settings, 'FACETS_DIR', self.facets_dir),
+                mock.patch.object(index, 'INDEX_FILE', os.path.join(
+                    self.facets_dir, '.index.sqlite')),
+                mock.patch.object(index, '_local', None),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.facets_dir)
+
+        self.facet = Facet(name='test-facet')
+        os.mkdir(self.facet.directory)
+        self._write('name: test-facet\n'
+                    'branch: test-branch\n'
+                    'follow: true\n'
+                    'status: doing\n')
+
+    def _write(self, text):
+        with open(self.facet.config_file, 'w') as fp:
+            fp.write(text)
+
+    def _parse_count(self):
+        return core.parse_counts[self.facet.config_file]
+
+    def test_config_is_parsed_once(self):
+        before = self._parse_count()
+        for _ in range(3):
+            facet = Facet(name='test-facet')
+            self.assertEqual(facet.branch, 'test-branch')
+            self.assertEqual(facet.status, Status.doing)
+            self.assertTrue(facet.is_active)
+            self.assertFalse(facet.is_done)
+        self.assertEqual(self._parse_count() - before, 1)
+
+    def test_config_is_reparsed_when_file_changes(self):
+        before = self._parse_count()
+        self.assertEqual(self.facet.branch, 'test-branch')
+        self._write('name: test-facet\n'
+                    'branch: other-branch\n')
+        self.assertEqual(self.facet.branch, 'other-branch')
+        self.assertEqual(self._parse_count() - before, 2)
+
+    def test_write_config_updates_cache(self):
+        before = self._parse_count()
+        self.facet.write_config(status=Status.done.name)
+        self.assertTrue(self.facet.is_done)
+        self.assertEqual(self.facet.branch, 'test-branch')
+        self.assertEqual(self._parse_count() - before, 1)
+
+    def test_is_done_follows_pull_request_status(self):
+        self.facet.write_config(status=Status.done.name)
+        with open(self.facet.github_data_file, 'w') as fp:
+            json.dump({'merged': False, 'state': 'OPEN', 'is_draft': False},
+                      fp)
+        facet = Facet(name='test-facet')
+        self.assertEqual(core.get_entry_status(facet.entry),
+                         Status.under_review)
+        self.assertFalse(facet.is_done)
+
+
+class TestListing(TestCase):
+
+    def setUp(self):
+        self.facets_dir = tempfile.mkdtemp()
+        patcher = mock.patch.object(settings, 'FACETS_DIR', self.facets_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.facets_dir)
+        self.addCleanup(listing.invalidate)
+
+        for i, name in enumerate(['facet-a', 'facet-b', '.hidden']):
+            directory = os.path.join(self.facets_dir, name)
+            os.mkdir(directory)
+            os.utime(directory, (i, i))
+        listing.invalidate()
+
+    def test_names_are_most_recent_first(self):
+        self.assertEqual(listing.get_names(), ['facet-b', 'facet-a'])
+
+    def test_touch_makes_facet_most_recent(self):
+        listing.get_names()
+        listing.touch('facet-a')
+        self.assertEqual(listing.get_names(), ['facet-a', 'facet-b'])
+
+    def test_exists(self):
+        self.assertTrue(listing.exists('facet-a'))
+        self.assertFalse(listing.exists('.hidden'))
+        self.assertFalse(listing.exists('no-such-facet'))
+        self.assertFalse(listing.exists('../facets'))
+
+
+class TestIndex(TestCase):
+
+    def setUp(self):
+        self.facet_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.facet_dir)
+        facets_dir = os.path.join(self.facet_dir, 'facets')
+        for patcher in [
+                mock.patch.object(settings, 'FACETS_DIR', facets_dir),
+                mock.patch.object(settings, 'INDEX_READ_JOBS', 4),
+                mock.patch.object(index, 'INDEX_FILE', os.path.join(
+                    self.facet_dir, 'index.sqlite')),
+                mock.patch.object(index, '_local', None),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(listing.invalidate)
+
+        self.names = [f'facet-{i}' for i in range(20)]
+        for i, name in enumerate(self.names):
+            directory = os.path.join(facets_dir, name)
+            os.makedirs(directory)
+            with open(os.path.join(directory, 'facet.yaml'), 'w') as fp:
+                fp.write(f'name: {name}\nfollow: true\nstatus: doing\n')
+            os.utime(directory, (-i, -i))
+        broken = os.path.join(facets_dir, 'facet-7', 'facet.yaml')
+        with open(broken, 'w') as fp:
+            fp.write('name: [\n')
+        listing.invalidate()
+
+    def test_unindexed_facets_are_read_concurrently_in_order(self):
+        names = listing.get_names()
+        self.assertEqual(names, self.names)
+        with mock.patch.object(index, 'warning') as warning:
+            entries = index.get_entries(names)
+        self.assertEqual([entry.name for entry in entries],
+                         [name for name in names if name != 'facet-7'])
+        self.assertEqual(warning.call_count, 1)
+        self.assertIn('facet-7', warning.call_args[0][0])
+        self.assertEqual(index.get_entries(names), entries)
+
+    def test_changed_facets_are_read_concurrently(self):
+        names = [name for name in listing.get_names() if name != 'facet-7']
+        index.get_entries(names)
+        for name in ['facet-1', 'facet-2']:
+            config_file = os.path.join(settings.FACETS_DIR, name,
+                                       'facet.yaml')
+            with open(config_file, 'a') as fp:
+                fp.write('branch: a-branch\n')
+            os.utime(config_file, (1, 1))
+        # Each read waits for the other, so they must be concurrent.
+        barrier = threading.Barrier(2, timeout=10)
+        read_entry = index._read_entry
+
+        def _read_entry(*args, **kwargs):
+            barrier.wait()
+            return read_entry(*args, **kwargs)
+
+        with mock.patch.object(index, '_read_entry', _read_entry):
+            entries = index.get_entries(names)
+        self.assertEqual([entry.name for entry in entries], names)
+        self.assertEqual([entry.branch for entry in entries[1:3]],
+                         ['a-branch'] * 2)
@@ -0,0 +1,96 @@
+import contextlib
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import TestCase
+from unittest import mock
+
+from facet import daemon
+
+
+class TestDaemon(TestCase):
+
+    def setUp(self):
+        self.facet_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.facet_dir)
+        os.mkdir(os.path.join(self.facet_dir, 'facets'))
+        for name in ['facet-1', 'facet-2']:
+            self._write_config(name, f'name: {name}\nfollow: true\n')
+        self.env = dict(os.environ, FACET_DIRECTORY=self.facet_dir)
+        self.socket_file = os.path.join(self.facet_dir, 'facetd.sock')
+
+        proc = subprocess.Popen([sys.executable, '-m', 'facet.daemon'],
+                                env=self.env)
+        self.addCleanup(proc.wait)
+        self.addCleanup(proc.terminate)
+        for _ in range(100):
+            if os.path.exists(self.socket_file):
+                break
+            time.sleep(0.05)
+
+    def _write_config(self, name, text):
+        directory = os.path.join(self.facet_dir, 'facets', name)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'facet.yaml'), 'w') as fp:
+            fp.write(text)
+
+    def _run(self, args, env=None):
+        return subprocess.check_output(
+            [sys.executable, '-c',
+             'from facet.cli import main; main()'] + args,
+            env=dict(self.env, **(env or {})),
+        ).decode('utf-8')
+
+    def test_request_is_answered_by_daemon(self):
+        stdout = io.StringIO()
+        with mock.patch.object(daemon, 'SOCKET_FILE', self.socket_file), \
+                contextlib.redirect_stdout(stdout):
+            status = daemon.request(['complete', 'facet-'])
+        self.assertEqual(status, 0)
+        self.assertEqual(sorted(stdout.getvalue().split()),
+                         ['facet-1', 'facet-2'])
+
+    def test_output_matches_in_process_output(self):
+        for args in [['ls'], ['ls', '--all'], ['complete'],
+                     ['show', 'facet-1']]:
+            self.assertEqual(self._run(args),
+                             self._run(args, env={'FACET_NO_DAEMON': '1'}),
+                             args)
+
+    def test_daemon_notices_changes(self):
+        self.assertIn('facet-1', self._run(['ls']))
+        self._write_config('facet-1', 'name: facet-1\nfollow: false\n')
+        self._write_config('facet-3', 'name: facet-3\nfollow: true\n')
+        output = self._run(['ls'])
+        self.assertNotIn('facet-1', output)
+        self.assertIn('facet-3', output)
+
+    def test_order_follows_files_added_to_a_facet(self):
+        for i, name in enumerate(['facet-1', 'facet-2']):
+            os.utime(os.path.join(self.facet_dir, 'facets', name),
+                     ns=(i * 10**9, i * 10**9))
+        self.assertEqual(self._run(['ls']),
+                         self._run(['ls'], env={'FACET_NO_DAEMON': '1'}))
+        notes_file = os.path.join(self.facet_dir, 'facets', 'facet-1',
+                                  'notes.txt')
+        with open(notes_file, 'w') as fp:
+            fp.write('hi\n')
+        output = self._run(['ls'])
+        self.assertEqual(output,
+                         self._run(['ls'], env={'FACET_NO_DAEMON': '1'}))
+        self.assertLess(output.index('facet-1'), output.index('facet-2'))
+
+    def test_commands_needing_jira_are_handed_back(self):
+        self._write_config('ABC-1', 'name: ABC-1\nfollow: true\njira: ABC-1\n')
+        with mock.patch.object(daemon, 'SOCKET_FILE', self.socket_file):
+            self.assertIsNone(daemon.request(['ls']))
+            self.assertEqual(daemon.request(['ls', '--offline']), 0)
+
+    def test_falls_back_when_daemon_is_not_running(self):
+        with mock.patch.object(daemon, 'SOCKET_FILE',
+                               os.path.join(self.facet_dir, 'no-such.sock')):
+            self.assertIsNone(daemon.request(['ls']))
@@ -1,6 +1,8 @@
+import json
 import os
 import shutil
 import subprocess
+import sys
 import tempfile
 from unittest import TestCase
 
@@ -63,3 +65,305 @@ class TestFacet(_TestFacetMixin, TestCase):
             self._check_output(['current']),
             'test-facet-2',
         )
+
+    def test_ls_notices_hand_edited_config(self):
+        self.assertIn('test-facet-1', self._check_output(['ls']))
+        config_file = os.path.join(self.env['FACET_DIRECTORY'],
+                                   'facets', 'test-facet-1', 'facet.yaml')
+        with open(config_file) as fp:
+            config = fp.read()
+        with open(config_file, 'w') as fp:
+            fp.write(config.replace('follow: true', 'follow: false'))
+        self.assertNotIn('test-facet-1', self._check_output(['ls']))
+        self.assertIn('test-facet-1', self._check_output(['ls', '--all']))
+
+    def test_ls_machine_readable_formats(self):
+        self._check_output(['current', 'test-facet-2'])
+        records = [json.loads(line) for line in
+                   self._check_output(['ls', '--format=jsonl']).splitlines()]
+        self.assertEqual(
+            {record['name']: (record['status'], record['is_current'])
+             for record in records},
+            {'test-facet-1': ('todo', False), 'test-facet-2': ('todo', True)},
+        )
+        rows = [line.split('\t') for line in
+                self._check_output(['ls', '--format=tsv']).splitlines()]
+        self.assertEqual(sorted(row[0] for row in rows),
+                         ['test-facet-1', 'test-facet-2'])
+        self.assertNotIn('\x1b', self._check_output(['ls', '--format=tsv']))
+
+    def test_ls_query(self):
+        self._check_output(['doing', 'test-facet-2'])
+        self.assertEqual(self._check_output(['ls', '--where=status=doing',
+                                             '--format=tsv']).split('\t')[0],
+                         'test-facet-2')
+        self.assertEqual(
+            [line.split('\t')[0] for line in self._check_output(
+                ['ls', '--sort=-name', '--limit=1',
+                 '--format=tsv']).splitlines()],
+            ['test-facet-2'],
+        )
+        result = subprocess.run([self.facet_executable, 'ls', '--where=x=y'],
+                                env=self.env, stderr=subprocess.PIPE)
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn(b'Unknown field', result.stderr)
+
+    def test_find(self):
+        self._create('website-login')
+        self._create('api-logout')
+
+        def find(query):
+            return [line.split('\t')[0] for line in self._check_output(
+                ['find', '--format=tsv', query]).splitlines()]
+
+        self.assertEqual(find('login')[0], 'website-login')
+        self.assertEqual(find('webiste'), ['website-login'])
+        self.assertEqual(find('logout api'), ['api-logout'])
+        self.assertEqual(find('nothing'), [])
+
+        self._check_output(['rm', 'api-logout'], input=b'y\n')
+        self.assertEqual(find('logout api'), [])
+
+    def test_fuzzy_facet_names(self):
+        self._create('website-login')
+        record = json.loads(self._check_output(['show', '--format=json',
+                                                'login webs']))
+        self.assertEqual(record['name'], 'website-login')
+        result = subprocess.run([self.facet_executable, 'show', 'test'],
+                                env=self.env, stderr=subprocess.PIPE)
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn(b'Ambiguous facet', result.stderr)
+
+    def test_grep(self):
+        directory = os.path.join(self.env['FACET_DIRECTORY'], 'facets',
+                                 'test-facet-1')
+        with open(os.path.join(directory, 'notes.md'), 'w') as fp:
+            fp.write('one\nDeploy the feature flag\nthree\n')
+        with open(os.path.join(directory, 'PR.md'), 'w') as fp:
+            fp.write('Flags: feature\n')
+
+        def grep(*args):
+            return self._check_output(['grep'] + list(args)).splitlines()
+
+        self.assertEqual(grep('-C1', '"feature flag"'), [
+            'test-facet-1/notes.md-1-one',
+            'test-facet-1/notes.md:2:Deploy the feature flag',
+            'test-facet-1/notes.md-3-three',
+        ])
+        self.assertEqual(grep('-C0', 'flag*'), [
+            'test-facet-1/PR.md:1:Flags: feature',
+            'test-facet-1/notes.md:2:Deploy the feature flag',
+        ])
+        self.assertEqual(grep('deploy flags'), [])
+
+        os.remove(os.path.join(directory, 'PR.md'))
+        with open(os.path.join(directory, 'notes.md'), 'a') as fp:
+            fp.write('rollback plan\n')
+        self.assertEqual(grep('-C0', 'flag*'), [
+            'test-facet-1/notes.md:2:Deploy the feature flag',
+        ])
+        self.assertEqual(grep('-C0', 'rollback'), [
+            'test-facet-1/notes.md:4:rollback plan',
+        ])
+
+        # PR.md has the words of the phrase, but not together.
+        with open(os.path.join(directory, 'PR.md'), 'w') as fp:
+            fp.write('Flag it\nwe deploy the feature\n')
+        self.assertEqual(grep('-C0', '"feature flag" deploy'), [
+            'test-facet-1/notes.md:2:Deploy the feature flag',
+        ])
+
+    def test_concurrent_grep(self):
+        for i in range(200):
+            directory = os.path.join(self.env['FACET_DIRECTORY'], 'facets',
+                                     f'notes-{i}')
+            os.mkdir(directory)
+            with open(os.path.join(directory, 'notes.md'), 'w') as fp:
+                fp.write(f'note {i}\n')
+
+        # Each finds the index missing, and updates it.
+        procs = [subprocess.Popen([self.facet_executable, 'grep', 'note'],
+                                  env=self.env, stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE)
+                 for _ in range(4)]
+        outputs = [proc.communicate() + (proc.returncode,) for proc in procs]
+        for stdout, stderr, returncode in outputs:
+            self.assertEqual(stderr, b'')
+            self.assertEqual(returncode, 0)
+            self.assertEqual(stdout.count(b':1:note '), 200)
+
+    def test_git_status(self):
+        repo = os.path.join(self.env['FACET_DIRECTORY'], 'repo')
+        git_env = dict(self.env, GIT_AUTHOR_NAME='a', GIT_AUTHOR_EMAIL='a@a',
+                       GIT_COMMITTER_NAME='a', GIT_COMMITTER_EMAIL='a@a',
+                       PATH=os.environ['PATH'])
+
+        def git(*args):
+            subprocess.check_call(['git', '-C', repo] + list(args),
+                                  env=git_env, stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.DEVNULL)
+
+        subprocess.check_call(['git', 'init', '-q', repo])
+        git('checkout', '-q', '-b', 'main')
+        git('commit', '-q', '--allow-empty', '-m', 'one')
+        git('checkout', '-q', '-b', 'feature')
+        git('commit', '-q', '--allow-empty', '-m', 'two')
+        self._check_output(['create', 'facet-feature'],
+                           input=f'{repo}\nfeature\n'.encode())
+        self._check_output(['create', 'facet-missing'],
+                           input=f'{repo}\nmissing\n'.encode())
+
+        def git_status():
+            return {record['name']: record for record in map(
+                json.loads, self._check_output(
+                    ['git-status', '--format=jsonl']).splitlines())}
+
+        statuses = git_status()
+        self.assertEqual(
+            {name: (status['exists'], status['default_branch'],
+                    status['ahead_default'], status['dirty'])
+             for name, status in statuses.items()},
+            {'facet-feature': (True, 'main', 1, False),
+             'facet-missing': (False, 'main', None, None)},
+        )
+
+        # Refs are read from the cache until they change.
+        output = self._check_output(['--profile=summary', 'git-status'],
+                                    stderr=subprocess.STDOUT)
+        self.assertIn('1 subprocesses', output)
+        git('commit', '-q', '--allow-empty', '-m', 'three')
+        self.assertEqual(git_status()['facet-feature']['ahead_default'], 2)
+
+    def test_shell_init(self):
+        # cd changes the directory of the calling shell, while output and the
+        # exit status are passed through.
+        script = ('eval "$(facet shell-init bash)"; '
+                  'facet cd test-facet-1 && pwd && '
+                  'facet show --format=json test-facet-2 && '
+                  'facet rm no-such-facet; echo $?')
+        output = subprocess.check_output(
+            ['bash', '-c', script],
+            env=dict(self.env, PATH=os.environ['PATH']),
+            stderr=subprocess.DEVNULL).decode('utf-8').splitlines()
+        self.assertEqual(output[0], os.path.join(
+            self.env['FACET_DIRECTORY'], 'facets', 'test-facet-1'))
+        self.assertEqual(json.loads('\n'.join(output[1:-1]))['name'],
+                         'test-facet-2')
+        self.assertEqual(output[-1], '1')
+
+    def test_prompt(self):
+        self.assertEqual(self._check_output(['prompt']), '')
+        self._check_output(['current', 'test-facet-2'])
+        self.assertEqual(self._check_output(['prompt']), 'test-facet-2 (todo)')
+        self._check_output(['doing', 'test-facet-2'])
+        self._check_output(['done', 'test-facet-1'])
+        self.assertEqual(self._check_output(['prompt']),
+                         'test-facet-2 (doing)')
+
+        # The prompt module imports none of facet's heavier dependencies.
+        code = ('import sys; from facet.prompt import main; main(); '
+                'print(sorted({m.split(".")[0] for m in sys.modules} & '
+                '{"yaml", "aiohttp", "clint", "sqlite3"}))')
+        self.assertEqual(
+            subprocess.check_output([sys.executable, '-c', code],
+                                    env=self.env).decode('utf-8').split('\n'),
+            ['test-facet-2 (doing)', '[]', ''])
+
+        # The shell function renders the prompt with builtins alone, without
+        # starting a process.
+        script = 'eval "$(facet shell-init bash)"; PATH=; facet_prompt'
+        output = subprocess.run(
+            ['bash', '-c', script],
+            env=dict(self.env, PATH=os.environ['PATH']),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True,
+        )
+        self.assertEqual(output.stdout.decode('utf-8'), 'test-facet-2 (doing)')
+        self.assertEqual(output.stderr, b'')
+
+    def test_show_json(self):
+        record = json.loads(self._check_output(['show', '--format=json',
+                                                'test-facet-1']))
+        self.assertEqual(record['name'], 'test-facet-1')
+        self.assertIs(record['follow'], True)
+
+    def test_completion_cache(self):
+        cache_file = os.path.join(self.env['FACET_DIRECTORY'],
+                                  'completion.tsv')
+        self._check_output(['current', 'test-facet-1'])
+        self._check_output(['follow', '--unfollow', 'test-facet-2'])
+        with open(cache_file) as fp:
+            rows = [line.split('\t') for line in fp.read().splitlines()]
+        self.assertEqual(
+            [row[:3] for row in rows],
+            [['test-facet-1', 'true', 'todo'],
+             ['test-facet-2', 'false', 'todo']],
+        )
+
+        script = os.path.join(os.path.dirname(__file__), '..', '..',
+                              'completion', 'bash', 'facet')
+        complete = (f'source {script}; cur=test-; __facet_complete_facets; '
+                    f'echo "${{COMPREPLY[@]}}"')
+        self.assertEqual(
+            subprocess.check_output(['bash', '-c', complete], env=self.env)
+            .decode('utf-8').split(),
+            ['test-facet-1', 'test-facet-2'],
+        )
+        self.assertEqual(
+            subprocess.check_output(
+                ['bash', '-c', complete],
+                env=dict(self.env, FACET_COMPLETE_ACTIVE='1'),
+            ).decode('utf-8').split(),
+            ['test-facet-1'],
+        )
+
+        def read_rows():
+            with open(cache_file) as fp:
+                return [line.split('\t')[:3]
+                        for line in fp.read().splitlines()]
+
+        self._check_output(['current', 'test-facet-2'])
+        self._check_output(['done', 'test-facet-1'])
+        self.assertEqual(read_rows(), [['test-facet-2', 'false', 'todo'],
+                                       ['test-facet-1', 'true', 'done']])
+        # The file is not rewritten if its contents would not change.
+        os.utime(cache_file, (0, 0))
+        self._check_output(['done', 'test-facet-1'])
+        self.assertEqual(os.stat(cache_file).st_mtime, 0)
+        self._check_output(['rm', 'test-facet-1'], input=b'y\n')
+        self.assertEqual(read_rows(), [['test-facet-2', 'false', 'todo']])
+
+    def test_migrate_all(self):
+        config_file = os.path.join(self.env['FACET_DIRECTORY'],
+                                   'facets', 'test-facet-1', 'facet.yaml')
+        with open(config_file) as fp:
+            config = fp.read()
+
+        output = subprocess.run(
+            [self.facet_executable, 'migrate', '--all', '--dry-run',
+             '{"extra": {"key": 1}}'],
+            env=self.env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            check=True,
+        )
+        self.assertIn('+extra:', output.stdout.decode('utf-8'))
+        self.assertEqual(output.stderr.decode('utf-8').strip(),
+                         '2 changed, 0 unchanged, 0 failed')
+        with open(config_file) as fp:
+            self.assertEqual(fp.read(), config)
+
+        self._check_output(['migrate', '--all', '{"extra": {"key": 1}}'])
+        self.assertIn('extra:', self._check_output(['config', 'test-facet-1']))
+
+        def migrate_all(*args):
+            return subprocess.run(
+                [self.facet_executable, 'migrate', '--all'] + list(args),
+                env=self.env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        for jobs in ['0', 'abc']:
+            output = migrate_all(f'--jobs={jobs}', '{}')
+            self.assertEqual(output.returncode, 1)
+            self.assertEqual(output.stderr.decode('utf-8').strip(),
+                             f'Invalid number of jobs: {jobs}')
+        output = migrate_all('[{"op": "remove", "path": "/no-such-key"}]')
+        self.assertEqual(output.returncode, 1)
+        self.assertIn('0 changed, 0 unchanged, 2 failed',
+                      output.stderr.decode('utf-8'))
@@ -0,0 +1,379 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import TestCase
+from unittest import mock
+
+from facet import refresh
+from facet.index import Entry
+from facet.tests.github_stub import GithubStub
+from facet.tests.github_stub import make_pull_request
+from facet.benchmarks.jira_stub import JiraStub
+from facet.benchmarks.jira_stub import make_issue
+
+
+class _TestFetchMixin:
+
+    def setUp(self):
+        self.facet_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.facet_dir)
+        os.mkdir(os.path.join(self.facet_dir, 'facets'))
+        with open(os.path.join(self.facet_dir, 'auth.yaml'), 'w') as fp:
+            fp.write('username: user\npassword: pass\n')
+        self.env = dict(os.environ, FACET_DIRECTORY=self.facet_dir)
+
+    def _start_stub(self, issues, **kwargs):
+        stub = JiraStub(issues, **kwargs)
+        stub.start()
+        self.addCleanup(stub.stop)
+        with open(os.path.join(self.facet_dir, 'settings.yaml'), 'w') as fp:
+            fp.write(f'JIRA_HOST: "{stub.host}"\nJIRA_PROTOCOL: http\n')
+        return stub
+
+    def _create(self, name, jira=None):
+        directory = os.path.join(self.facet_dir, 'facets', name)
+        os.mkdir(directory)
+        with open(os.path.join(directory, 'facet.yaml'), 'w') as fp:
+            fp.write(f'name: {name}\nfollow: true\nstatus: todo\n')
+            if jira:
+                fp.write(f'jira: {jira}\n')
+
+    def _jira_data_file(self, name):
+        return os.path.join(self.facet_dir, 'facets', name, 'jira.json')
+
+    def _read_jira_data(self, name):
+        with open(self._jira_data_file(name)) as fp:
+            return json.load(fp)
+
+    def _jira_data_mtime(self, name):
+        return os.stat(self._jira_data_file(name)).st_mtime_ns
+
+    def _run(self, args):
+        return subprocess.run(
+            [sys.executable, '-c',
+             'from facet.cli import main; main()'] + args,
+            env=self.env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
+
+
+class TestFetch(_TestFetchMixin, TestCase):
+
+    def test_fetch_searches_in_batches(self):
+        keys = [f'ABC-{i}' for i in range(5)]
+        stub = self._start_stub([make_issue(key) for key in keys])
+        for key in keys:
+            self._create(key, jira=key)
+
+        self._run(['fetch', '--batch-size=2'])
+
+        self.assertEqual(stub.requests, ['/rest/api/latest/search'] * 3)
+        for key in keys:
+            self.assertEqual(self._read_jira_data(key)['fields']['summary'],
+                             f'Summary of {key}')
+
+    def test_fetch_rejects_invalid_batch_size(self):
+        stub = self._start_stub([make_issue('ABC-1')])
+        self._create('ABC-1', jira='ABC-1')
+
+        for batch_size in ['0', '-1', 'abc']:
+            output = subprocess.run(
+                [sys.executable, '-c', 'from facet.cli import main; main()',
+                 'fetch', f'--batch-size={batch_size}'],
+                env=self.env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self.assertEqual(output.returncode, 1)
+            self.assertEqual(output.stderr.decode('utf-8').strip(),
+                             f'Invalid batch size: {batch_size}')
+        self.assertEqual(stub.requests, [])
+
+    def test_fetch_follows_search_pagination(self):
+        keys = [f'ABC-{i}' for i in range(3)]
+        stub = self._start_stub([make_issue(key) for key in keys],
+                                max_results=2)
+        for key in keys:
+            self._create(key, jira=key)
+
+        self._run(['fetch'])
+
+        self.assertEqual(stub.requests, ['/rest/api/latest/search'] * 2)
+        for key in keys:
+            self.assertEqual(self._read_jira_data(key)['key'], key)
+
+    def test_fetch_reports_issues_missing_from_search(self):
+        self._start_stub([make_issue('ABC-1')])
+        self._create('ABC-1', jira='ABC-1')
+        self._create('ABC-2', jira='ABC-2')
+
+        stderr = self._run(['fetch']).stderr.decode('utf-8')
+
+        self.assertIn('ABC-2: failed: JIRA issue ABC-2 was not returned',
+                      stderr)
+        self.assertEqual(self._read_jira_data('ABC-1')['key'], 'ABC-1')
+
+    def test_fetch_per_issue(self):
+        stub = self._start_stub([make_issue('ABC-1'), make_issue('ABC-2')])
+        self._create('ABC-1', jira='ABC-1')
+        self._create('ABC-2', jira='ABC-2')
+
+        self._run(['fetch', '--per-issue'])
+
+        self.assertEqual(sorted(stub.requests),
+                         ['/rest/api/latest/issue/ABC-1',
+                          '/rest/api/latest/issue/ABC-2'])
+
+    def test_fetch_summarises_results(self):
+        self._start_stub([make_issue('ABC-1')])
+        self._create('ABC-1', jira='ABC-1')
+        self._create('ABC-2', jira='ABC-2')
+
+        stderr = self._run(['fetch']).stderr.decode('utf-8')
+
+        self.assertEqual(stderr.splitlines()[-1],
+                         '1 ok, 0 unchanged, 1 failed, 0 timed out')
+
+    def test_fetch_abandons_facets_after_total_timeout(self):
+        self._start_stub([make_issue('ABC-1')], latency=5)
+        self._create('ABC-1', jira='ABC-1')
+
+        stderr = self._run(['fetch', '--total-timeout=0.5']).stderr
+
+        self.assertIn('ABC-1: timed out', stderr.decode('utf-8'))
+
+
+class TestIncrementalFetch(_TestFetchMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        yesterday = time.time() - 24 * 60 * 60
+        self.stub = self._start_stub([make_issue('ABC-1', updated=yesterday),
+                                      make_issue('ABC-2', updated=yesterday)])
+        self._create('ABC-1', jira='ABC-1')
+        self._create('ABC-2', jira='ABC-2')
+
+    def test_unchanged_jira_data_is_not_rewritten(self):
+        self._run(['fetch'])
+        mtime = self._jira_data_mtime('ABC-1')
+        self._run(['fetch'])
+        self.assertEqual(self._jira_data_mtime('ABC-1'), mtime)
+
+    def test_changed_only_fetches_issues_updated_since_last_fetch(self):
+        self._run(['fetch'])
+        mtime = self._jira_data_mtime('ABC-1')
+        self.stub.issues['ABC-2'] = make_issue('ABC-2', summary='New summary')
+
+        self._run(['fetch', '--changed-only'])
+
+        self.assertRegex(self.stub.queries[-1], r'AND updated >= "-\d+m"$')
+        self.assertEqual(self._jira_data_mtime('ABC-1'), mtime)
+        self.assertEqual(self._read_jira_data('ABC-2')['fields']['summary'],
+                         'New summary')
+
+    def test_per_issue_fetch_is_conditional(self):
+        self._run(['fetch', '--per-issue'])
+        mtime = self._jira_data_mtime('ABC-1')
+        stdout = self._run(['fetch', '--per-issue']).stdout.decode('utf-8')
+        self.assertEqual(self._jira_data_mtime('ABC-1'), mtime)
+        self.assertEqual(stdout, '')
+
+
+class TestBackgroundRefresh(_TestFetchMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.stub = self._start_stub([make_issue('ABC-1')])
+        self._create('ABC-1', jira='ABC-1')
+        self._run(['fetch'])
+
+    def _expire(self, name):
+        an_hour_ago = time.time() - 60 * 60
+        os.utime(self._jira_data_file(name), (an_hour_ago, an_hour_ago))
+        sync_file = os.path.join(self.facet_dir, 'jira-sync.json')
+        with open(sync_file) as fp:
+            sync = json.load(fp)
+        sync[name]['synced_at'] = an_hour_ago
+        with open(sync_file, 'w') as fp:
+            json.dump(sync, fp)
+
+    def _wait_for_summary(self, name, summary, timeout=10):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self._read_jira_data(name)['fields']['summary'] == summary:
+                return True
+            time.sleep(0.1)
+        return False
+
+    def test_ls_shows_cached_data_and_refreshes_expired_data(self):
+        self._expire('ABC-1')
+        self.stub.issues['ABC-1'] = make_issue('ABC-1', summary='New summary')
+
+        stdout = self._run(['ls']).stdout.decode('utf-8')
+
+        self.assertIn('Summary of ABC-1', stdout)
+        self.assertTrue(self._wait_for_summary('ABC-1', 'New summary'))
+        self.assertIn('New summary', self._run(['ls']).stdout.decode('utf-8'))
+
+    def test_ls_offline_does_not_refresh(self):
+        self._expire('ABC-1')
+        requests = list(self.stub.requests)
+
+        self._run(['ls', '--offline'])
+        self._run(['show', '--offline', 'ABC-1'])
+
+        # A refresh would take the lock before starting its process.
+        self.assertFalse(
+            os.path.exists(os.path.join(self.facet_dir, 'jira-refresh.lock')))
+        self.assertEqual(self.stub.requests, requests)
+
+    def test_no_refresh_while_another_is_running(self):
+        entry = _entry(jira_status='To Do')
+        lock_file = os.path.join(self.facet_dir, 'jira-refresh.lock')
+        sync_file = os.path.join(self.facet_dir, 'no-such-file.json')
+        with mock.patch.object(refresh, 'LOCK_FILE', lock_file), \
+                mock.patch.object(refresh, 'SYNC_FILE', sync_file), \
+                mock.patch('subprocess.Popen') as popen:
+            lock = refresh._lock()
+            refresh.refresh_in_background([entry])
+            self.assertFalse(popen.called)
+            lock.close()
+            refresh.refresh_in_background([entry])
+            self.assertTrue(popen.called)
+
+    def test_failed_refresh_is_not_retried_at_once(self):
+        self._expire('ABC-1')
+        os.remove(os.path.join(self.facet_dir, 'auth.yaml'))
+        # Without credentials, the refresh fails rather than prompting for
+        # them, even with a stdin to read from.
+        subprocess.run([sys.executable, '-m', 'facet.refresh', 'ABC-1'],
+                       env=dict(self.env, FACET_NO_PROMPT='1'),
+                       stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                       timeout=10, check=True)
+        with open(os.path.join(self.facet_dir, 'jira-sync.json')) as fp:
+            record = json.load(fp)['ABC-1']
+        self.assertLess(record['synced_at'], record['attempted_at'])
+        with mock.patch.object(refresh, 'SYNC_FILE',
+                               os.path.join(self.facet_dir,
+                                            'jira-sync.json')):
+            self.assertEqual(refresh.get_expired([_entry()]), [])
+            self.assertEqual(
+                refresh.get_expired([_entry()], now=time.time() + 60 * 60),
+                ['ABC-1'])
+
+    def test_ttl_depends_on_status(self):
+        self.assertLess(refresh.get_ttl(_entry(jira_status='In Progress')),
+                        refresh.get_ttl(_entry(jira_status='Done')))
+        self.assertEqual(
+            refresh.get_ttl(_entry(jira_status='Done', jira_ttl=5)), 5)
+
+
+def _entry(**kwargs):
+    fields = dict(name='ABC-1', mtime=0, config_mtime=0, jira_mtime=0,
+                  follow=True, status='todo', repo=None, branch=None,
+                  jira='ABC-1', summary='', jira_status=None, jira_ttl=None,
+                  assignee=None, priority=None, fix_versions=None,
+                  github_mtime=None, pr_status=None)
+    fields.update(kwargs)
+    return Entry(**fields)
+
+
+class TestPrefetch(_TestFetchMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.keys = [f'ABC-{i}' for i in range(5)]
+        self.stub = self._start_stub([make_issue(key) for key in self.keys])
+        for key in self.keys:
+            self._create(key, jira=key)
+
+    def test_ls_fetches_missing_data_in_one_batch(self):
+        stdout = self._run(['ls']).stdout.decode('utf-8')
+
+        self.assertEqual(self.stub.requests, ['/rest/api/latest/search'])
+        for key in self.keys:
+            self.assertIn(f'Summary of {key}', stdout)
+
+    def test_ls_offline(self):
+        stdout = self._run(['ls', '--offline']).stdout.decode('utf-8')
+
+        self.assertEqual(self.stub.requests, [])
+        self.assertEqual(stdout.count('<no JIRA data>'), len(self.keys))
+
+
+class TestPullRequests(_TestFetchMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.stub = GithubStub({
+            ('owner/repo', 'merged'): make_pull_request(1, state='MERGED',
+                                                        merged=True),
+            ('owner/repo', 'draft'): make_pull_request(2, is_draft=True),
+            ('owner/repo', 'open'): make_pull_request(3),
+            ('owner/other', 'open'): make_pull_request(4),
+        })
+        self.stub.start()
+        self.addCleanup(self.stub.stop)
+        with open(os.path.join(self.facet_dir, 'settings.yaml'), 'w') as fp:
+            fp.write(f'GITHUB_API_URL: "http://{self.stub.host}/graphql"\n'
+                     f'GITHUB_TOKEN: token\n'
+                     f'GITHUB_REPO_URL: "https://github.com/owner/repo"\n')
+        other = os.path.join(self.facet_dir, 'other')
+        subprocess.check_call(['git', 'init', '-q', other])
+        subprocess.check_call(['git', '-C', other, 'remote', 'add', 'origin',
+                               'git@github.com:owner/other.git'])
+        for name in ['merged', 'draft', 'open', 'none']:
+            self._create(name, branch=name)
+        self._create('other', branch='open', repo=other)
+
+    def _create(self, name, branch, repo=None):
+        super()._create(name)
+        config_file = os.path.join(self.facet_dir, 'facets', name,
+                                   'facet.yaml')
+        with open(config_file, 'a') as fp:
+            fp.write(f'branch: {branch}\nrepo: {repo or self.facet_dir}\n')
+
+    def test_fetch_queries_each_repo_once(self):
+        stderr = self._run(['fetch']).stderr.decode('utf-8')
+
+        self.assertEqual(self.stub.requests, ['/graphql'] * 2)
+        self.assertEqual(
+            sorted(sorted(query.values()) for query in self.stub.queries),
+            [['draft', 'merged', 'none', 'open', 'owner', 'repo'],
+             ['open', 'other', 'owner']])
+        self.assertEqual(stderr.splitlines()[-1],
+                         'pull requests: 5 ok, 0 unchanged, 0 failed, '
+                         '0 timed out')
+        with open(os.path.join(self.facet_dir, 'facets', 'other',
+                               'github.json')) as fp:
+            self.assertEqual(json.load(fp), {
+                'number': 4,
+                'url': 'https://github.com/owner/repo/pull/4',
+                'state': 'OPEN',
+                'is_draft': False,
+                'review_decision': None,
+                'ci_status': 'SUCCESS',
+                'merged': False,
+            })
+
+    def test_status_follows_pull_request(self):
+        self._run(['fetch'])
+        records = [json.loads(line) for line in self._run(
+            ['ls', '--format=jsonl']).stdout.decode('utf-8').splitlines()]
+        self.assertEqual(
+            {record['name']: record['status'] for record in records},
+            {'merged': 'done', 'draft': 'doing', 'open': 'under_review',
+             'none': 'todo', 'other': 'under_review'},
+        )
+
+        self.stub.pull_requests['owner/repo', 'open'] = make_pull_request(
+            3, state='MERGED', merged=True)
+        stderr = self._run(['fetch']).stderr.decode('utf-8')
+        self.assertEqual(stderr.splitlines()[-1],
+                         'pull requests: 1 ok, 4 unchanged, 0 failed, '
+                         '0 timed out')
+        self.assertIn('"status": "done"', self._run(
+            ['show', '--format=json', 'open']).stdout.decode('utf-8'))
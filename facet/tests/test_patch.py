@@ -0,0 +1,41 @@
+from unittest import TestCase
+
+from facet import patch
+from facet.patch import PatchError
+
+
+class TestPatch(TestCase):
+
+    def test_object_patch_adds_missing_keys_recursively(self):
+        config = {'name': 'a', 'status': 'doing', 'jira': {'host': 'x'}}
+        self.assertEqual(
+            patch.apply(config, {'status': 'todo',
+                                 'jira': {'host': 'y', 'project': 'P'}}),
+            {'name': 'a', 'status': 'doing',
+             'jira': {'host': 'x', 'project': 'P'}},
+        )
+        self.assertEqual(config['jira'], {'host': 'x'})
+
+    def test_json_patch(self):
+        config = {'name': 'a', 'tags': ['x'], 'old': 1}
+        self.assertEqual(
+            patch.apply(config, [
+                {'op': 'test', 'path': '/name', 'value': 'a'},
+                {'op': 'add', 'path': '/tags/-', 'value': 'y'},
+                {'op': 'move', 'from': '/old', 'path': '/new'},
+                {'op': 'replace', 'path': '/name', 'value': 'b'},
+                {'op': 'copy', 'from': '/tags', 'path': '/a~1b'},
+                {'op': 'remove', 'path': '/tags/0'},
+            ]),
+            {'name': 'b', 'tags': ['y'], 'new': 1, 'a/b': ['x', 'y']},
+        )
+
+    def test_json_patch_errors(self):
+        for operations in [
+                [{'op': 'remove', 'path': '/missing'}],
+                [{'op': 'test', 'path': '/name', 'value': 'b'}],
+                [{'op': 'frobnicate', 'path': '/name'}],
+                [{'op': 'add', 'path': 'name', 'value': 1}],
+        ]:
+            with self.assertRaises(PatchError, msg=operations):
+                patch.apply({'name': 'a'}, operations)
@@ -0,0 +1,127 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from facet import query
+from facet.index import Entry
+from facet.query import Clause
+from facet.query import QueryError
+
+
+class TestParse(TestCase):
+
+    def test_parse_where(self):
+        [[status, repo], [assignee]] = query.parse_where(
+            "status=doing and repo~web OR assignee='Jane Doe'")
+        self.assertEqual(status, Clause('status', '=', 'doing'))
+        self.assertEqual((repo.field, repo.op, repo.value.pattern),
+                         ('repo', '~', 'web'))
+        self.assertEqual(assignee, Clause('assignee', '=', 'Jane Doe'))
+        self.assertEqual(query.parse_where('fixVersion!=1.0'),
+                         [[Clause('fix_version', '!=', '1.0')]])
+
+    def test_parse_quoted_connectives(self):
+        [[summary, status], [assignee]] = query.parse_where(
+            'summary~"foo and bar" and status=doing or '
+            "assignee='Jane or John'")
+        self.assertEqual(summary.value.pattern, 'foo and bar')
+        self.assertEqual(status, Clause('status', '=', 'doing'))
+        self.assertEqual(assignee, Clause('assignee', '=', 'Jane or John'))
+
+    def test_parse_errors(self):
+        for expression in ['status', 'colour=red', 'repo~(']:
+            with self.assertRaises(QueryError):
+                query.parse_where(expression)
+        with self.assertRaises(QueryError):
+            query.parse_sort('name,colour')
+
+    def test_parse_sort(self):
+        self.assertEqual(query.parse_sort('-priority, name'),
+                         [('priority', True), ('name', False)])
+
+
+class TestSelect(TestCase):
+
+    def setUp(self):
+        self.entries = [
+            _entry(name='a', repo='website', priority='Minor',
+                   jira_status='In Progress', fix_versions='1.0, 2.0'),
+            _entry(name='b', repo='api', priority='Blocker',
+                   jira_status='In Progress'),
+            _entry(name='c', repo='website', priority='Major',
+                   jira_status='Done'),
+            _entry(name='d', repo='website', jira=None, status='doing'),
+            _entry(name='e', repo='website', follow=False),
+        ]
+        self.read = []
+
+        def get_entries(names, config_only=False):
+            entries = [entry for entry in self.entries if entry.name in names]
+            if config_only:
+                return [_config_only(entry) for entry in entries]
+            self.read.extend(entry.name for entry in entries if entry.jira)
+            return entries
+
+        patcher = patch('facet.query.index.get_entries', get_entries)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _select(self, where=None, sort=None, limit=None, **kwargs):
+        return [entry.name for entry in query.select(
+            [entry.name for entry in self.entries],
+            where and query.parse_where(where),
+            sort and query.parse_sort(sort),
+            limit,
+            **kwargs)]
+
+    def test_where(self):
+        self.assertEqual(self._select('status=doing'), ['a', 'b', 'd'])
+        self.assertEqual(self._select('status=doing and repo=website'),
+                         ['a', 'd'])
+        self.assertEqual(self._select('repo=api or fix_version=2.0'),
+                         ['a', 'b'])
+        self.assertEqual(self._select('repo~^web', include_inactive=True),
+                         ['a', 'c', 'd', 'e'])
+
+    def test_config_clauses_are_evaluated_before_reading_jira_data(self):
+        self.assertEqual(self._select('repo=api and status=doing'), ['b'])
+        self.assertEqual(self.read, ['b'])
+
+    def test_facet_without_jira_data(self):
+        self.entries.append(_entry(name='f', status='doing', jira_mtime=None,
+                                   summary=None))
+        self.assertEqual(self._select('status=doing'), ['a', 'b', 'd', 'f'])
+        self.assertEqual(self._select('jira_status=""'), ['d', 'f'])
+        self.assertEqual(self._select('status=doing', sort='-summary'),
+                         ['a', 'b', 'd', 'f'])
+
+    def test_sort(self):
+        self.assertEqual(self._select(sort='priority'), ['b', 'c', 'a', 'd'])
+        self.assertEqual(self._select(sort='-priority'), ['a', 'c', 'b', 'd'])
+        self.assertEqual(self._select(sort='repo,-name'), ['b', 'd', 'c', 'a'])
+        self.assertEqual(self._select(sort='status'), ['a', 'b', 'd', 'c'])
+
+    def test_limit(self):
+        self.assertEqual(self._select(sort='-name', limit=2), ['d', 'c'])
+        self.assertEqual(self.read, ['c'])
+        self.assertEqual(self._select('status=doing', limit=2), ['a', 'b'])
+
+
+def _entry(**kwargs):
+    fields = dict(name=None, mtime=0, config_mtime=0, jira_mtime=0,
+                  follow=True, status='todo', repo=None, branch=None,
+                  jira=None, summary='', jira_status=None, jira_ttl=None,
+                  assignee=None, priority=None, fix_versions=None,
+                  github_mtime=None, pr_status=None)
+    fields.update(kwargs)
+    if 'jira' not in kwargs:
+        fields['jira'] = fields['name'].upper() + '-1'
+    return Entry(**fields)
+
+
+def _config_only(entry):
+    if not entry.jira:
+        return entry
+    # As index.get_entries reads them: without jira.json, but with the pull
+    # request status from github.json.
+    return entry._replace(jira_mtime=None, summary=None, jira_status=None,
+                          assignee=None, priority=None, fix_versions=None)
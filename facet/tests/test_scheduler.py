@@ -0,0 +1,74 @@
+import asyncio
+import time
+from unittest import TestCase
+
+import aiohttp
+
+from facet.scheduler import Scheduler
+from facet.benchmarks.jira_stub import JiraStub
+from facet.benchmarks.jira_stub import make_issue
+
+
+class TestScheduler(TestCase):
+
+    def _start_stub(self, **kwargs):
+        stub = JiraStub([make_issue('ABC-1')], **kwargs)
+        stub.start()
+        self.addCleanup(stub.stop)
+        return stub
+
+    def _get(self, stub, n=1, **kwargs):
+        """
+        Make `n` requests through a Scheduler, and return the results and the
+        scheduler.
+        """
+        url = f'http://{stub.host}/rest/api/latest/issue/ABC-1'
+
+        async def get():
+            async with aiohttp.ClientSession() as session:
+                scheduler = Scheduler(session, backoff_base=0.01, **kwargs)
+                results = await asyncio.gather(
+                    *[scheduler.get_json(url) for _ in range(n)],
+                    return_exceptions=True,
+                )
+                return results, scheduler
+
+        event_loop = asyncio.new_event_loop()
+        try:
+            return event_loop.run_until_complete(get())
+        finally:
+            event_loop.close()
+
+    def test_retries_rate_limited_request_after_retry_after(self):
+        stub = self._start_stub(faults=[(429, {'Retry-After': '0.2'})])
+        start = time.time()
+        [response], scheduler = self._get(stub)
+        self.assertGreaterEqual(time.time() - start, 0.2)
+        self.assertEqual(response.json['key'], 'ABC-1')
+        self.assertEqual(scheduler.retries, 1)
+
+    def test_gives_up_after_max_retries(self):
+        stub = self._start_stub(faults=[(503, {})] * 3)
+        [error], scheduler = self._get(stub, max_retries=2)
+        self.assertIsInstance(error, aiohttp.ClientResponseError)
+        self.assertEqual(error.status, 503)
+        self.assertEqual(len(stub.requests), 3)
+
+    def test_does_not_retry_client_errors(self):
+        stub = self._start_stub(faults=[(400, {})])
+        [error], scheduler = self._get(stub)
+        self.assertEqual(error.status, 400)
+        self.assertEqual(scheduler.retries, 0)
+
+    def test_times_out_slow_requests(self):
+        stub = self._start_stub(latency=1)
+        [error], scheduler = self._get(stub, request_timeout=0.1,
+                                       max_retries=1)
+        self.assertIsInstance(error, asyncio.TimeoutError)
+        self.assertEqual(scheduler.retries, 1)
+
+    def test_limits_requests_in_flight(self):
+        stub = self._start_stub(latency=0.05)
+        results, _ = self._get(stub, n=10, max_in_flight=3)
+        self.assertEqual([r.json['key'] for r in results], ['ABC-1'] * 10)
+        self.assertEqual(stub.max_in_flight, 3)
@@ -0,0 +1,77 @@
+import json
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+from unittest import mock
+
+from facet import settings
+from facet import storage
+from facet.core import Facet
+
+
+class TestStorage(TestCase):
+
+    def setUp(self):
+        self.facet_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.facet_dir)
+        for name, value in [('FACET_DIR', self.facet_dir),
+                            ('FACETS_DIR', os.path.join(self.facet_dir,
+                                                        'facets'))]:
+            patcher = mock.patch.object(settings, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('facet.core.index')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_concurrent_state_updates_are_not_lost(self):
+        code = ('import sys; from facet import state\n'
+                'for i in range(20):\n'
+                '    state.write(**{f"{sys.argv[1]}-{i}": i})\n')
+        env = dict(os.environ, FACET_DIRECTORY=self.facet_dir)
+        processes = [
+            subprocess.Popen([sys.executable, '-c', code, str(n)], env=env)
+            for n in range(4)
+        ]
+        for process in processes:
+            self.assertEqual(process.wait(), 0)
+        with open(os.path.join(self.facet_dir, 'state.json')) as fp:
+            self.assertEqual(len(json.load(fp)), 80)
+
+    def test_write_config_keeps_directory_mtime(self):
+        facet = Facet(name='a-facet')
+        os.makedirs(facet.directory)
+        facet.write_config({'name': 'a-facet', 'follow': True})
+        os.utime(facet.directory, ns=(0, 10 ** 9))
+
+        facet.write_config(status='doing')
+
+        self.assertEqual(os.stat(facet.directory).st_mtime_ns, 10 ** 9)
+        self.assertEqual(os.listdir(facet.directory), ['facet.yaml'])
+        self.assertEqual(Facet(name='a-facet').read_config('status'), 'doing')
+
+    def test_update_json_writes_only_on_change(self):
+        file = os.path.join(self.facet_dir, 'data.json')
+        storage.update_json(file, lambda data: data.update(a=1))
+        mtime = os.stat(file).st_mtime_ns
+        os.utime(file, ns=(0, mtime - 10 ** 9))
+        storage.update_json(file, lambda data: data.update(a=1))
+        self.assertEqual(os.stat(file).st_mtime_ns, mtime - 10 ** 9)
+
+    def test_write_keeps_file_mode(self):
+        file = os.path.join(self.facet_dir, 'facet.yaml')
+        umask = os.umask(0o022)
+        try:
+            storage.write(file, 'a: 1\n')
+        finally:
+            os.umask(umask)
+        self.assertEqual(stat.S_IMODE(os.stat(file).st_mode), 0o644)
+        os.chmod(file, 0o640)
+        storage.write(file, 'a: 2\n')
+        self.assertEqual(stat.S_IMODE(os.stat(file).st_mode), 0o640)
+        storage.write(file, 'a: 3\n', mode=0o600)
+        self.assertEqual(stat.S_IMODE(os.stat(file).st_mode), 0o600)
@@ -0,0 +1,75 @@
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+from facet import trace
+from facet.core import Facet
+
+
+class TestTrace(TestCase):
+
+    def setUp(self):
+        self.facet_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.facet_dir)
+        for name in ['facet-1', 'facet-2']:
+            directory = os.path.join(self.facet_dir, 'facets', name)
+            os.makedirs(directory)
+            with open(os.path.join(directory, 'facet.yaml'), 'w') as fp:
+                fp.write(f'name: {name}\nfollow: true\nstatus: doing\n')
+        self.env = dict(os.environ, FACET_DIRECTORY=self.facet_dir)
+
+    def _run(self, args, env=None):
+        return subprocess.run(
+            [sys.executable, '-c',
+             'from facet.cli import main; main()'] + args,
+            env=dict(self.env, **(env or {})),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
+
+    def test_profile_summary(self):
+        stderr = self._run(['--profile=summary', 'ls']).stderr.decode('utf-8')
+        self.assertRegex(stderr, r'read_config +2 ')
+        self.assertIn('2 yaml parses', stderr)
+        self.assertRegex(stderr, r'facet-1 +\d+ +1 ')
+
+    def test_profile_summary_times_settings(self):
+        with open(os.path.join(self.facet_dir, 'settings.yaml'), 'w') as fp:
+            fp.write('JIRA_URL: https://jira.example.com\n')
+        stderr = self._run(['--profile=summary', 'ls']).stderr.decode('utf-8')
+        self.assertRegex(stderr, r'settings +1 ')
+
+    def test_summary_columns_are_aligned(self):
+        tracer = trace._Tracer('summary', None)
+        tracer.facet_counts['a-facet']['subprocesses'] = 1234567890
+        tracer.facet_counts['a-facet-with-a-long-name']['file opens'] = 1
+        output = io.StringIO()
+        tracer.print_summary(output)
+        table = output.getvalue().split('\n\n')[-1].splitlines()
+        self.assertEqual(len(table), 3)
+        self.assertEqual(len({len(line) for line in table}), 1)
+        # The right edges of the header and value are aligned.
+        self.assertEqual(table[0].index('subprocesses') + 12,
+                         table[1].index('1234567890') + 10)
+
+    def test_facet_trace_writes_chrome_trace(self):
+        trace_file = os.path.join(self.facet_dir, 'trace.json')
+        output = self._run(['ls'], env={'FACET_TRACE': f'chrome:{trace_file}'})
+        self.assertEqual(output.stderr, b'')
+        with open(trace_file) as fp:
+            events = json.load(fp)['traceEvents']
+        self.assertIn('startup', {event['name'] for event in events})
+        self.assertEqual(
+            {event['args']['facet'] for event in events
+             if event['name'] == 'read_config'},
+            {'facet-1', 'facet-2'},
+        )
+
+    def test_nothing_is_instrumented_when_disabled(self):
+        self.assertEqual(Facet.read_config.__qualname__, 'Facet.read_config')
@@ -0,0 +1,238 @@
+"""
+Profiling and tracing of facet commands.
+
+Tracing is enabled with the global --profile option, or the FACET_TRACE
+environment variable, set to one of
+
+  summary          print phase timings and counts, overall and per facet, to
+                   stderr
+  cprofile:FILE    write cProfile statistics to FILE
+  chrome:FILE      write a Chrome trace (chrome://tracing, Perfetto) to FILE
+
+Phases are the time from importing facet to starting the command (imports
+and argument parsing), reading settings, index lookups, and calls to the
+Facet methods in PHASES. Counts are of file opens, YAML and JSON parses,
+subprocesses and HTTP requests, attributed to the facet whose method was
+running.
+
+Nothing is instrumented unless tracing is enabled: `enable` wraps the
+functions concerned and installs an audit hook.
+"""
+import atexit
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from collections import defaultdict
+
+import facet
+
+
+# Facet methods timed as phases
+PHASES = [
+    'read_config',
+    'read_jira_issue',
+    'fetch',
+    'format',
+    'style',
+    'to_dict',
+]
+
+# Audit events counted, by the name they are counted under
+_AUDIT_EVENTS = {
+    'open': 'file opens',
+    'subprocess.Popen': 'subprocesses',
+    'os.exec': 'subprocesses',
+    'os.posix_spawn': 'subprocesses',
+}
+
+_COUNTS = ['file opens', 'yaml parses', 'json parses', 'subprocesses',
+           'http requests']
+
+_tracer = None
+
+
+def enable(mode):
+    """
+    Start tracing this process, reporting according to `mode` at exit.
+    """
+    global _tracer
+    if _tracer is not None:
+        return
+    report, _, file = mode.partition(':')
+    if report not in {'summary', 'cprofile', 'chrome'} or (
+            report != 'summary' and not file):
+        from facet.utils import error
+        error(f'Invalid trace mode: {mode} '
+              f'(expected summary, cprofile:FILE or chrome:FILE)')
+    _tracer = _Tracer(report, file)
+    _tracer.start()
+    atexit.register(_tracer.finish)
+
+
+def aiohttp_trace_configs():
+    """
+    Return trace_configs for an aiohttp.ClientSession, counting its requests
+    when tracing is enabled.
+    """
+    if _tracer is None:
+        return []
+    import aiohttp
+
+    async def on_request_start(session, context, params):
+        _tracer.count('http requests')
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    return [trace_config]
+
+
+class _Tracer:
+
+    def __init__(self, report, file):
+        self.report = report
+        self.file = file
+        self.start_time = time.perf_counter()
+        # The facet whose method each thread is running
+        self._local = threading.local()
+        # phase: [calls, seconds]
+        self.phases = defaultdict(lambda: [0, 0.0])
+        self.counts = Counter()
+        self.facet_counts = defaultdict(Counter)
+        self.facet_times = Counter()
+        self.events = []
+        self.profile = None
+
+    @property
+    def facet(self):
+        return getattr(self._local, 'facet', None)
+
+    @facet.setter
+    def facet(self, name):
+        self._local.facet = name
+
+    def start(self):
+        from facet import core
+        from facet import index
+        from facet import settings
+        from facet import utils
+
+        self.add_phase('startup', None, facet.start_time, self.start_time)
+        if self.report == 'cprofile':
+            import cProfile
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+        settings._read_local_settings = self.timed(
+            'settings', settings._read_local_settings)
+        for name in ['get_entry', 'get_entries', 'update']:
+            setattr(index, name, self.timed('index', getattr(index, name)))
+        for name in PHASES:
+            setattr(core.Facet, name,
+                    self.timed(name, getattr(core.Facet, name), method=True))
+
+        # Modules that imported load_yaml by name hold their own reference.
+        load_yaml = utils.load_yaml
+        counted_load_yaml = self.counted('yaml parses', load_yaml)
+        for module in list(sys.modules.values()):
+            if (getattr(module, '__name__', '').startswith('facet') and
+                    getattr(module, 'load_yaml', None) is load_yaml):
+                module.load_yaml = counted_load_yaml
+        json.loads = self.counted('json parses', json.loads)
+
+        sys.addaudithook(self.audit)
+
+    def timed(self, phase, func, method=False):
+        def wrapper(*args, **kwargs):
+            outer_facet = self.facet
+            if method:
+                self.facet = args[0].name
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                end = time.perf_counter()
+                self.add_phase(phase, self.facet, start, end)
+                if self.facet is not None and self.facet != outer_facet:
+                    self.facet_times[self.facet] += end - start
+                self.facet = outer_facet
+        return wrapper
+
+    def counted(self, name, func):
+        def wrapper(*args, **kwargs):
+            self.count(name)
+            return func(*args, **kwargs)
+        return wrapper
+
+    def count(self, name):
+        self.counts[name] += 1
+        if self.facet is not None:
+            self.facet_counts[self.facet][name] += 1
+
+    def audit(self, event, args):
+        name = _AUDIT_EVENTS.get(event)
+        if name is not None and self is _tracer:
+            self.count(name)
+
+    def add_phase(self, phase, facet_name, start, end):
+        self.phases[phase][0] += 1
+        self.phases[phase][1] += end - start
+        if self.report == 'chrome':
+            self.events.append((phase, facet_name, start, end))
+
+    def finish(self):
+        global _tracer
+        _tracer = None
+        self.add_phase('total', None, facet.start_time, time.perf_counter())
+        if self.report == 'summary':
+            self.print_summary(sys.stderr)
+        elif self.report == 'cprofile':
+            self.profile.disable()
+            self.profile.dump_stats(self.file)
+        else:
+            self.write_chrome_trace()
+
+    def print_summary(self, file):
+        print(f'{"phase":20s} {"calls":>8s} {"ms":>10s}', file=file)
+        for phase, (calls, seconds) in self.phases.items():
+            print(f'{phase:20s} {calls:8d} {seconds * 1000:10.1f}', file=file)
+        print(file=file)
+        print(', '.join(f'{self.counts[name]} {name}' for name in _COUNTS),
+              file=file)
+        if not self.facet_counts and not self.facet_times:
+            return
+        print(file=file)
+        names = sorted(self.facet_times.keys() | self.facet_counts.keys())
+        rows = [
+            [name] + [str(self.facet_counts[name][count]) for count in _COUNTS]
+            + [f'{self.facet_times[name] * 1000:.1f}']
+            for name in names
+        ]
+        header = ['facet'] + [count.split()[0] for count in _COUNTS] + ['ms']
+        widths = [max(len(row[i]) for row in rows + [header])
+                  for i in range(len(header))]
+        widths[0] = max(widths[0], 20)
+        for row in [header] + rows:
+            print(' '.join([row[0].ljust(widths[0])] +
+                           [value.rjust(width)
+                            for value, width in zip(row[1:], widths[1:])]),
+                  file=file)
+
+    def write_chrome_trace(self):
+        events = [
+            {
+                'name': phase,
+                'cat': 'facet',
+                'ph': 'X',
+                'ts': (start - facet.start_time) * 1e6,
+                'dur': (end - start) * 1e6,
+                'pid': 1,
+                'tid': 1,
+                'args': {'facet': facet_name} if facet_name else {},
+            }
+            for phase, facet_name, start, end in self.events
+        ]
+        with open(self.file, 'w') as fp:
+            json.dump({'traceEvents': events,
+                       'otherData': dict(self.counts)}, fp)
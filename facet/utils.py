@@ -3,10 +3,8 @@ import json
 import os
 import sys
 
-import yaml
-from clint.textui.colored import colorama
-
 from facet import settings
+from facet.cache import Cache
 
 
 def os_exec(args):
@@ -23,11 +21,73 @@ def warning(msg):
 
 
 def dump_json(obj, fp):
-    json.dump(obj, fp, indent=2, sort_keys=True)
+    fp.write(format_json(obj))
+
+
+def format_json(obj):
+    return json.dumps(obj, indent=2, sort_keys=True)
+
+
+def format_tsv(values):
+    """
+    Return `values` as a line of tab-separated fields.
+
+    None is written as an empty field, booleans as true/false, and tabs and
+    newlines within values as spaces.
+    """
+    def _format(value):
+        if value is None:
+            return ''
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        return str(value).replace('\t', ' ').replace('\n', ' ')
+
+    return '\t'.join(map(_format, values))
+
+
+def write_lines(lines, file=None, buffer_size=65536):
+    """
+    Write `lines` to `file`, each followed by a newline, in writes of about
+    `buffer_size` characters.
+    """
+    if file is None:
+        file = sys.stdout
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line) + 1
+        if size >= buffer_size:
+            file.write('\n'.join(buffer) + '\n')
+            file.flush()
+            buffer = []
+            size = 0
+    if buffer:
+        file.write('\n'.join(buffer) + '\n')
+    file.flush()
+
+
+def load_yaml(fp):
+    import yaml
+
+    # The C loader and dumper exist only if PyYAML was built with libyaml.
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    return yaml.load(fp, Loader=loader)
+
+
+def format_yaml(obj):
+    import io
+
+    text = io.StringIO()
+    dump_yaml(obj, text)
+    return text.getvalue()
 
 
 def dump_yaml(obj, fp):
-    yaml.dump(obj, fp, indent=2, default_flow_style=False)
+    import yaml
+
+    dumper = getattr(yaml, 'CDumper', yaml.Dumper)
+    yaml.dump(obj, fp, Dumper=dumper, indent=2, default_flow_style=False)
 
 
 def prompt_for_user_input(prompt, default=None):
@@ -49,28 +109,42 @@ def delete_prompt_commands_file():
         os.remove(prompt_commands_file)
 
 
-class memoized:
-
-    def __init__(self, fn):
-        self.fn = fn
-        self.cache = {}
+class AuthError(Exception):
+    pass
 
-    def __call__(self, *args, **kwargs):
-        key = self.make_key(*args, **kwargs)
-        if key not in self.cache:
-            self.cache[key] = self.fn(*args, **kwargs)
-        return self.cache[key]
 
-    @staticmethod
-    def make_key(*args, **kwargs):
-        return json.dumps([args, kwargs], sort_keys=True)
+# Credentials, keyed by the mtime and size of JIRA_AUTH_FILE, so that those
+# prompted for are not asked for again by the process. They are never stored
+# on disk.
+_auth_cache = Cache(maxsize=1)
 
 
-@memoized
 def get_auth():
+    """
+    Return JIRA credentials from JIRA_AUTH_FILE, prompting for any that are
+    missing.
+    """
+    try:
+        stat = os.stat(settings.JIRA_AUTH_FILE)
+    except FileNotFoundError:
+        key = None
+    else:
+        key = (stat.st_mtime_ns, stat.st_size)
+    auth = _auth_cache.get(key)
+    if auth is None:
+        from facet import daemon
+
+        if daemon.serving:
+            raise daemon.HandBack()
+        auth = _read_auth()
+        _auth_cache.set(key, auth)
+    return auth
+
+
+def _read_auth():
     try:
         with open(settings.JIRA_AUTH_FILE) as fp:
-            auth = yaml.load(fp)
+            auth = load_yaml(fp)
     except FileNotFoundError:
         print("Auth credentials can be stored in {file}. "
               "Keys are 'username' and 'password'. Both optional.".format(
@@ -80,8 +154,13 @@ def get_auth():
     assert not auth.keys() - {'username', 'password'}, \
         "auth.yaml keys should be 'username' and 'password' (both optional)"
 
+    if auth.keys() != {'username', 'password'} and \
+            os.environ.get('FACET_NO_PROMPT'):
+        raise AuthError(f'JIRA credentials are missing from '
+                        f'{settings.JIRA_AUTH_FILE}, and FACET_NO_PROMPT '
+                        f'is set')
     if 'username' not in auth:
-        auth['username'] = input("JIRA username: "),
+        auth['username'] = input("JIRA username: ")
     if 'password' not in auth:
         auth['password'] = getpass.getpass("JIRA password: ")
 
@@ -90,6 +169,8 @@ def get_auth():
 
 def default_color(s, always=False, bold=False):
     if bold and (always or sys.stdout.isatty()):
+        from clint.textui.colored import colorama
+
         return '{on}{string}{off}'.format(
             on=getattr(colorama.Style, 'BRIGHT'),
             string=s,
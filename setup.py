@@ -19,6 +19,7 @@ setup(
     entry_points={
         'console_scripts': [
             'facet = facet.cli:main',
+            'facetd = facet.daemon:main',
         ],
     },
     install_requires=[